@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import threading
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Any, TypeVar
+
+from clients import get_client_registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Done:
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class AppLoop:
+    """One event loop in a background thread, that runs the async work of every event handler.
+
+    Mesop runs each async handler on a new event loop of the request thread, while the pooled
+    clients and the locks, timers and tasks of the kernel belong to the loop they first ran on.
+    `stream` runs an async iterable on this loop and hands its items to the handler's loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="app-loop", daemon=True
+        )
+        self._thread.start()
+
+    async def stream(self, iterable: AsyncIterable[T]) -> AsyncIterator[T]:
+        """Iterates `iterable` on the app loop, as a single task, from a handler on any loop."""
+        handler_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[Any] = asyncio.Queue()
+
+        def put(item: Any) -> None:
+            # the handler loop only runs while Mesop waits for the next update
+            try:
+                handler_loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                logger.debug("The handler loop is closed, dropping the stream")
+
+        async def pump() -> None:
+            error = None
+            try:
+                async for item in iterable:
+                    put(item)
+            except Exception as exc:
+                error = exc
+            finally:
+                put(_Done(error))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while not isinstance(item := await queue.get(), _Done):
+                yield item
+            if item.error is not None:
+                raise item.error
+        finally:
+            # stops the stream when the handler is closed before the end
+            future.cancel()
+
+
+_app_loop: AppLoop | None = None
+_lock = threading.Lock()
+
+
+def get_app_loop() -> AppLoop:
+    """Returns the process wide app loop, the shared clients outside of a loop are its clients."""
+    global _app_loop
+    with _lock:
+        if _app_loop is None:
+            _app_loop = AppLoop()
+            get_client_registry().loop = _app_loop.loop
+    return _app_loop
@@ -1,76 +1,294 @@
 import json
 import os
 from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import (
-    OpenAIChatCompletion,
-    OpenAITextEmbedding,
+from semantic_kernel.connectors.ai.chat_completion_client_base import (
+    ChatCompletionClientBase,
 )
-from semantic_kernel.connectors.ai.ollama import (
-    OllamaChatCompletion,
-    OllamaTextEmbedding,
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
+    EmbeddingGeneratorBase,
 )
+from semantic_kernel.data.vector_search.vector_search import VectorSearchBase
 from semantic_kernel.functions import KernelParameterMetadata
-from semantic_kernel.filters.filter_types import FilterTypes
-from semantic_kernel.filters.auto_function_invocation.auto_function_invocation_context import (
-    AutoFunctionInvocationContext,
-)
-from semantic_kernel.connectors.memory.azure_ai_search import AzureAISearchCollection
-from semantic_kernel.connectors.memory.qdrant import QdrantCollection
 from semantic_kernel.data import (
-    VectorStoreTextSearch,
     VectorSearchOptions,
     VectorSearchFilter,
 )
-from data_ingestion.datamodel import SKDataModel, SKQdrantDataModel
+from data_ingestion.bm25_index import LazyBM25Index
+from clients import get_client_registry
+from data_ingestion.datamodel import (
+    EMBEDDING_DIMENSIONS,
+    OLLAMA_EMBEDDING_DIMENSIONS,
+    SKDataModel,
+    SKQdrantDataModel,
+)
+from numpy_collection import NumpyVectorCollection
+from hybrid_search import HybridTextSearch, load_keyword_index
 from online_state_service_selector import OnlineStateServiceSelector
+from circuit_breaker import CircuitBreaker
+from embedding_cache import CachedTextEmbedding, get_embedding_cache
+from search_cache import get_search_cache
+from startup import (
+    LazyChatCompletion,
+    LazyFactory,
+    LazyTextEmbedding,
+    LazyVectorizedSearch,
+    get_startup_timings,
+)
+from telemetry import TracedChatCompletion, TracedTextEmbedding, get_telemetry
+from truncated_embedding import TruncatedTextEmbedding
 import logging
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+PLUGINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plugins")
+
+
+# The connectors are imported in the factories, importing them takes seconds and only
+# the services of the active mode are needed to answer the first question. The clients
+# come from the shared registry, so the chat and embedding services share connections.
+def _openai_chat(service_id: str) -> ChatCompletionClientBase:
+    from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
+
+    return OpenAIChatCompletion(
+        service_id=service_id, async_client=get_client_registry().openai()
+    )
+
+
+def _openai_embedding(service_id: str) -> EmbeddingGeneratorBase:
+    from semantic_kernel.connectors.ai.open_ai import OpenAITextEmbedding
+
+    return OpenAITextEmbedding(
+        service_id=service_id, async_client=get_client_registry().openai()
+    )
+
+
+def _ollama_chat(service_id: str) -> ChatCompletionClientBase:
+    from semantic_kernel.connectors.ai.ollama import OllamaChatCompletion
+
+    return OllamaChatCompletion(
+        service_id=service_id,
+        ai_model_id=os.getenv("OLLAMA_MODEL"),
+        client=get_client_registry().ollama(),
+    )
+
+
+def _ollama_embedding(service_id: str) -> EmbeddingGeneratorBase:
+    from semantic_kernel.connectors.ai.ollama import OllamaTextEmbedding
+
+    return OllamaTextEmbedding(
+        service_id=service_id,
+        ai_model_id=os.getenv("OLLAMA_EMBEDDING_MODEL"),
+        client=get_client_registry().ollama(),
+    )
+
+
+def _azure_ai_search_collection() -> VectorSearchBase:
+    from semantic_kernel.connectors.memory.azure_ai_search import (
+        AzureAISearchCollection,
+    )
+
+    clients = get_client_registry()
+    return AzureAISearchCollection(
+        data_model_type=SKDataModel,
+        search_client=clients.azure_search(),
+        search_index_client=clients.azure_search_index(),
+    )
+
+
+def _qdrant_collection() -> VectorSearchBase:
+    if os.getenv("OFFLINE_SEARCH_BACKEND", "qdrant").lower() == "numpy":
+        return NumpyVectorCollection(
+            data_model_type=SKQdrantDataModel,
+            path=os.getenv("NUMPY_INDEX_PATH", os.path.join(DATA_PATH, "index")),
+            collection_name="sk",
+            oversampling=float(os.getenv("VECTOR_OVERSAMPLING", "4.0")),
+        )
+    from semantic_kernel.connectors.memory.qdrant import QdrantCollection
+
+    return QdrantCollection(
+        data_model_type=SKQdrantDataModel,
+        collection_name="sk",
+        named_vectors=False,
+        client=get_client_registry().qdrant(),
+    )
+
+
+def _qdrant_endpoint() -> str | None:
+    if os.getenv("OFFLINE_SEARCH_BACKEND", "qdrant").lower() == "numpy":
+        return None
+    if url := os.getenv("QDRANT_URL"):
+        return url
+    return f"{os.getenv('QDRANT_HOST', 'localhost')}:{os.getenv('QDRANT_PORT', '6333')}"
+
+
+def get_kernel(
+    chat_services: dict[str, ChatCompletionClientBase] | None = None,
+    embedders: dict[str, EmbeddingGeneratorBase] | None = None,
+    collections: dict[str, VectorSearchBase] | None = None,
+    keyword_indexes: dict[str, LazyBM25Index | None] | None = None,
+):
+    """Creates the kernel with the online and offline services and search functions.
 
-def get_kernel():
+    The chat services, embedders, vector collections and keyword indexes can be passed in
+    per service id (`online`, `offline`), the ones that are left out are created from the
+    environment. The benchmarks use this to run the app without any network.
+    The services and collections from the environment are only created when they are
+    first used, or by the warm-up in `startup.start_warm_up`.
+    """
     load_dotenv()
+    chat_services = chat_services or {}
+    embedders = embedders or {}
+    collections = collections or {}
+    timings = get_startup_timings()
 
     remote_service_id = "online"
     local_service_id = "offline"
-    kernel = Kernel(ai_service_selector=OnlineStateServiceSelector())
-    kernel.add_service(OpenAIChatCompletion(service_id=remote_service_id))
-    online_embedder = OpenAITextEmbedding(service_id=f"{remote_service_id}-embedding")
-    kernel.add_service(online_embedder)
+    ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    breaker = CircuitBreaker(
+        failure_threshold=int(os.getenv("FAILOVER_BREAKER_THRESHOLD", "3")),
+        reset_timeout=float(os.getenv("FAILOVER_BREAKER_RESET", "30.0")),
+    )
+    with timings.measure("kernel"):
+        kernel = Kernel(ai_service_selector=OnlineStateServiceSelector(breaker=breaker))
+    # every model and embedding call gets a span, the cache sits in front of it
+    telemetry = get_telemetry()
     kernel.add_service(
-        OllamaChatCompletion(
-            service_id=local_service_id, ai_model_id=os.getenv("OLLAMA_MODEL")
+        TracedChatCompletion(
+            chat_services.get(remote_service_id)
+            or LazyChatCompletion(
+                service_id=remote_service_id,
+                ai_model_id=os.getenv("OPENAI_CHAT_MODEL_ID") or remote_service_id,
+                lazy=LazyFactory(
+                    f"{remote_service_id} chat service",
+                    lambda: _openai_chat(remote_service_id),
+                    group=remote_service_id,
+                    endpoint="https://api.openai.com",
+                ),
+            ),
+            telemetry,
         )
     )
-    offline_embedder = OllamaTextEmbedding(
-        service_id=f"{local_service_id}-embedding",
-        ai_model_id=os.getenv("OLLAMA_EMBEDDING_MODEL"),
+    embedding_cache = get_embedding_cache()
+    online_embedding_id = f"{remote_service_id}-embedding"
+    # the query vectors get the size of the index, OpenAI shortens them itself
+    online_embedder = TracedTextEmbedding(
+        embedders.get(remote_service_id)
+        or TruncatedTextEmbedding(
+            LazyTextEmbedding(
+                service_id=online_embedding_id,
+                ai_model_id=os.getenv("OPENAI_EMBEDDING_MODEL_ID")
+                or online_embedding_id,
+                lazy=LazyFactory(
+                    f"{remote_service_id} embedding service",
+                    lambda: _openai_embedding(online_embedding_id),
+                    group=remote_service_id,
+                    endpoint="https://api.openai.com",
+                ),
+            ),
+            EMBEDDING_DIMENSIONS,
+            native=True,
+        ),
+        telemetry,
+    )
+    if embedding_cache:
+        online_embedder = CachedTextEmbedding(
+            online_embedder, embedding_cache, dimensions=EMBEDDING_DIMENSIONS
+        )
+    kernel.add_service(online_embedder)
+    kernel.add_service(
+        TracedChatCompletion(
+            chat_services.get(local_service_id)
+            or LazyChatCompletion(
+                service_id=local_service_id,
+                ai_model_id=os.getenv("OLLAMA_MODEL") or local_service_id,
+                lazy=LazyFactory(
+                    f"{local_service_id} chat service",
+                    lambda: _ollama_chat(local_service_id),
+                    group=local_service_id,
+                    endpoint=ollama_host,
+                ),
+            ),
+            telemetry,
+        )
     )
+    offline_embedding_id = f"{local_service_id}-embedding"
+    offline_embedder = embedders.get(local_service_id)
+    if offline_embedder is None:
+        offline_embedder = LazyTextEmbedding(
+            service_id=offline_embedding_id,
+            ai_model_id=os.getenv("OLLAMA_EMBEDDING_MODEL") or offline_embedding_id,
+            lazy=LazyFactory(
+                f"{local_service_id} embedding service",
+                lambda: _ollama_embedding(offline_embedding_id),
+                group=local_service_id,
+                endpoint=ollama_host,
+            ),
+        )
+        if OLLAMA_EMBEDDING_DIMENSIONS:
+            offline_embedder = TruncatedTextEmbedding(
+                offline_embedder, OLLAMA_EMBEDDING_DIMENSIONS
+            )
+    offline_embedder = TracedTextEmbedding(offline_embedder, telemetry)
+    if embedding_cache:
+        offline_embedder = CachedTextEmbedding(
+            offline_embedder, embedding_cache, dimensions=OLLAMA_EMBEDDING_DIMENSIONS
+        )
     kernel.add_service(offline_embedder)
 
-    kernel.add_plugin(
-        plugin_name="chat",
-        parent_directory="""C:\Work\sk-demo-cloudbrew\plugins""",
-    )
+    with timings.measure("chat plugin"):
+        kernel.add_plugin(
+            plugin_name="chat",
+            parent_directory=PLUGINS_PATH,
+        )
 
-    azure_ai = AzureAISearchCollection(data_model_type=SKDataModel)
-    qdrant = QdrantCollection(
-        data_model_type=SKQdrantDataModel, collection_name="sk", named_vectors=False
+    azure_ai = collections.get(remote_service_id) or LazyVectorizedSearch(
+        LazyFactory(
+            "Azure AI Search collection",
+            _azure_ai_search_collection,
+            group=remote_service_id,
+            endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+        )
+    )
+    qdrant = collections.get(local_service_id) or LazyVectorizedSearch(
+        LazyFactory(
+            "offline collection",
+            _qdrant_collection,
+            group=local_service_id,
+            endpoint=_qdrant_endpoint(),
+        )
     )
 
-    azure_ai_search = VectorStoreTextSearch.from_vectorized_search(
+    azure_keyword_index = qdrant_keyword_index = None
+    if keyword_indexes is not None:
+        azure_keyword_index = keyword_indexes.get(remote_service_id)
+        qdrant_keyword_index = keyword_indexes.get(local_service_id)
+    elif os.getenv("SEARCH_MODE", "hybrid").lower() == "hybrid":
+        keyword_path = os.getenv("BM25_INDEX_PATH", os.path.join(DATA_PATH, "bm25"))
+        azure_keyword_index = load_keyword_index(
+            os.path.join(keyword_path, "azure.json.gz")
+        )
+        qdrant_keyword_index = load_keyword_index(
+            os.path.join(keyword_path, "qdrant.json.gz")
+        )
+
+    azure_ai_search = HybridTextSearch.from_vectorized_search(
         azure_ai,
         online_embedder,
         string_mapper=lambda x: x.chunk,
+        keyword_index=azure_keyword_index,
     )
 
     def qdrant_node_content_mapper(node):
         content = json.loads(node.node_content)
         return content.get("text", "")
 
-    qdrant_search = VectorStoreTextSearch.from_vectorized_search(
-        qdrant, offline_embedder, string_mapper=qdrant_node_content_mapper
+    qdrant_search = HybridTextSearch.from_vectorized_search(
+        qdrant,
+        offline_embedder,
+        string_mapper=qdrant_node_content_mapper,
+        keyword_index=qdrant_keyword_index,
     )
 
     kernel.add_functions(
@@ -118,21 +336,18 @@ def get_kernel():
         ],
     )
 
-    @kernel.filter(FilterTypes.AUTO_FUNCTION_INVOCATION)
-    async def auto_function_invocation_filter(
-        context: AutoFunctionInvocationContext, next
-    ):
-        """A filter that will be called for each function call in the response."""
-        print("\nAuto function invocation filter")
-        print(f"Function: {context.function.name}")
-        print(f"Calling function: {context.function.name}")
-        print(f"   with arguments: {context.arguments}")
-        await next(context)
-        print(f"Function: {context.function.name} completed")
-        print(f"    with results: {str(context.function_result)[:500]}")
+    if search_cache := get_search_cache():
+        search_cache.register_topic("online_search", "code_sample_search", "samples")
+        search_cache.register_topic("online_search", "code_search", "semantic_kernel")
+        search_cache.register_topic("offline_search", "code_sample_search", "samples")
+        search_cache.register(kernel)
+
+    telemetry.register(kernel)
 
     return kernel
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     kernel = get_kernel()
+    logger.info(get_startup_timings().report())
@@ -0,0 +1,341 @@
+"""Replays a set of prompts through the chat hot path with local stand-ins for all services.
+
+The kernel comes from `backend.get_kernel`, with fake OpenAI and Ollama chat and embedding
+services and in-memory vector collections instead of Azure AI Search and Qdrant, so it runs
+without any network. Run it from the root of the repository:
+
+    python -m benchmarks.chat_latency --repeat 5 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import contextvars
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PROMPTS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "prompts.txt"
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TurnStats:
+    prompt: str
+    service_id: str = ""
+    ttft: float | None = None
+    total: float = 0.0
+    tokens: int = 0
+    retrieval: list[float] = field(default_factory=list)
+    selector: float = 0.0
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        if self.ttft is None or self.tokens < 2 or self.total <= self.ttft:
+            return None
+        return (self.tokens - 1) / (self.total - self.ttft)
+
+
+_turn: contextvars.ContextVar[TurnStats] = contextvars.ContextVar("turn")
+
+
+def load_corpus(chunk_lines: int = 40) -> list[tuple[str, str, str]]:
+    """Chunks of the python files in this repository as (id, text, topic), a stable local corpus."""
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "**", "*.py"), recursive=True)):
+        relative = os.path.relpath(path, ROOT).replace(os.sep, "/")
+        if relative.startswith((".venv/", "venv/")):
+            continue
+        with open(path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        for start in range(0, len(lines), chunk_lines):
+            text = "\n".join(lines[start : start + chunk_lines]).strip()
+            if text:
+                topic = "samples" if len(chunks) % 2 == 0 else "semantic_kernel"
+                chunks.append((f"{relative}:{start}", text, topic))
+    return chunks
+
+
+async def build_collections(chunks, embedders, path: str, hybrid: bool):
+    """Numpy collections and keyword indexes of the corpus in `path`, searched in process."""
+    from data_ingestion.bm25_index import BM25Index
+    from data_ingestion.datamodel import SKDataModel, SKQdrantDataModel
+    from hybrid_search import load_keyword_index
+    from numpy_collection import NumpyVectorCollection
+
+    texts = [text for _, text, _ in chunks]
+    online_vectors = await embedders["online"].generate_embeddings(texts)
+    offline_vectors = await embedders["offline"].generate_embeddings(texts)
+    online = NumpyVectorCollection(
+        data_model_type=SKDataModel, path=path, collection_name="online"
+    )
+    offline = NumpyVectorCollection(
+        data_model_type=SKQdrantDataModel, path=path, collection_name="offline"
+    )
+    ids = [id for id, _, _ in chunks]
+    # the payloads as the ingestion writes them to Azure AI Search and Qdrant
+    online.index.upsert(
+        ids,
+        online_vectors,
+        [
+            {"chunk": text, "metadata": "{}", "doc_id": id, "topic": topic}
+            for id, text, topic in chunks
+        ],
+    )
+    offline.index.upsert(
+        ids,
+        offline_vectors,
+        [
+            {"_node_content": json.dumps({"text": text}), "doc_id": id, "topic": topic}
+            for id, text, topic in chunks
+        ],
+    )
+    keyword_indexes = {}
+    if hybrid:
+        index = BM25Index.build(
+            (id, text, {"topic": topic}, id) for id, text, topic in chunks
+        )
+        for service_id in ("online", "offline"):
+            keyword_path = os.path.join(path, f"{service_id}.json.gz")
+            index.save(keyword_path)
+            keyword_indexes[service_id] = load_keyword_index(keyword_path)
+    return {"online": online, "offline": offline}, keyword_indexes
+
+
+def instrument(kernel) -> None:
+    """Times the search functions and the service selection of every turn."""
+    from semantic_kernel.filters.filter_types import FilterTypes
+
+    @kernel.filter(FilterTypes.FUNCTION_INVOCATION)
+    async def retrieval_timer(context, next):
+        if not context.function.plugin_name.endswith("_search"):
+            await next(context)
+            return
+        start = time.perf_counter()
+        try:
+            await next(context)
+        finally:
+            if (turn := _turn.get(None)) is not None:
+                turn.retrieval.append(time.perf_counter() - start)
+
+    selector = kernel.ai_service_selector
+    for name in ("select_ai_service", "preferred_service_id"):
+        original = getattr(selector, name)
+
+        def timed(*args, original=original, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                if (turn := _turn.get(None)) is not None:
+                    turn.selector += time.perf_counter() - start
+
+        setattr(selector, name, timed)
+
+
+async def run_turn(kernel, failover, reducer, prompt: str) -> TurnStats:
+    """The same calls as `main.call_api` makes for the first question of a session."""
+    from semantic_kernel.contents import ChatHistory
+
+    from failover import FAILOVER
+    from telemetry import get_telemetry
+
+    turn = TurnStats(prompt=prompt)
+    _turn.set(turn)
+    start = time.perf_counter()
+    with get_telemetry().span("chat.turn"):
+        turn.service_id = kernel.ai_service_selector.preferred_service_id()
+        if failover:
+            stream = failover.invoke_stream(
+                chat_history=ChatHistory(), user_input=prompt
+            )
+        else:
+            stream = kernel.invoke_stream(
+                function_name="chat",
+                plugin_name="chat",
+                chat_history=await reducer.reduce(ChatHistory(), turn.service_id),
+                user_input=prompt,
+            )
+        async for response in stream:
+            if response is FAILOVER:
+                turn.ttft, turn.tokens = None, 0
+                continue
+            if response[0].content:
+                if turn.ttft is None:
+                    turn.ttft = time.perf_counter() - start
+                turn.tokens += 1
+    turn.total = time.perf_counter() - start
+    return turn
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": float(np.mean(values)),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+    }
+
+
+def summarize(turns: list[TurnStats], elapsed: float) -> dict:
+    return {
+        "turns": len(turns),
+        "elapsed": elapsed,
+        "ttft": percentiles([t.ttft for t in turns if t.ttft is not None]),
+        "total": percentiles([t.total for t in turns]),
+        "tokens_per_second": percentiles(
+            [t.tokens_per_second for t in turns if t.tokens_per_second is not None]
+        ),
+        "retrieval": percentiles([value for t in turns for value in t.retrieval]),
+        "selector": percentiles([t.selector for t in turns]),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['turns']} turns in {report['elapsed']:.2f}s")
+    print(f"{'metric':<28}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, unit, scale in (
+        ("ttft", "ms", 1000),
+        ("total", "ms", 1000),
+        ("tokens_per_second", "tok/s", 1),
+        ("retrieval", "ms", 1000),
+        ("selector", "ms", 1000),
+    ):
+        if stats := report[name]:
+            print(
+                f"{name + ' (' + unit + ')':<28}{stats['count']:>7}"
+                + "".join(
+                    f"{stats[key] * scale:>10.2f}"
+                    for key in ("mean", "p50", "p95", "p99")
+                )
+            )
+
+
+async def run(args) -> dict:
+    # the fakes replace every remote service, the caches would hide the latency of the path
+    os.environ["MODE"] = args.mode
+    os.environ.setdefault("EMBEDDING_CACHE", "memory" if args.cache else "false")
+    os.environ.setdefault("SEARCH_CACHE", "true" if args.cache else "false")
+    # the offline index needs a fixed size, the fake Ollama embedder has no native one
+    os.environ.setdefault("OLLAMA_EMBEDDING_DIMENSIONS", "1536")
+
+    from backend import get_kernel
+    from data_ingestion.datamodel import (
+        EMBEDDING_DIMENSIONS,
+        OLLAMA_EMBEDDING_DIMENSIONS,
+    )
+    from benchmarks.fakes import FakeChatCompletion, FakeTextEmbedding
+    from failover import get_stream_failover
+    from history_reducer import get_history_reducer
+
+    chat_services = {
+        service_id: FakeChatCompletion(
+            service_id,
+            first_token_latency=args.first_token_ms / 1000,
+            tokens_per_second=args.tokens_per_second,
+            answer_tokens=args.answer_tokens,
+            tool_rounds=args.tool_rounds,
+        )
+        for service_id in ("online", "offline")
+    }
+    embedders = {
+        service_id: FakeTextEmbedding(
+            service_id, dimensions=dimensions, latency=args.embedding_ms / 1000
+        )
+        for service_id, dimensions in (
+            ("online", EMBEDDING_DIMENSIONS),
+            ("offline", OLLAMA_EMBEDDING_DIMENSIONS),
+        )
+    }
+    with tempfile.TemporaryDirectory() as path:
+        collections, keyword_indexes = await build_collections(
+            load_corpus(), embedders, path, hybrid=args.search == "hybrid"
+        )
+        kernel = get_kernel(
+            chat_services=chat_services,
+            embedders=embedders,
+            collections=collections,
+            keyword_indexes=keyword_indexes,
+        )
+        instrument(kernel)
+        reducer = get_history_reducer(kernel)
+        failover = get_stream_failover(kernel, reducer=reducer)
+
+        with open(args.prompts, encoding="utf-8") as file:
+            prompts = [line.strip() for line in file if line.strip()]
+        prompts = prompts * args.repeat
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(prompt: str) -> TurnStats:
+            async with semaphore:
+                return await run_turn(kernel, failover, reducer, prompt)
+
+        # one warm-up turn, the first call builds the prompt templates and function metadata
+        await run_turn(kernel, failover, reducer, prompts[0])
+        start = time.perf_counter()
+        turns = await asyncio.gather(*[limited(prompt) for prompt in prompts])
+        elapsed = time.perf_counter() - start
+    return summarize(turns, elapsed)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--prompts", default=DEFAULT_PROMPTS, help="One prompt per line"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--mode", choices=["online", "offline"], default="online")
+    parser.add_argument("--search", choices=["hybrid", "vector"], default="hybrid")
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument(
+        "--tool-rounds",
+        type=int,
+        default=1,
+        help="Search calls the fake model makes before it answers",
+    )
+    parser.add_argument("--embedding-ms", type=float, default=20.0)
+    parser.add_argument(
+        "--cache", action="store_true", help="Keep the embedding and search caches on"
+    )
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    parser.add_argument(
+        "--max-ttft-p95-ms",
+        type=float,
+        help="Exit with an error when the p95 time to first token is higher, for CI",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"settings": vars(args), **report}, file, indent=2)
+    p95 = report["ttft"].get("p95")
+    if args.max_ttft_p95_ms is not None and (
+        p95 is None or p95 * 1000 > args.max_ttft_p95_ms
+    ):
+        print(f"p95 time to first token is over {args.max_ttft_p95_ms:.0f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
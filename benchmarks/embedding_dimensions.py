@@ -0,0 +1,182 @@
+"""Compares the retrieval quality of shortened (Matryoshka) embeddings with the full vectors.
+
+The chunks of this repository's code are embedded once at full size with the OpenAI or Ollama
+embedding model (from the .env file), the shorter vectors are the first dimensions of those,
+normalized again, which is what OpenAI returns for text-embedding-3 with `dimensions`. Two
+query sets are searched for every size: the prompts in `benchmarks/prompts.txt`, scored by
+the recall of the top k of the full vectors, and the first lines of sampled chunks, scored by
+how often and how high the chunk they came from is found. Run it from the root of the
+repository:
+
+    python -m benchmarks.embedding_dimensions --embedder openai --dimensions 1536 512 256
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from benchmarks.chat_latency import DEFAULT_PROMPTS, load_corpus, percentiles
+from benchmarks.fakes import hashed_embedding
+from clients import get_client_registry
+from data_ingestion.numpy_index import NumpyVectorIndex, truncate
+
+
+async def embed(texts: list[str], embedder: str, batch_size: int) -> np.ndarray:
+    """The full size vectors of `texts`, `fake` needs no network (and says little about quality)."""
+    if embedder == "fake":
+        return np.array([hashed_embedding(text, 1536) for text in texts])
+    clients = get_client_registry()
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start : start + batch_size]
+        if embedder == "openai":
+            response = await clients.openai().embeddings.create(
+                model=os.getenv("OPENAI_EMBEDDING_MODEL_ID"), input=batch
+            )
+            vectors.extend(item.embedding for item in response.data)
+        else:
+            response = await clients.ollama().embed(
+                model=os.getenv("OLLAMA_EMBEDDING_MODEL"), input=batch
+            )
+            vectors.extend(response["embeddings"])
+    await clients.close()
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def chunk_queries(
+    chunks: list[tuple[str, str, str]], count: int, lines: int, seed: int
+) -> tuple[list[str], list[int]]:
+    """The first lines of `count` random chunks, with the row of the chunk they came from."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(chunks), size=min(count, len(chunks)), replace=False)
+    queries = ["\n".join(chunks[row][1].splitlines()[:lines]) for row in rows.tolist()]
+    return queries, rows.tolist()
+
+
+def evaluate(
+    index: NumpyVectorIndex,
+    prompts: np.ndarray,
+    truth: list[set[int]],
+    lookups: np.ndarray,
+    targets: list[int],
+    top: int,
+) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(prompts, truth):
+        start = time.perf_counter()
+        found = index.search(query, top=top)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({row for row, _ in found} & expected) / len(expected))
+    hits, reciprocal_ranks = [], []
+    for found, target in zip(index.search_batch(lookups, top=top), targets):
+        rows = [row for row, _ in found]
+        hits.append(target in rows)
+        reciprocal_ranks.append(1 / (rows.index(target) + 1) if target in rows else 0)
+    return {
+        "dimensions": index.dimensions,
+        "recall": float(np.mean(recalls)),
+        "hit_rate": float(np.mean(hits)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "index_bytes": index.nbytes,
+        "latency": percentiles(latencies),
+    }
+
+
+async def run(args) -> list[dict]:
+    chunks = load_corpus()
+    with open(args.prompts, encoding="utf-8") as file:
+        prompts = [line.strip() for line in file if line.strip()]
+    lookups, targets = chunk_queries(
+        chunks, args.chunk_queries, args.query_lines, args.seed
+    )
+    texts = [text for _, text, _ in chunks]
+    vectors = await embed(texts + prompts + lookups, args.embedder, args.batch_size)
+    documents = vectors[: len(texts)]
+    prompt_vectors = vectors[len(texts) : len(texts) + len(prompts)]
+    lookup_vectors = vectors[len(texts) + len(prompts) :]
+
+    ids = [id for id, _, _ in chunks]
+    payloads = [{} for _ in ids]
+    reports = []
+    with tempfile.TemporaryDirectory() as path:
+        full = NumpyVectorIndex(path, documents.shape[1])
+        full.upsert(ids, documents, payloads)
+        truth = [
+            {row for row, _ in found}
+            for found in full.search_batch(prompt_vectors, top=args.top)
+        ]
+        for dimensions in sorted(
+            {min(size, documents.shape[1]) for size in args.dimensions}, reverse=True
+        ):
+            index = NumpyVectorIndex(path, dimensions)
+            index.upsert(ids, truncate(documents, dimensions), payloads)
+            reports.append(
+                evaluate(
+                    index,
+                    truncate(prompt_vectors, dimensions),
+                    truth,
+                    truncate(lookup_vectors, dimensions),
+                    targets,
+                    args.top,
+                )
+            )
+    return reports
+
+
+def print_report(reports: list[dict], top: int) -> None:
+    print(
+        f"{'dimensions':<12}{'recall@' + str(top):>11}{'hit@' + str(top):>9}{'mrr':>8}"
+        f"{'index MB':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for report in reports:
+        print(
+            f"{report['dimensions']:<12}{report['recall']:>11.3f}"
+            f"{report['hit_rate']:>9.3f}{report['mrr']:>8.3f}"
+            f"{report['index_bytes'] / 2**20:>10.2f}"
+            f"{report['latency']['p50'] * 1000:>10.3f}"
+            f"{report['latency']['p95'] * 1000:>10.3f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--embedder", choices=["openai", "ollama", "fake"], default="openai"
+    )
+    parser.add_argument(
+        "--dimensions", type=int, nargs="+", default=[1536, 1024, 512, 256, 128]
+    )
+    parser.add_argument(
+        "--prompts", default=DEFAULT_PROMPTS, help="One prompt per line"
+    )
+    parser.add_argument(
+        "--chunk-queries",
+        type=int,
+        default=200,
+        help="Chunks whose first lines are searched for",
+    )
+    parser.add_argument("--query-lines", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+    load_dotenv()
+
+    reports = asyncio.run(run(args))
+    print_report(reports, args.top)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"settings": vars(args), "reports": reports}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
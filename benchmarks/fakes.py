@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+from collections.abc import AsyncGenerator
+from typing import TYPE_CHECKING, Any, ClassVar
+
+import numpy as np
+from semantic_kernel.connectors.ai.chat_completion_client_base import (
+    ChatCompletionClientBase,
+)
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
+    EmbeddingGeneratorBase,
+)
+from semantic_kernel.contents import (
+    AuthorRole,
+    ChatHistory,
+    ChatMessageContent,
+    FunctionCallContent,
+    StreamingChatMessageContent,
+)
+
+from data_ingestion.bm25_index import tokenize
+
+if TYPE_CHECKING:
+    from semantic_kernel.connectors.ai.prompt_execution_settings import (
+        PromptExecutionSettings,
+    )
+
+WORDS = (
+    "the kernel adds a chat completion service and a plugin with a function that "
+    "is called by the model when it needs the code samples of semantic kernel"
+).split()
+
+
+class FakeChatCompletion(ChatCompletionClientBase):
+    """Chat completion service that streams a fixed answer at a set pace, without a network.
+
+    The first token arrives after `first_token_latency` seconds, the others at `tokens_per_second`.
+    When the prompt allows function calling, the first `tool_rounds` responses of a turn are a call
+    to `tool_function` of the included plugin, with the user input as query.
+    """
+
+    SUPPORTS_FUNCTION_CALLING: ClassVar[bool] = True
+
+    first_token_latency: float = 0.2
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 100
+    tool_rounds: int = 1
+    tool_function: str = "code_sample_search"
+
+    def __init__(self, service_id: str, **kwargs: Any):
+        super().__init__(
+            service_id=service_id, ai_model_id=f"fake-{service_id}", **kwargs
+        )
+
+    def _tool_call(
+        self, chat_history: ChatHistory, settings: "PromptExecutionSettings"
+    ) -> FunctionCallContent | None:
+        behavior = getattr(settings, "function_choice_behavior", None)
+        if behavior is None or not self.tool_rounds:
+            return None
+        rounds = 0
+        for message in reversed(chat_history.messages):
+            if message.role == AuthorRole.USER:
+                break
+            if any(isinstance(item, FunctionCallContent) for item in message.items):
+                rounds += 1
+        if rounds >= self.tool_rounds:
+            return None
+        plugins = (behavior.filters or {}).get("included_plugins") or ["search"]
+        user = next(
+            (m for m in reversed(chat_history.messages) if m.role == AuthorRole.USER),
+            None,
+        )
+        query = (user.content or "").strip().splitlines()[-1] if user else ""
+        return FunctionCallContent(
+            id=f"call_{rounds}",
+            index=0,
+            plugin_name=plugins[0],
+            function_name=self.tool_function,
+            arguments=json.dumps({"query": query}),
+        )
+
+    def _answer(self) -> list[str]:
+        return [f"{WORDS[index % len(WORDS)]} " for index in range(self.answer_tokens)]
+
+    async def _inner_get_chat_message_contents(
+        self, chat_history: ChatHistory, settings: "PromptExecutionSettings"
+    ) -> list[ChatMessageContent]:
+        await asyncio.sleep(self.first_token_latency)
+        if call := self._tool_call(chat_history, settings):
+            return [ChatMessageContent(role=AuthorRole.ASSISTANT, items=[call])]
+        answer = self._answer()
+        await asyncio.sleep((len(answer) - 1) / self.tokens_per_second)
+        return [
+            ChatMessageContent(
+                role=AuthorRole.ASSISTANT,
+                content="".join(answer),
+                ai_model_id=self.ai_model_id,
+            )
+        ]
+
+    async def _inner_get_streaming_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: "PromptExecutionSettings",
+        function_invoke_attempt: int = 0,
+    ) -> AsyncGenerator[list[StreamingChatMessageContent], Any]:
+        await asyncio.sleep(self.first_token_latency)
+        if call := self._tool_call(chat_history, settings):
+            yield [
+                StreamingChatMessageContent(
+                    role=AuthorRole.ASSISTANT, choice_index=0, items=[call]
+                )
+            ]
+            return
+        for index, token in enumerate(self._answer()):
+            if index:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield [
+                StreamingChatMessageContent(
+                    role=AuthorRole.ASSISTANT,
+                    choice_index=0,
+                    content=token,
+                    ai_model_id=self.ai_model_id,
+                )
+            ]
+
+
+def hashed_embedding(text: str, dimensions: int) -> np.ndarray:
+    """A bag of hashed tokens, texts that share words get similar vectors."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokenize(text):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeTextEmbedding(EmbeddingGeneratorBase):
+    """Embedding service that returns deterministic hashed vectors after `latency` seconds."""
+
+    dimensions: int = 1536
+    latency: float = 0.02
+
+    def __init__(self, service_id: str, **kwargs: Any):
+        super().__init__(
+            service_id=f"{service_id}-embedding",
+            ai_model_id=f"fake-{service_id}-embedding",
+            **kwargs,
+        )
+
+    async def generate_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        await asyncio.sleep(self.latency)
+        return np.array([hashed_embedding(text, self.dimensions) for text in texts])
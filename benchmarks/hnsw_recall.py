@@ -0,0 +1,221 @@
+"""Compares the recall and latency of the HNSW vector search with the exhaustive search.
+
+`--target local` builds HNSW graphs with hnswlib (`pip install hnswlib`), the algorithm and the
+m, efConstruction and efSearch parameters of Azure AI Search, over clustered random vectors or
+the vectors of a saved numpy index; the exact neighbours come from the numpy index.
+`--target azure` searches the index behind AZURE_AI_SEARCH_INDEX_NAME twice per query: with
+its own algorithm and with `exhaustive` on, which scans all vectors of the same index.
+The queries are noisy copies of stored vectors. Run it from the root of the repository:
+
+    python -m benchmarks.hnsw_recall --m 4 8 --ef-search 100 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from benchmarks.chat_latency import percentiles
+from benchmarks.quantization_recall import clustered_vectors, noisy_queries
+from clients import get_client_registry
+from data_ingestion.numpy_index import NumpyVectorIndex
+
+
+def report(
+    algorithm: str,
+    found: list[list[int]],
+    truth: list[set[int]],
+    latencies: list[float],
+    **parameters,
+) -> dict:
+    return {
+        "algorithm": algorithm,
+        **parameters,
+        "recall": float(
+            np.mean(
+                [
+                    len(set(rows) & expected) / len(expected)
+                    for rows, expected in zip(found, truth)
+                ]
+            )
+        ),
+        "latency": percentiles(latencies),
+    }
+
+
+def local_reports(args) -> list[dict]:
+    try:
+        import hnswlib
+    except ImportError:
+        # not in requirements.txt, the app does not need it
+        sys.exit("--target local needs hnswlib, install it with: pip install hnswlib")
+
+    if args.index:
+        vectors = np.asarray(NumpyVectorIndex.open(args.index)._vectors)
+    else:
+        vectors = clustered_vectors(
+            args.count, args.dimensions, args.clusters, args.seed
+        )
+    queries = noisy_queries(vectors, args.queries, args.noise, args.seed)
+    ids = [str(row) for row in range(len(vectors))]
+    reports = []
+    with tempfile.TemporaryDirectory() as path:
+        exact = NumpyVectorIndex(path, vectors.shape[1])
+        exact.upsert(ids, vectors, [{} for _ in ids])
+        found, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results = exact.search(query, top=args.top)
+            latencies.append(time.perf_counter() - start)
+            found.append([row for row, _ in results])
+        truth = [set(rows) for rows in found]
+        reports.append(report("exhaustiveKnn", found, truth, latencies))
+        # the numpy index keeps the vectors normalized, so the inner product is the cosine
+        normalized = np.asarray(exact._vectors[: len(ids)])
+        normalized_queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    for m in args.m:
+        for ef_construction in args.ef_construction:
+            graph = hnswlib.Index(space="ip", dim=vectors.shape[1])
+            start = time.perf_counter()
+            graph.init_index(
+                max_elements=len(normalized), M=m, ef_construction=ef_construction
+            )
+            graph.add_items(normalized, np.arange(len(normalized)))
+            build = time.perf_counter() - start
+            for ef_search in args.ef_search:
+                # like the service, efSearch is raised to k when it is lower
+                graph.set_ef(max(ef_search, args.top))
+                found, latencies = [], []
+                for query in normalized_queries:
+                    start = time.perf_counter()
+                    labels, _ = graph.knn_query(query, k=args.top)
+                    latencies.append(time.perf_counter() - start)
+                    found.append(labels[0].tolist())
+                reports.append(
+                    report(
+                        "hnsw",
+                        found,
+                        truth,
+                        latencies,
+                        m=m,
+                        ef_construction=ef_construction,
+                        ef_search=ef_search,
+                        build_seconds=build,
+                    )
+                )
+    return reports
+
+
+async def azure_reports(args) -> list[dict]:
+    from azure.search.documents.models import VectorizedQuery
+
+    client = get_client_registry().azure_search()
+    try:
+        results = await client.search(
+            search_text="*", select=["id", "embedding"], top=args.queries
+        )
+        stored = [result["embedding"] async for result in results]
+        queries = noisy_queries(
+            np.asarray(stored, dtype=np.float32), args.queries, args.noise, args.seed
+        )
+        found = {True: [], False: []}
+        latencies = {True: [], False: []}
+        for query in queries:
+            for exhaustive in (True, False):
+                start = time.perf_counter()
+                results = await client.search(
+                    search_text=None,
+                    select=["id"],
+                    top=args.top,
+                    vector_queries=[
+                        VectorizedQuery(
+                            vector=query.tolist(),
+                            k_nearest_neighbors=args.top,
+                            fields="embedding",
+                            exhaustive=exhaustive,
+                        )
+                    ],
+                )
+                found[exhaustive].append([result["id"] async for result in results])
+                latencies[exhaustive].append(time.perf_counter() - start)
+    finally:
+        await get_client_registry().close()
+    truth = [set(ids) for ids in found[True]]
+    return [
+        report("exhaustive", found[True], truth, latencies[True]),
+        report("index", found[False], truth, latencies[False]),
+    ]
+
+
+def print_report(reports: list[dict], top: int) -> None:
+    print(
+        f"{'algorithm':<16}{'m':>4}{'efConstruction':>16}{'efSearch':>10}"
+        f"{'recall@' + str(top):>11}{'build s':>9}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for entry in reports:
+        build = entry.get("build_seconds")
+        print(
+            f"{entry['algorithm']:<16}{entry.get('m', '-'):>4}"
+            f"{entry.get('ef_construction', '-'):>16}{entry.get('ef_search', '-'):>10}"
+            f"{entry['recall']:>11.3f}{'-' if build is None else f'{build:.1f}':>9}"
+            f"{entry['latency']['p50'] * 1000:>10.3f}"
+            f"{entry['latency']['p95'] * 1000:>10.3f}"
+        )
+
+
+def main() -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["local", "azure"], default="local")
+    parser.add_argument("--index", help="A saved numpy index to take the vectors from")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--noise", type=float, default=0.3, help="Relative noise on the queries"
+    )
+    parser.add_argument("--top", type=int, default=10)
+    # the defaults are the settings the ingestion creates the index with
+    parser.add_argument(
+        "--m",
+        type=int,
+        nargs="+",
+        default=[int(os.getenv("AZURE_AI_SEARCH_HNSW_M", "4"))],
+    )
+    parser.add_argument(
+        "--ef-construction",
+        type=int,
+        nargs="+",
+        default=[int(os.getenv("AZURE_AI_SEARCH_HNSW_EF_CONSTRUCTION", "400"))],
+    )
+    parser.add_argument(
+        "--ef-search",
+        type=int,
+        nargs="+",
+        default=[int(os.getenv("AZURE_AI_SEARCH_HNSW_EF_SEARCH", "500"))],
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.target == "azure":
+        reports = asyncio.run(azure_reports(args))
+    else:
+        reports = local_reports(args)
+    print_report(reports, args.top)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"settings": vars(args), "reports": reports}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Compares the recall, memory and latency of the quantized numpy index with the float index.
+
+The vectors are clustered random vectors by default, or the vectors of a saved index
+(like the offline index written by the ingestion with `--numpy`). The queries are noisy
+copies of stored vectors, the exact float search gives the true neighbours. Run it from
+the root of the repository:
+
+    python -m benchmarks.quantization_recall --count 50000 --oversampling 1 4 10
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.chat_latency import percentiles
+from data_ingestion.numpy_index import NumpyVectorIndex
+
+
+def clustered_vectors(
+    count: int, dimensions: int, clusters: int, seed: int
+) -> np.ndarray:
+    """Vectors around random centers, embeddings of a code base are clustered by topic too."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)]
+    return vectors + rng.normal(scale=0.6, size=vectors.shape).astype(np.float32)
+
+
+def noisy_queries(
+    vectors: np.ndarray, count: int, noise: float, seed: int
+) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picked = np.asarray(vectors[rng.integers(0, len(vectors), count)])
+    scale = noise * np.linalg.norm(picked, axis=1, keepdims=True)
+    return picked + rng.normal(size=picked.shape).astype(np.float32) * scale / np.sqrt(
+        picked.shape[1]
+    )
+
+
+def evaluate(
+    index: NumpyVectorIndex, queries: np.ndarray, truth: list[set[int]], top: int
+) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = index.search(query, top=top)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({row for row, _ in found} & expected) / len(expected))
+    return {
+        "quantization": index.quantization,
+        "oversampling": index.oversampling if index.quantization != "none" else None,
+        "recall": float(np.mean(recalls)),
+        "scan_bytes": index.nbytes,
+        "latency": percentiles(latencies),
+    }
+
+
+def run(args) -> list[dict]:
+    if args.index:
+        vectors = NumpyVectorIndex.open(args.index)._vectors
+    else:
+        vectors = clustered_vectors(
+            args.count, args.dimensions, args.clusters, args.seed
+        )
+    queries = noisy_queries(vectors, args.queries, args.noise, args.seed)
+    ids = [str(row) for row in range(len(vectors))]
+    payloads = [{} for _ in ids]
+    reports = []
+    with tempfile.TemporaryDirectory() as path:
+        exact = NumpyVectorIndex(path, vectors.shape[1])
+        exact.upsert(ids, vectors, payloads)
+        truth = [
+            {row for row, _ in found}
+            for found in exact.search_batch(queries, top=args.top)
+        ]
+        reports.append(evaluate(exact, queries, truth, args.top))
+        for quantization in ("int8", "binary"):
+            index = NumpyVectorIndex(path, vectors.shape[1], quantization)
+            index.upsert(ids, vectors, payloads)
+            index.codes  # quantized up front, as on open of a saved index
+            for oversampling in args.oversampling:
+                index.oversampling = oversampling
+                reports.append(evaluate(index, queries, truth, args.top))
+    return reports
+
+
+def print_report(reports: list[dict], top: int) -> None:
+    print(
+        f"{'quantization':<14}{'oversampling':>13}{'recall@' + str(top):>11}"
+        f"{'scan MB':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for report in reports:
+        oversampling = report["oversampling"]
+        print(
+            f"{report['quantization']:<14}"
+            f"{'-' if oversampling is None else f'{oversampling:.1f}':>13}"
+            f"{report['recall']:>11.3f}{report['scan_bytes'] / 2**20:>10.1f}"
+            f"{report['latency']['p50'] * 1000:>10.2f}"
+            f"{report['latency']['p95'] * 1000:>10.2f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", help="A saved numpy index to take the vectors from")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--noise", type=float, default=0.3, help="Relative noise on the queries"
+    )
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--oversampling", type=float, nargs="+", default=[1.0, 4.0, 10.0]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    reports = run(args)
+    print_report(reports, args.top)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"settings": vars(args), "reports": reports}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _pooled_aiohttp_transport(pool_size: int, keepalive: float):
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    class PooledAioHttpTransport(AioHttpTransport):
+        """The azure-core aiohttp transport, with a sized connection pool instead of the default."""
+
+        async def open(self):
+            if self.session is None and not self._has_been_opened:
+                import aiohttp
+
+                # created on first use, an aiohttp session belongs to the running loop
+                self.session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=pool_size, keepalive_timeout=keepalive
+                    ),
+                    trust_env=self._use_env_settings,
+                    cookie_jar=aiohttp.DummyCookieJar(),
+                    auto_decompress=False,
+                )
+            await super().open()
+
+    return PooledAioHttpTransport()
+
+
+class _LoopClients:
+    """The clients of one event loop, with the calls that close them."""
+
+    def __init__(self):
+        self.clients: dict[str, Any] = {}
+        self.closers: list[Callable[[], Awaitable[Any]]] = []
+
+
+class ClientRegistry:
+    """Hands out one pooled client per backend, shared by every service that talks to it.
+
+    The HTTP clients keep up to `pool_size` connections open for `keepalive` seconds and
+    use HTTP/2 when `http2` is on and the `h2` package is installed (Azure AI Search goes
+    through aiohttp, which only speaks HTTP/1.1). The Qdrant gRPC channel sends keep-alive
+    pings instead. The clients are created on first use, `close` closes all of them.
+
+    The connection pools belong to the event loop they are first used on, so the clients are
+    kept per running loop. Clients asked for outside of a loop, like the ones the services are
+    created with, are those of `loop`: the loop the app runs its handlers on (see `AppLoop`).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 20,
+        keepalive: float = 30.0,
+        http2: bool = True,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ):
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.loop = loop
+        self._loops: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, _LoopClients
+        ] = weakref.WeakKeyDictionary()
+        # the clients used outside of any loop when there is no app loop
+        self._unbound = _LoopClients()
+        # reentrant, the Azure clients create the shared transport while they are created
+        self._lock = threading.RLock()
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive,
+        )
+
+    @staticmethod
+    def _running_loop() -> asyncio.AbstractEventLoop | None:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def _loop_clients(self, loop: asyncio.AbstractEventLoop | None) -> _LoopClients:
+        loop = loop or self.loop
+        if loop is None:
+            return self._unbound
+        with self._lock:
+            if (clients := self._loops.get(loop)) is None:
+                clients = self._loops[loop] = _LoopClients()
+            return clients
+
+    def _get(self, key: str, create: Callable[[], Any], close: str = "close") -> Any:
+        loop_clients = self._loop_clients(self._running_loop())
+        if key not in loop_clients.clients:
+            with self._lock:
+                if key not in loop_clients.clients:
+                    client = create()
+                    if closer := getattr(client, close, None):
+                        loop_clients.closers.append(closer)
+                    loop_clients.clients[key] = client
+                    logger.info(f"Created the shared {key} client")
+        return loop_clients.clients[key]
+
+    def openai(self):
+        """The OpenAI client, for the chat and the embedding services."""
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        return self._get(
+            "openai",
+            lambda: AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                organization=os.getenv("OPENAI_ORG_ID"),
+                http_client=DefaultAsyncHttpxClient(
+                    limits=self.limits, http2=self.http2
+                ),
+            ),
+        )
+
+    def ollama(self):
+        from ollama import AsyncClient
+
+        return self._get(
+            "ollama",
+            lambda: AsyncClient(
+                host=os.getenv("OLLAMA_HOST"), limits=self.limits, http2=self.http2
+            ),
+        )
+
+    def qdrant(self, prefer_grpc: bool | None = None):
+        """The Qdrant client, QDRANT_PREFER_GRPC picks gRPC unless `prefer_grpc` is given."""
+        from qdrant_client import AsyncQdrantClient
+
+        if prefer_grpc is None:
+            prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+        if url := os.getenv("QDRANT_URL"):
+            location = {"url": url}
+        else:
+            location = {
+                "host": os.getenv("QDRANT_HOST"),
+                "port": int(os.getenv("QDRANT_PORT", "6333")),
+            }
+        keepalive_ms = int(self.keepalive * 1000)
+        return self._get(
+            "qdrant",
+            lambda: AsyncQdrantClient(
+                **location,
+                grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+                api_key=os.getenv("QDRANT_API_KEY"),
+                prefer_grpc=prefer_grpc,
+                # the version check is a blocking request in the constructor
+                check_compatibility=False,
+                # the client turns keep-alive off for localhost unless limits are given
+                limits=self.limits,
+                http2=self.http2,
+                grpc_options={
+                    "grpc.keepalive_time_ms": keepalive_ms,
+                    "grpc.keepalive_permit_without_calls": 1,
+                },
+            ),
+        )
+
+    @property
+    def _azure_transport(self):
+        return self._get(
+            "azure transport",
+            lambda: _pooled_aiohttp_transport(self.pool_size, self.keepalive),
+        )
+
+    def _azure_credential(self):
+        from azure.core.credentials import AzureKeyCredential
+
+        return AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_API_KEY"))
+
+    def azure_search(self, index_name: str | None = None):
+        """The search client of an index, all Azure AI Search clients share one transport."""
+        from azure.search.documents.aio import SearchClient
+
+        index_name = index_name or os.getenv("AZURE_AI_SEARCH_INDEX_NAME")
+        return self._get(
+            f"azure search {index_name}",
+            lambda: SearchClient(
+                endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+                index_name=index_name,
+                credential=self._azure_credential(),
+                transport=self._azure_transport,
+            ),
+        )
+
+    def azure_search_index(self):
+        from azure.search.documents.indexes.aio import SearchIndexClient
+
+        return self._get(
+            "azure search index",
+            lambda: SearchIndexClient(
+                endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+                credential=self._azure_credential(),
+                transport=self._azure_transport,
+            ),
+        )
+
+    async def close(self) -> None:
+        """Closes the clients of the running loop, the ones created last first."""
+        await self._close(self._loop_clients(self._running_loop()))
+
+    async def _close(self, loop_clients: _LoopClients) -> None:
+        with self._lock:
+            closers, loop_clients.closers = loop_clients.closers[::-1], []
+            loop_clients.clients.clear()
+        for close in closers:
+            try:
+                await close()
+            except Exception as exc:
+                logger.warning(f"Could not close a client: {exc}")
+
+    def shutdown(self) -> None:
+        """Closes the clients of every loop from synchronous code, like an atexit handler."""
+        with self._lock:
+            loops = [*self._loops.items(), (None, self._unbound)]
+        for loop, loop_clients in loops:
+            if not loop_clients.closers:
+                continue
+            if loop is not None and loop.is_running():
+                asyncio.run_coroutine_threadsafe(
+                    self._close(loop_clients), loop
+                ).result(timeout=10)
+            elif loop is not None and not loop.is_closed():
+                loop.run_until_complete(self._close(loop_clients))
+            else:
+                asyncio.run(self._close(loop_clients))
+
+
+_registry: ClientRegistry | None = None
+
+
+def get_client_registry() -> ClientRegistry:
+    """Returns the process wide registry, configured from the environment."""
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry(
+            pool_size=int(os.getenv("CLIENT_POOL_SIZE", "20")),
+            keepalive=float(os.getenv("CLIENT_KEEPALIVE", "30.0")),
+            http2=os.getenv("CLIENT_HTTP2", "true").lower() == "true",
+        )
+    return _registry
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from utils import forced_online_state, internet_async
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectivityMonitor:
+    """Keeps a cached online/offline state up to date from a background thread.
+
+    The probe runs on its own event loop, so reading the state never blocks a request.
+    After the first probe the state only flips after `rise` consecutive successful probes
+    (when offline) or `fall` consecutive failed probes (when online), so it does not flap.
+    When the cached state is older than `ttl` a probe is triggered straight away,
+    the caller still gets the cached value.
+    """
+
+    def __init__(
+        self,
+        host: str = "1.1.1.1",
+        port: int = 53,
+        timeout: float = 1.0,
+        interval: float = 5.0,
+        ttl: float = 15.0,
+        rise: int = 2,
+        fall: int = 2,
+        initial: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.interval = interval
+        self.ttl = ttl
+        self.rise = rise
+        self.fall = fall
+        self._online = initial
+        self._checked_at: float | None = None
+        self._streak = 0
+        self._probed = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._stopped = False
+
+    @property
+    def online(self) -> bool:
+        """The cached state, this never probes on the calling thread."""
+        if (forced := forced_online_state()) is not None:
+            return forced
+        self.start()
+        if self.stale:
+            self.refresh()
+        return self._online
+
+    @property
+    def stale(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at > self.ttl
+
+    async def is_online(self) -> bool:
+        return self.online
+
+    def wait_for_first_probe(self, timeout: float | None = None) -> bool:
+        """Blocks until the first probe is in, so `online` is no longer the initial guess."""
+        if forced_online_state() is not None:
+            return True
+        self.start()
+        return self._probed.wait(timeout)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=asyncio.run,
+                args=(self._run(),),
+                name="connectivity-monitor",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def refresh(self) -> None:
+        """Ask the background loop to probe now instead of waiting for the interval."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stop(self) -> None:
+        self._stopped = True
+        self.refresh()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+
+    async def _run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while not self._stopped:
+            self._record(
+                await internet_async(self.host, self.port, timeout=self.timeout)
+            )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+        self._loop = None
+        self._wakeup = None
+
+    def _record(self, result: bool) -> None:
+        first = self._checked_at is None
+        self._checked_at = time.monotonic()
+        if first:
+            self._online = result
+            self._probed.set()
+            logger.info(f"Connectivity: {'online' if result else 'offline'}")
+            return
+        if result == self._online:
+            self._streak = 0
+            return
+        self._streak += 1
+        if self._streak >= (self.fall if self._online else self.rise):
+            self._online = result
+            self._streak = 0
+            logger.info(f"Connectivity changed: {'online' if result else 'offline'}")
+
+
+_monitor: ConnectivityMonitor | None = None
+
+
+def get_connectivity_monitor() -> ConnectivityMonitor:
+    """Returns the process wide monitor, configured from the environment."""
+    global _monitor
+    if _monitor is None:
+        _monitor = ConnectivityMonitor(
+            host=os.getenv("CONNECTIVITY_HOST", "1.1.1.1"),
+            port=int(os.getenv("CONNECTIVITY_PORT", "53")),
+            timeout=float(os.getenv("CONNECTIVITY_TIMEOUT", "1.0")),
+            interval=float(os.getenv("CONNECTIVITY_INTERVAL", "5.0")),
+            ttl=float(os.getenv("CONNECTIVITY_TTL", "15.0")),
+        )
+    return _monitor
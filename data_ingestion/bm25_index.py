@@ -0,0 +1,190 @@
+import asyncio
+import gzip
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+FILTER_FIELDS = ("topic", "subtopic", "connector")
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Code aware tokenizer, identifiers are kept whole and split on camelCase and snake_case.
+
+    `OllamaChatCompletion` gives `ollamachatcompletion`, `ollama`, `chat` and `completion`.
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        lowered = word.lower()
+        if len(lowered) > 1:
+            tokens.append(lowered)
+        parts = [
+            part.lower() for piece in word.split("_") for part in _CAMEL.findall(piece)
+        ]
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if len(part) > 1)
+    return tokens
+
+
+@dataclass
+class KeywordHit:
+    id: str
+    score: float
+    text: str
+
+
+class BM25Index:
+    """An inverted index over the chunks, scored with BM25."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.doc_ids: list[str | None] = []
+        self.fields: dict[str, list[str | None]] = {name: [] for name in FILTER_FIELDS}
+        self.lengths: list[int] = []
+        self.total_length = 0
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / len(self.lengths) if self.lengths else 0.0
+
+    def add(
+        self, id: str, text: str, metadata: dict, doc_id: str | None = None
+    ) -> None:
+        doc = len(self.ids)
+        tokens = tokenize(text)
+        self.ids.append(id)
+        self.texts.append(text)
+        self.doc_ids.append(doc_id)
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        for name in FILTER_FIELDS:
+            self.fields[name].append(metadata.get(name))
+        for term, count in Counter(tokens).items():
+            self.postings.setdefault(term, []).append((doc, count))
+
+    def search(
+        self, query: str, top: int = 10, filters: dict[str, str] | None = None
+    ) -> list[KeywordHit]:
+        average_length = self.average_length or 1.0
+        total = len(self.ids)
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, count in postings:
+                norm = self.k1 * (
+                    1 - self.b + self.b * self.lengths[doc] / average_length
+                )
+                scores[doc] = scores.get(doc, 0.0) + idf * count * (self.k1 + 1) / (
+                    count + norm
+                )
+        if filters:
+            scores = {
+                doc: score
+                for doc, score in scores.items()
+                if all(
+                    self.fields.get(name, [None] * total)[doc] == value
+                    for name, value in filters.items()
+                )
+            }
+        best = heapq.nlargest(top, scores.items(), key=lambda item: item[1])
+        return [
+            KeywordHit(self.ids[doc], score, self.texts[doc]) for doc, score in best
+        ]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "doc_ids": self.doc_ids,
+                    "fields": self.fields,
+                    "lengths": self.lengths,
+                    "postings": self.postings,
+                },
+                file,
+            )
+        os.replace(f"{path}.tmp", path)
+        logger.info(f"Saved keyword index with {len(self.ids)} chunks to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            data = json.load(file)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids = data["ids"]
+        index.texts = data["texts"]
+        index.doc_ids = data.get("doc_ids", [None] * len(index.ids))
+        index.fields = data["fields"]
+        index.lengths = data["lengths"]
+        index.total_length = sum(index.lengths)
+        index.postings = {
+            term: [tuple(posting) for posting in postings]
+            for term, postings in data["postings"].items()
+        }
+        return index
+
+    def chunks(self) -> Iterable[tuple[str, str, dict, str | None]]:
+        for doc, id in enumerate(self.ids):
+            metadata = {name: values[doc] for name, values in self.fields.items()}
+            yield id, self.texts[doc], metadata, self.doc_ids[doc]
+
+    def without_documents(self, doc_ids: set[str]) -> "BM25Index":
+        """Returns a new index without the chunks of the given documents."""
+        return self.build(chunk for chunk in self.chunks() if chunk[3] not in doc_ids)
+
+    @classmethod
+    def build(
+        cls, chunks: Iterable[tuple[str, str, dict] | tuple[str, str, dict, str]]
+    ) -> "BM25Index":
+        """Builds the index from (id, text, metadata) or (id, text, metadata, doc_id) tuples."""
+        index = cls()
+        for chunk in chunks:
+            index.add(*chunk)
+        return index
+
+
+class LazyBM25Index:
+    """Loads a saved index in a background thread, searches wait for it on first use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index: BM25Index | None = None
+        self._error: Exception | None = None
+        self._loaded = threading.Event()
+        threading.Thread(target=self._load, name="bm25-loader", daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            self._index = BM25Index.load(self.path)
+        except Exception as exc:
+            logger.warning(f"Could not load the keyword index from {self.path}: {exc}")
+            self._error = exc
+        finally:
+            self._loaded.set()
+
+    async def get(self) -> BM25Index | None:
+        if not self._loaded.is_set():
+            await asyncio.to_thread(self._loaded.wait)
+        return self._index
@@ -0,0 +1,504 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from typing import Any
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.search.documents.indexes.models import (
+    BinaryQuantizationCompression,
+    ExhaustiveKnnAlgorithmConfiguration,
+    HnswAlgorithmConfiguration,
+    HnswParameters,
+    RescoringOptions,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters,
+    SearchAlias,
+    SearchableField,
+    SearchField,
+    SearchFieldDataType,
+    SearchIndex,
+    SimpleField,
+    VectorSearch,
+    VectorSearchProfile,
+)
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from qdrant_client import AsyncQdrantClient, models
+
+logger = logging.getLogger(__name__)
+
+# Azure AI Search returns these per document for a batch that partially failed,
+# the documents can be sent again
+RETRYABLE_STATUS = (409, 422, 429, 500, 503)
+VECTOR_PROFILES = ("exhaustive", "hnsw")
+
+
+def check_dimensions(
+    store: str, existing: int | None, dimensions: int, setting: str
+) -> None:
+    """Fails before the first write when a store was created for vectors of another size."""
+    if existing and existing != dimensions:
+        raise ValueError(
+            f"{store} holds vectors of {existing} dimensions and the embeddings have "
+            f"{dimensions}, set {setting} to {existing} or delete {store} so it is created again"
+        )
+
+
+class BulkWriter:
+    """Writes nodes in batches of `batch_size`, with at most `parallel` batches in flight.
+
+    Keeps count of the points written and the time spent, `report` logs the points per second.
+    """
+
+    name = "bulk"
+
+    def __init__(self, batch_size: int, parallel: int):
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self.points = 0
+        self.elapsed = 0.0
+        self._semaphore = asyncio.Semaphore(parallel)
+
+    async def write(self, nodes: Sequence[BaseNode]) -> None:
+        if not nodes:
+            return
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                self._send(nodes[offset : offset + self.batch_size])
+                for offset in range(0, len(nodes), self.batch_size)
+            ]
+        )
+        self.points += len(nodes)
+        self.elapsed += time.perf_counter() - start
+
+    async def _send(self, batch: Sequence[BaseNode]) -> None:
+        async with self._semaphore:
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: Sequence[BaseNode]) -> None:
+        raise NotImplementedError
+
+    def report(self) -> None:
+        if self.points:
+            logger.info(
+                f"Wrote {self.points} points to {self.name} in {self.elapsed:.1f}s "
+                f"({self.points / max(self.elapsed, 1e-9):.0f} points/s)"
+            )
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[Any]], retries: int = 5, backoff: float = 1.0
+) -> Any:
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except HttpResponseError as exc:
+            if exc.status_code not in RETRYABLE_STATUS or attempt == retries:
+                raise
+        except (asyncio.TimeoutError, ConnectionError):
+            if attempt == retries:
+                raise
+        await asyncio.sleep(random.uniform(0, backoff * 2**attempt))
+
+
+class QdrantBulkWriter(BulkWriter):
+    """Upserts the nodes as points with the same payload as the llama-index `QdrantVectorStore`.
+
+    Use a client with `prefer_grpc=True`, the points are then sent as protobuf
+    instead of JSON, which is much faster for large float vectors.
+    A new collection gets the `quantization` (`int8` or `binary`) with the codes in RAM
+    and the full vectors on disk, Qdrant rescores the candidates with those by default.
+    """
+
+    name = "Qdrant"
+
+    def __init__(
+        self,
+        client: AsyncQdrantClient,
+        collection_name: str,
+        batch_size: int = 256,
+        parallel: int = 4,
+        quantization: str = "none",
+    ):
+        super().__init__(batch_size, parallel)
+        self.client = client
+        self.collection_name = collection_name
+        self.quantization = quantization
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+
+    async def delete_documents(self, doc_ids: Sequence[str]) -> None:
+        if not doc_ids or not await self.client.collection_exists(self.collection_name):
+            return
+        await self.client.delete(
+            self.collection_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="doc_id", match=models.MatchAny(any=list(doc_ids))
+                        )
+                    ]
+                )
+            ),
+        )
+
+    async def _ensure_collection(self, dimensions: int) -> None:
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+            if await self.client.collection_exists(self.collection_name):
+                info = await self.client.get_collection(self.collection_name)
+                check_dimensions(
+                    f"Qdrant collection {self.collection_name}",
+                    info.config.params.vectors.size,
+                    dimensions,
+                    "OLLAMA_EMBEDDING_DIMENSIONS",
+                )
+            else:
+                await self.client.create_collection(
+                    self.collection_name,
+                    vectors_config=models.VectorParams(
+                        size=dimensions,
+                        distance=models.Distance.COSINE,
+                        on_disk=self.quantization != "none",
+                    ),
+                    quantization_config=get_qdrant_quantization_config(
+                        self.quantization
+                    ),
+                )
+            self._collection_ready = True
+
+    async def _write_batch(self, batch: Sequence[BaseNode]) -> None:
+        await self._ensure_collection(len(batch[0].get_embedding()))
+        points = [
+            models.PointStruct(
+                id=node.node_id,
+                vector=node.get_embedding(),
+                payload=node_to_metadata_dict(
+                    node, remove_text=False, flat_metadata=False
+                ),
+            )
+            for node in batch
+        ]
+        await self.client.upsert(self.collection_name, points=points, wait=True)
+
+
+def get_qdrant_quantization_config(quantization: str):
+    if quantization == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    return None
+
+
+def get_azure_search_compression(quantization: str, oversampling: float):
+    """The compression of the vector field, the results are reranked with the full vectors."""
+    if quantization == "int8":
+        return ScalarQuantizationCompression(
+            compression_name="int8",
+            rescoring_options=RescoringOptions(
+                enable_rescoring=True, default_oversampling=oversampling
+            ),
+            parameters=ScalarQuantizationParameters(quantized_data_type="int8"),
+        )
+    if quantization == "binary":
+        return BinaryQuantizationCompression(
+            compression_name="binary",
+            rescoring_options=RescoringOptions(
+                enable_rescoring=True, default_oversampling=oversampling
+            ),
+        )
+    return None
+
+
+def get_azure_search_vector_algorithm(
+    vector_profile: str,
+    m: int = 4,
+    ef_construction: int = 400,
+    ef_search: int = 500,
+) -> ExhaustiveKnnAlgorithmConfiguration | HnswAlgorithmConfiguration:
+    """A linear scan over all vectors (`exhaustive`), or an HNSW graph (`hnsw`).
+
+    The HNSW parameters are the ones of the service: `m` links per node (4 to 10),
+    `ef_construction` and `ef_search` candidates while building and searching (100 to 1000),
+    higher values give a better recall for a larger and slower index.
+    """
+    if vector_profile == "hnsw":
+        return HnswAlgorithmConfiguration(
+            name="myHnsw",
+            parameters=HnswParameters(
+                m=m,
+                ef_construction=ef_construction,
+                ef_search=ef_search,
+                metric="cosine",
+            ),
+        )
+    if vector_profile == "exhaustive":
+        return ExhaustiveKnnAlgorithmConfiguration(name="myExhaustiveKnn")
+    raise ValueError(f"Unknown vector profile {vector_profile}")
+
+
+def get_azure_search_index_definition(
+    index_name: str,
+    dimensions: int,
+    metadata_fields: Sequence[str],
+    quantization: str = "none",
+    oversampling: float = 4.0,
+    algorithm: (
+        ExhaustiveKnnAlgorithmConfiguration | HnswAlgorithmConfiguration | None
+    ) = None,
+) -> SearchIndex:
+    """The same fields as the llama-index `AzureAISearchVectorStore` creates."""
+    compression = get_azure_search_compression(quantization, oversampling)
+    algorithm = algorithm or get_azure_search_vector_algorithm("exhaustive")
+    profile_name = f"{algorithm.name}Profile"
+    return SearchIndex(
+        name=index_name,
+        fields=[
+            SimpleField(name="id", type="Edm.String", key=True, filterable=True),
+            SearchableField(name="chunk", type="Edm.String", analyzer_name="en.lucene"),
+            SearchField(
+                name="embedding",
+                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                searchable=True,
+                vector_search_dimensions=dimensions,
+                vector_search_profile_name=profile_name,
+            ),
+            SimpleField(name="metadata", type="Edm.String"),
+            SimpleField(name="doc_id", type="Edm.String", filterable=True),
+            *[
+                SimpleField(name=name, type="Edm.String", filterable=True)
+                for name in metadata_fields
+            ],
+        ],
+        vector_search=VectorSearch(
+            algorithms=[algorithm],
+            profiles=[
+                VectorSearchProfile(
+                    name=profile_name,
+                    algorithm_configuration_name=algorithm.name,
+                    compression_name=(
+                        compression.compression_name if compression else None
+                    ),
+                )
+            ],
+            compressions=[compression] if compression else None,
+        ),
+    )
+
+
+def _vector_dimensions(index: SearchIndex) -> int | None:
+    return next(
+        (
+            field.vector_search_dimensions
+            for field in index.fields
+            if field.name == "embedding"
+        ),
+        None,
+    )
+
+
+def _vector_algorithm(index: SearchIndex) -> str | None:
+    """The kind and parameters of the vector algorithm, like `hnsw (m=4, ...)`."""
+    if not index.vector_search or not index.vector_search.algorithms:
+        return None
+    algorithm = index.vector_search.algorithms[0]
+    parameters = getattr(algorithm, "parameters", None)
+    if isinstance(parameters, HnswParameters):
+        return (
+            f"{algorithm.kind} (m={parameters.m}, "
+            f"efConstruction={parameters.ef_construction}, efSearch={parameters.ef_search})"
+        )
+    return algorithm.kind
+
+
+async def resolve_alias(index_client: SearchIndexClient, name: str) -> str | None:
+    """The index the alias `name` points at, None when there is no such alias."""
+    try:
+        alias = await index_client.get_alias(name)
+    except ResourceNotFoundError:
+        return None
+    return alias.indexes[0] if alias.indexes else None
+
+
+async def swap_alias(
+    index_client: SearchIndexClient, alias_name: str, index_name: str
+) -> str | None:
+    """Points the alias at `index_name` and returns the index it pointed at before.
+
+    The searches through the alias go to the new index from then on, without downtime.
+    """
+    previous = await resolve_alias(index_client, alias_name)
+    await index_client.create_or_update_alias(
+        SearchAlias(name=alias_name, indexes=[index_name])
+    )
+    logger.info(f"Alias {alias_name} now points at index {index_name}")
+    return previous
+
+
+async def delete_old_indexes(
+    index_client: SearchIndexClient, alias_name: str
+) -> list[str]:
+    """Deletes the indexes earlier migrations built for `alias_name` and returns their names.
+
+    Only the `<alias>-<timestamp>` indexes the alias no longer points at are deleted, nothing
+    is deleted when the alias does not exist.
+    """
+    current = await resolve_alias(index_client, alias_name)
+    if current is None:
+        logger.warning(f"{alias_name} is not an alias, no indexes deleted")
+        return []
+    pattern = re.compile(rf"{re.escape(alias_name)}-\d{{14}}")
+    deleted = []
+    async for name in index_client.list_index_names():
+        if name != current and pattern.fullmatch(name):
+            await index_client.delete_index(name)
+            logger.info(f"Deleted the previous index {name}")
+            deleted.append(name)
+    return deleted
+
+
+class AzureSearchBulkWriter(BulkWriter):
+    """Uploads the nodes with `upload_documents`, in the document format of the llama-index store.
+
+    Documents that fail within a batch (throttling, conflicts) are sent again with a backoff,
+    a batch that is too large for a single request is split in two.
+    """
+
+    name = "Azure AI Search"
+
+    def __init__(
+        self,
+        index_client: SearchIndexClient,
+        search_client: SearchClient,
+        index_definition: SearchIndex,
+        batch_size: int = 200,
+        parallel: int = 4,
+        retries: int = 5,
+    ):
+        super().__init__(batch_size, parallel)
+        self.index_client = index_client
+        self.search_client = search_client
+        self.index_definition = index_definition
+        self.retries = retries
+        self.metadata_fields = [
+            field.name
+            for field in index_definition.fields
+            if field.name not in ("id", "chunk", "embedding", "metadata", "doc_id")
+        ]
+
+    async def ensure_index(self) -> None:
+        name = self.index_definition.name
+        try:
+            index = await self.index_client.get_index(name)
+        except ResourceNotFoundError:
+            # the documents can be written through an alias, the definition is the index's
+            if (target := await resolve_alias(self.index_client, name)) is None:
+                logger.info(f"Creating index {name}")
+                await self.index_client.create_index(self.index_definition)
+                return
+            index = await self.index_client.get_index(target)
+        check_dimensions(
+            f"Azure AI Search index {index.name}",
+            _vector_dimensions(index),
+            _vector_dimensions(self.index_definition),
+            "EMBEDDING_DIMENSIONS",
+        )
+        # the algorithm of an index cannot be changed in place, only by a new index
+        existing = _vector_algorithm(index)
+        wanted = _vector_algorithm(self.index_definition)
+        if existing != wanted:
+            logger.warning(
+                f"Index {index.name} uses {existing}, {wanted} is configured: "
+                "run the ingestion with --migrate to build a new index"
+            )
+
+    async def delete_documents(self, doc_ids: Sequence[str]) -> None:
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        # search.in takes a batch of values, keep the filter well below the size limit;
+        # the ids are paths, which can hold a comma but not a |
+        for offset in range(0, len(doc_ids), 100):
+            values = "|".join(doc_ids[offset : offset + 100]).replace("'", "''")
+            results = await self.search_client.search(
+                search_text="*",
+                filter=f"search.in(doc_id, '{values}', '|')",
+                select=["id"],
+            )
+            keys = [{"id": result["id"]} async for result in results]
+            for start in range(0, len(keys), 1000):
+                batch = keys[start : start + 1000]
+                await with_retries(
+                    lambda: self.search_client.delete_documents(documents=batch),
+                    self.retries,
+                )
+
+    def to_document(self, node: BaseNode) -> dict[str, Any]:
+        metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+        document = {
+            "id": node.node_id,
+            "chunk": node.get_content(metadata_mode=MetadataMode.NONE) or "",
+            "embedding": node.get_embedding(),
+            "metadata": json.dumps(metadata),
+            "doc_id": node.ref_doc_id,
+        }
+        for name in self.metadata_fields:
+            if name in node.metadata:
+                document[name] = node.metadata[name]
+        return document
+
+    async def _write_batch(self, batch: Sequence[BaseNode]) -> None:
+        await self._upload([self.to_document(node) for node in batch])
+
+    async def _upload(self, documents: list[dict[str, Any]]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                results = await self.search_client.upload_documents(documents=documents)
+            except HttpResponseError as exc:
+                if exc.status_code == 413 and len(documents) > 1:
+                    middle = len(documents) // 2
+                    await self._upload(documents[:middle])
+                    await self._upload(documents[middle:])
+                    return
+                if exc.status_code not in RETRYABLE_STATUS or attempt == self.retries:
+                    raise
+            else:
+                failed = {
+                    result.key
+                    for result in results
+                    if not result.succeeded and result.status_code in RETRYABLE_STATUS
+                }
+                errors = [
+                    result
+                    for result in results
+                    if not result.succeeded and result.key not in failed
+                ]
+                if errors:
+                    raise RuntimeError(
+                        f"Could not upload {len(errors)} documents, "
+                        f"first error: {errors[0].error_message}"
+                    )
+                if not failed:
+                    return
+                if attempt == self.retries:
+                    raise RuntimeError(f"Could not upload {len(failed)} documents")
+                documents = [
+                    document for document in documents if document["id"] in failed
+                ]
+                logger.info(f"Retrying {len(documents)} documents that failed")
+            await asyncio.sleep(random.uniform(0, 2**attempt))
@@ -1,3 +1,4 @@
+import os
 from pydantic import Field
 from typing import Annotated
 from pydantic import BaseModel
@@ -8,6 +9,14 @@ from semantic_kernel.data import (
     VectorStoreRecordVectorField,
 )
 
+# read on import, the entry points load the .env file before they import the models
+
+# the size of the OpenAI vectors, text-embedding-3 vectors can be shortened to
+# for instance 512 or 256 for a smaller index and a faster search
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+# the Ollama vectors keep the size of the model unless this is set
+OLLAMA_EMBEDDING_DIMENSIONS = int(os.getenv("OLLAMA_EMBEDDING_DIMENSIONS", "0")) or None
+
 
 @vectorstoremodel
 class SKDataModel(BaseModel):
@@ -22,7 +31,9 @@ class SKDataModel(BaseModel):
     ]
     embedding: Annotated[
         list[float] | None,
-        VectorStoreRecordVectorField(local_embedding=True, dimensions=1536),
+        VectorStoreRecordVectorField(
+            local_embedding=True, dimensions=EMBEDDING_DIMENSIONS
+        ),
     ] = None
     metadata: Annotated[
         str | None, VectorStoreRecordDataField(is_full_text_searchable=False)
@@ -51,7 +62,9 @@ class SKQdrantDataModel(BaseModel):
     ]
     embedding: Annotated[
         list[float] | None,
-        VectorStoreRecordVectorField(local_embedding=True, dimensions=1536),
+        VectorStoreRecordVectorField(
+            local_embedding=True, dimensions=OLLAMA_EMBEDDING_DIMENSIONS
+        ),
     ] = None
     doc_id: Annotated[str | None, VectorStoreRecordDataField(is_filterable=True)] = None
     topic: Annotated[str | None, VectorStoreRecordDataField(is_filterable=True)] = None
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import weakref
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from pydantic import ConfigDict, PrivateAttr
+
+from numpy_index import truncate
+
+logger = logging.getLogger(__name__)
+
+# settings of the embedder that change how it is called, not the vectors it returns,
+# they are left out of the ingestion cache key so tuning them keeps the cache valid
+TRANSPORT_FIELDS = ("max_retries", "timeout", "embed_batch_size", "num_workers")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Allows `rate` units per minute, with bursts up to one minute worth of units.
+
+    A request for more than a minute worth waits for a full bucket and leaves it in debt,
+    so the callers after it wait until the whole amount has been paid back.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        needed = min(amount, self.rate)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.rate, self._tokens + (now - self._updated) * self.rate / 60
+                )
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((needed - self._tokens) * 60 / self.rate)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that grows by one per window of successes and halves when throttled (AIMD).
+
+    The batches that were in flight together usually fail together, so the limit
+    is halved at most once per `cooldown` seconds.
+    """
+
+    def __init__(
+        self, initial: int, minimum: int = 1, maximum: int = 16, cooldown: float = 1.0
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self._decreased = 0.0
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    async def throttled(self) -> None:
+        async with self._condition:
+            if time.monotonic() - self._decreased < self.cooldown:
+                return
+            self._decreased = time.monotonic()
+            self.limit = max(self.minimum, self.limit / 2)
+            logger.info(f"Throttled, concurrency limit is now {int(self.limit)}")
+
+
+@dataclass
+class BatchStat:
+    size: int
+    tokens: int
+    latency: float
+    attempts: int
+    concurrency: int
+
+
+def is_throttled(exc: BaseException) -> bool:
+    """Rate limits, overloaded backends and timeouts, the errors that are worth a retry."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(
+        getattr(exc, "response", None), "status_code", None
+    )
+    if status in (408, 429, 500, 502, 503, 504):
+        return True
+    name = type(exc).__name__
+    return "RateLimit" in name or "Timeout" in name or "Connection" in name
+
+
+def retry_after(exc: BaseException) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Runtime:
+    """The budgets, the concurrency limit and the texts waiting for a batch, per event loop."""
+
+    def __init__(self, scheduler: "ScheduledEmbedding"):
+        self.requests = TokenBucket(scheduler.requests_per_minute)
+        self.tokens = TokenBucket(scheduler.tokens_per_minute)
+        self.limiter = AdaptiveLimiter(
+            scheduler.concurrency, maximum=scheduler.max_concurrency
+        )
+        self.pending: list[tuple[str, asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        # the loop only keeps weak references to tasks, a running batch must not be collected
+        self.tasks: set[asyncio.Task] = set()
+
+
+class ScheduledEmbedding(TransformComponent):
+    """Embeds the nodes in batches with rate limits, adaptive concurrency and retries.
+
+    Wraps a llama-index embedding model: batches of `batch_size` texts are sent once the
+    request and token per minute budgets allow it, at most `concurrency` at a time. The
+    concurrency limit halves on a rate limit or timeout and slowly grows back. Failed batches
+    are retried with exponential backoff and full jitter. The latency of every batch is kept
+    in `stats`, and appended to `stats_path` as JSON lines when it is set.
+
+    Texts of concurrent calls (for instance one pipeline run per document) are collected for
+    `batch_window` seconds and share full batches, budgets and the concurrency limit.
+
+    With `dimensions` set the vectors are shortened to that size and normalized again, for
+    models that cannot return shorter vectors themselves.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    embed_model: BaseEmbedding
+    batch_size: int = 64
+    requests_per_minute: float = 0
+    tokens_per_minute: float = 0
+    concurrency: int = 2
+    max_concurrency: int = 16
+    max_retries: int = 6
+    timeout: float = 60.0
+    backoff: float = 1.0
+    max_backoff: float = 60.0
+    batch_window: float = 0.05
+    stats_path: str | None = None
+    dimensions: int | None = None
+    _stats: list[BatchStat] = PrivateAttr(default_factory=list)
+    _runtimes: Any = PrivateAttr(default_factory=weakref.WeakKeyDictionary)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledEmbedding"
+
+    def to_dict(self, **kwargs: Any) -> dict[str, Any]:
+        data = self.embed_model.to_dict(**kwargs)
+        for name in TRANSPORT_FIELDS:
+            data.pop(name, None)
+        if self.dimensions:
+            data["dimensions"] = self.dimensions
+        return data
+
+    @property
+    def stats(self) -> list[BatchStat]:
+        return self._stats
+
+    def __call__(self, nodes: list[BaseNode], **kwargs: Any) -> list[BaseNode]:
+        return asyncio.run(self.acall(nodes, **kwargs))
+
+    async def acall(self, nodes: list[BaseNode], **kwargs: Any) -> list[BaseNode]:
+        if not nodes:
+            return nodes
+        runtime = self._runtime()
+        futures = [
+            self._submit(runtime, node.get_content(metadata_mode=MetadataMode.EMBED))
+            for node in nodes
+        ]
+        for node, embedding in zip(nodes, await asyncio.gather(*futures)):
+            node.embedding = embedding
+        return nodes
+
+    def _runtime(self) -> _Runtime:
+        loop = asyncio.get_running_loop()
+        if (runtime := self._runtimes.get(loop)) is None:
+            runtime = _Runtime(self)
+            self._runtimes[loop] = runtime
+        return runtime
+
+    def _submit(self, runtime: _Runtime, text: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        runtime.pending.append((text, future))
+        if len(runtime.pending) >= self.batch_size:
+            self._flush(runtime)
+        elif runtime.timer is None:
+            runtime.timer = loop.call_later(self.batch_window, self._flush, runtime)
+        return future
+
+    def _flush(self, runtime: _Runtime) -> None:
+        if runtime.timer is not None:
+            runtime.timer.cancel()
+            runtime.timer = None
+        while runtime.pending:
+            batch = runtime.pending[: self.batch_size]
+            runtime.pending = runtime.pending[self.batch_size :]
+            task = asyncio.ensure_future(self._run_batch(runtime, batch))
+            runtime.tasks.add(task)
+            task.add_done_callback(runtime.tasks.discard)
+
+    async def _run_batch(
+        self, runtime: _Runtime, batch: list[tuple[str, asyncio.Future]]
+    ) -> None:
+        try:
+            embeddings = await self._embed_batch([text for text, _ in batch], runtime)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _embed_batch(
+        self, texts: list[str], runtime: _Runtime
+    ) -> list[list[float]]:
+        requests, tokens, limiter = runtime.requests, runtime.tokens, runtime.limiter
+        batch_tokens = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            attempt += 1
+            await requests.acquire()
+            await tokens.acquire(batch_tokens)
+            async with limiter:
+                started = time.perf_counter()
+                try:
+                    embeddings = await asyncio.wait_for(
+                        self.embed_model._aget_text_embeddings(texts), self.timeout
+                    )
+                except Exception as exc:
+                    if not is_throttled(exc) or attempt > self.max_retries:
+                        raise
+                    error = exc
+                else:
+                    limiter.success()
+                    self._record(
+                        BatchStat(
+                            size=len(texts),
+                            tokens=batch_tokens,
+                            latency=time.perf_counter() - started,
+                            attempts=attempt,
+                            concurrency=int(limiter.limit),
+                        )
+                    )
+                    if self.dimensions:
+                        return truncate(embeddings, self.dimensions).tolist()
+                    return embeddings
+            await limiter.throttled()
+            delay = retry_after(error) or random.uniform(
+                0, min(self.max_backoff, self.backoff * 2**attempt)
+            )
+            logger.warning(
+                f"Embedding batch failed ({type(error).__name__}), retry {attempt} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+    def _record(self, stat: BatchStat) -> None:
+        self._stats.append(stat)
+        if self.stats_path:
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            with open(self.stats_path, "a") as file:
+                file.write(
+                    json.dumps({"model": self.embed_model.model_name, **asdict(stat)})
+                    + "\n"
+                )
+
+    def report(self, elapsed: float | None = None) -> None:
+        """Logs the throughput and the batch latency of everything embedded so far."""
+        latencies = sorted(stat.latency for stat in self._stats)
+        if not latencies:
+            return
+        count = sum(stat.size for stat in self._stats)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        retries = sum(stat.attempts - 1 for stat in self._stats)
+        rate = f" in {elapsed:.1f}s ({count / elapsed:.1f}/s)" if elapsed else ""
+        logger.info(
+            f"Embedded {count} texts with {self.embed_model.model_name}{rate} in "
+            f"{len(latencies)} batches, latency p50 {p50:.2f}s p95 {p95:.2f}s, "
+            f"{retries} retries"
+        )
+
+
+def get_embedding_scheduler(
+    embed_model: BaseEmbedding, prefix: str, **defaults: Any
+) -> ScheduledEmbedding:
+    """Wraps the embedder in a scheduler configured from the `{prefix}_EMBED_*` variables.
+
+    `defaults` holds the settings for that backend when the variables are not set.
+    """
+    settings = dict(defaults)
+    for name, env, cast in (
+        ("batch_size", "BATCH_SIZE", int),
+        ("requests_per_minute", "RPM", float),
+        ("tokens_per_minute", "TPM", float),
+        ("concurrency", "CONCURRENCY", int),
+        ("max_concurrency", "MAX_CONCURRENCY", int),
+        ("max_retries", "RETRIES", int),
+        ("timeout", "TIMEOUT", float),
+    ):
+        if (value := os.getenv(f"{prefix}_EMBED_{env}")) is not None:
+            settings[name] = cast(value)
+    return ScheduledEmbedding(
+        embed_model=embed_model,
+        stats_path=os.getenv("EMBEDDING_STATS_PATH"),
+        **settings,
+    )
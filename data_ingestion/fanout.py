@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class _End:
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class Fanout:
+    """Hands batches from one producer to several consumers, each through its own bounded queue.
+
+    The producer waits as soon as a consumer is `maxsize` batches behind, so only a few
+    batches are in memory at any time. A consumer that fails keeps draining its queue, so
+    it never blocks the producer or the other consumers.
+    """
+
+    def __init__(self, names: Iterable[str], maxsize: int = 2):
+        self._queues = {name: asyncio.Queue(maxsize=maxsize) for name in names}
+        self._ended: set[str] = set()
+
+    async def put(self, name: str, item: Any) -> None:
+        await self._queues[name].put(item)
+
+    async def close(self, error: BaseException | None = None) -> None:
+        """Ends all consumers, with the error of the producer when it failed."""
+        for queue in self._queues.values():
+            await queue.put(_End(error))
+
+    async def items(self, name: str) -> AsyncIterator[Any]:
+        while not isinstance(item := await self._queues[name].get(), _End):
+            yield item
+        self._ended.add(name)
+        if item.error is not None:
+            raise RuntimeError("The producer failed") from item.error
+
+    async def consume(
+        self, name: str, consumer: Callable[[AsyncIterator[Any]], Awaitable[None]]
+    ) -> None:
+        try:
+            await consumer(self.items(name))
+        except BaseException:
+            if name not in self._ended:
+                await self._drain(name)
+            raise
+
+    async def _drain(self, name: str) -> None:
+        while not isinstance(await self._queues[name].get(), _End):
+            pass
+        self._ended.add(name)
+
+
+async def produce(
+    fanout: Fanout, producer: Callable[[Fanout], Awaitable[None]]
+) -> None:
+    try:
+        await producer(fanout)
+    except BaseException as exc:
+        await fanout.close(exc)
+        raise
+    await fanout.close()
+
+
+def batched(items: list[Any], size: int) -> Iterable[list[Any]]:
+    size = size if size > 0 else max(len(items), 1)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
@@ -1,49 +1,91 @@
 import argparse
 import asyncio
+import copy
 import os
-from contextlib import asynccontextmanager
+import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 import logging
 
 from dotenv.main import logger
+from azure.core.exceptions import ResourceNotFoundError
 import nest_asyncio
-import qdrant_client
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.indexes.aio import SearchIndexClient
-from llama_index.core import (
-    StorageContext,
-    VectorStoreIndex,
-)
 from llama_index.core.extractors import BaseExtractor
 from llama_index.core.ingestion import IngestionCache, IngestionPipeline
 from llama_index.core.node_parser import CodeSplitter
-from llama_index.core.schema import BaseNode
-from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.schema import BaseNode, NodeRelationship
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
 from llama_index.embeddings.ollama import OllamaEmbedding
 from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.readers.github import GithubClient, GithubRepositoryReader
-from llama_index.vector_stores.azureaisearch import (
-    AzureAISearchVectorStore,
-    IndexManagement,
-    MetadataIndexFieldType,
-)
-from llama_index.vector_stores.qdrant import QdrantVectorStore
+from llama_index.readers.github import GithubClient
+from llama_index.vector_stores.azureaisearch import MetadataIndexFieldType
 from tree_sitter import Language, Parser
 from tree_sitter_python import language
 from dotenv import load_dotenv
 
+# before the modules below, they read their settings on import
 load_dotenv()
+
+# the sizes of the data models of the app, the OpenAI vectors are shortened by the API,
+# the Ollama vectors (when set) by the scheduler
+from datamodel import EMBEDDING_DIMENSIONS, OLLAMA_EMBEDDING_DIMENSIONS
+from numpy_index import NumpyVectorIndex
+from bm25_index import BM25Index
+
+# the shared clients are in the root of the repository, next to the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clients import get_client_registry
+from embedding_scheduler import get_embedding_scheduler
+from sqlite_kvstore import get_ingestion_cache_store
+from manifest import Manifest
+from sources import GithubSource, LocalSource, normalize_path
+from fanout import Fanout, batched, produce
+from bulk_writers import (
+    AzureSearchBulkWriter,
+    QdrantBulkWriter,
+    check_dimensions,
+    delete_old_indexes,
+    get_azure_search_index_definition,
+    get_azure_search_vector_algorithm,
+    swap_alias,
+)
+
 nest_asyncio.apply()
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 # logging.basicConfig(level=logging.INFO)
 
-CACHE_PERSIST_PATH = "data_ingestion\\data\\data-new.cache"
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", os.path.join(DATA_PATH, "index"))
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(DATA_PATH, "bm25"))
+MANIFEST_PATH = os.getenv(
+    "INGESTION_MANIFEST_PATH", os.path.join(DATA_PATH, "manifest.json")
+)
+
+SK_OWNER = "microsoft"
+SK_REPO = "semantic-kernel"
+SK_BRANCH = "main"
+SK_DIRECTORIES = ["python/semantic_kernel", "python/samples"]
+SK_EXTENSIONS = [".py"]
+BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "50"))
+QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "2"))
+# none, int8 or binary: used when a Qdrant collection or an Azure index is created,
+# the numpy index is quantized again on every run
+QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+OVERSAMPLING = float(os.getenv("VECTOR_OVERSAMPLING", "4.0"))
+
+# exhaustive or hnsw, used when an Azure index is created, --migrate rebuilds an index
+VECTOR_PROFILE = os.getenv("AZURE_AI_SEARCH_VECTOR_PROFILE", "exhaustive").lower()
+HNSW_M = int(os.getenv("AZURE_AI_SEARCH_HNSW_M", "4"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("AZURE_AI_SEARCH_HNSW_EF_CONSTRUCTION", "400"))
+HNSW_EF_SEARCH = int(os.getenv("AZURE_AI_SEARCH_HNSW_EF_SEARCH", "500"))
 
 search_service_endpoint = os.getenv("AZURE_AI_SEARCH_ENDPOINT")
 index_name = os.getenv("AZURE_AI_SEARCH_INDEX_NAME")
 search_service_api_version = "2024-07-01"
-credential = AzureKeyCredential(os.getenv("AZURE_AI_SEARCH_API_KEY"))
 
 
 metadata_fields = {
@@ -63,11 +105,13 @@ def extract_tag(node: BaseNode) -> dict:
         # topic = semantic_kernel
         # subtopic = memory
         # connector = weaviate
-        topic = filepath.split("\\")[1]
-        subtopic = filepath.split("\\")[2]
-        if "semantic_kernel\\connectors" in filepath:
-            subtopic = filepath.split("\\")[2]
-            connector = filepath.split("\\")[3]
+        # older runs stored Windows paths, so both separators are accepted
+        parts = normalize_path(filepath).split("/")
+        topic = parts[1]
+        subtopic = parts[2]
+        if parts[1:3] == ["semantic_kernel", "connectors"]:
+            subtopic = parts[2]
+            connector = parts[3]
             return {"topic": topic, "subtopic": subtopic, "connector": connector}
         return {"topic": topic, "subtopic": subtopic}
     return {}
@@ -82,72 +126,75 @@ def get_gh_client():
     return GithubClient(github_token=os.getenv("GITHUB_TOKEN"), verbose=False)
 
 
-def get_gh_reader_sk(github_client, folder_filter):
-    return GithubRepositoryReader(
-        github_client=github_client,
-        owner="microsoft",
-        repo="semantic-kernel",
-        use_parser=False,
-        verbose=False,
-        filter_directories=(
-            folder_filter,
-            GithubRepositoryReader.FilterType.INCLUDE,
-        ),
-        filter_file_extensions=(
-            [".py"],
-            GithubRepositoryReader.FilterType.INCLUDE,
+# the clients are shared and closed by the registry when the run is done
+@asynccontextmanager
+async def get_azure_writer(name: str = index_name):
+    clients = get_client_registry()
+    writer = AzureSearchBulkWriter(
+        clients.azure_search_index(),
+        clients.azure_search(name),
+        get_azure_search_index_definition(
+            name,
+            EMBEDDING_DIMENSIONS,
+            list(metadata_fields),
+            QUANTIZATION,
+            OVERSAMPLING,
+            get_azure_search_vector_algorithm(
+                VECTOR_PROFILE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
+            ),
         ),
+        batch_size=int(os.getenv("AZURE_AI_SEARCH_BATCH_SIZE", "200")),
+        parallel=int(os.getenv("AZURE_AI_SEARCH_PARALLEL", "4")),
     )
+    await writer.ensure_index()
+    yield writer
 
 
 @asynccontextmanager
-async def get_azure_store():
-    # Use index client to demonstrate creating an index
-    async with SearchIndexClient(
-        endpoint=search_service_endpoint,
-        credential=credential,
-    ) as index_client:
-        yield AzureAISearchVectorStore(
-            search_or_index_client=index_client,
-            filterable_metadata_field_keys=metadata_fields,
-            index_name=index_name,
-            index_management=IndexManagement.CREATE_IF_NOT_EXISTS,
-            id_field_key="id",
-            chunk_field_key="chunk",
-            embedding_field_key="embedding",
-            embedding_dimensionality=1536,
-            metadata_string_field_key="metadata",
-            doc_id_field_key="doc_id",
-            language_analyzer="en.lucene",
-            vector_algorithm_type="exhaustiveKnn",
-        )
-
-
-@asynccontextmanager
-async def get_qdrant_store():
-    client = qdrant_client.AsyncQdrantClient(
-        host=os.getenv("QDRANT_HOST"),
-        port=os.getenv("QDRANT_PORT"),
-        grpc_port=os.getenv("QDRANT_GRPC_PORT"),
-        prefer_grpc=False,
+async def get_qdrant_writer():
+    client = get_client_registry().qdrant(
+        prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+    )
+    yield QdrantBulkWriter(
+        client,
+        "sk",
+        batch_size=int(os.getenv("QDRANT_BATCH_SIZE", "256")),
+        parallel=int(os.getenv("QDRANT_PARALLEL", "4")),
+        quantization=QUANTIZATION,
     )
-    yield QdrantVectorStore(collection_name="sk", aclient=client, index_doc_id=False)
-    await client.close()
 
 
 def openai_embedder():
-    return OpenAIEmbedding(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model_name=os.getenv("OPENAI_EMBEDDING_MODEL_ID"),
-        dimensions=1536,
+    return get_embedding_scheduler(
+        OpenAIEmbedding(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            model_name=os.getenv("OPENAI_EMBEDDING_MODEL_ID"),
+            dimensions=EMBEDDING_DIMENSIONS,
+            # the scheduler retries, so it sees the rate limits
+            max_retries=0,
+        ),
+        "OPENAI",
+        batch_size=100,
+        requests_per_minute=3000,
+        tokens_per_minute=1_000_000,
+        concurrency=4,
+        max_concurrency=16,
     )
 
 
 def ollama_embedder():
-    return OllamaEmbedding(model_name=os.getenv("OLLAMA_EMBEDDING_MODEL"))
+    return get_embedding_scheduler(
+        OllamaEmbedding(model_name=os.getenv("OLLAMA_EMBEDDING_MODEL")),
+        "OLLAMA",
+        batch_size=16,
+        concurrency=1,
+        max_concurrency=4,
+        timeout=120.0,
+        dimensions=OLLAMA_EMBEDDING_DIMENSIONS,
+    )
 
 
-def get_sk_pipeline(cache, embedder):
+def get_split_pipeline(cache):
     lang = Language(language())
     parser = Parser(lang)
 
@@ -161,81 +208,354 @@ def get_sk_pipeline(cache, embedder):
                 max_chars=2000,
             ),
             TagExtractor(),
-            embedder,
         ],
         cache=IngestionCache(cache=cache),
     )
 
 
-async def get_nodes(reader: GithubRepositoryReader, pipeline: IngestionPipeline):
-    return await pipeline.arun(
-        show_progress=True, documents=await reader.aload_data(branch="main")
+def get_embed_pipeline(cache, embedder):
+    # the cache is per transformation, so the split and embed pipelines hit the same
+    # entries as a single pipeline with all three transformations
+    return IngestionPipeline(
+        transformations=[embedder], cache=IngestionCache(cache=cache)
     )
 
 
-async def get_azure_search_index(nodes):
-    async with get_azure_store() as azure_ai_search_store:
-        VectorStoreIndex(
-            nodes=nodes,
-            storage_context=StorageContext.from_defaults(
-                vector_store=azure_ai_search_store
-            ),
-            vector_store_name="azure",
-            metadata_fields=metadata_fields,
-            id_field_key="id",
-            chunk_field_key="chunk",
-            embedding_field_key="embedding",
-            doc_id_field_key="doc_id",
-            show_progress=True,
-            use_async=True,
-        )
+def document_path(document) -> str:
+    return normalize_path(document.metadata["file_path"])
+
+
+def get_changes(files, manifest: Manifest, targets: list[str], incremental: bool):
+    """Selects the paths a group of targets needs and the stale document ids per target.
+
+    A full run processes all files, an incremental run the changed ones; both remove the
+    files that are gone and the old version of every file they process again, otherwise the
+    old chunks of a changed file stay next to the new ones.
+    """
+    if incremental:
+        paths = set().union(*(manifest.changed(target, files) for target in targets))
+    else:
+        paths = set(files)
+    stale = {target: manifest.stale(target, files, paths) for target in targets}
+    return paths, stale
+
+
+async def get_nodes(pipeline: IngestionPipeline, documents):
+    # one run per document, so the cache has an entry per document that is written
+    # as soon as that document is done and survives a crash halfway the run
+    results = await asyncio.gather(
+        *[pipeline.arun(documents=[document]) for document in documents]
+    )
+    # cached splits keep the document id they were made with, which may be a blob SHA
+    for document, nodes in zip(documents, results):
+        for node in nodes:
+            node.relationships[NodeRelationship.SOURCE] = (
+                document.as_related_node_info()
+            )
+    return [node for nodes in results for node in nodes]
+
+
+async def embed_nodes(pipeline: IngestionPipeline, nodes, documents):
+    """Embeds a copy of the split nodes of `documents`, so every branch gets its own embeddings.
+
+    The nodes are embedded per document (for the cache), the scheduler combines
+    the texts of the concurrent runs into full batches.
+    """
+    doc_ids = {document.doc_id for document in documents}
+    per_document = {}
+    for node in nodes:
+        if node.ref_doc_id in doc_ids:
+            per_document.setdefault(node.ref_doc_id, []).append(copy.deepcopy(node))
+    results = await asyncio.gather(
+        *[pipeline.arun(nodes=doc_nodes) for doc_nodes in per_document.values()]
+    )
+    return [node for nodes in results for node in nodes]
+
+
+@asynccontextmanager
+async def azure_writer(stale_doc_ids=(), name: str = index_name):
+    async with get_azure_writer(name) as writer:
+        await writer.delete_documents(list(stale_doc_ids))
+        yield writer.write
+        writer.report()
+
+
+@asynccontextmanager
+async def qdrant_writer(stale_doc_ids=()):
+    async with get_qdrant_writer() as writer:
+        await writer.delete_documents(list(stale_doc_ids))
+        yield writer.write
+        writer.report()
+
+
+@asynccontextmanager
+async def keyword_writer(name: str, stale_doc_ids=None):
+    """Writes the BM25 index used for hybrid search, with the ids the vector store uses.
+
+    With `stale_doc_ids` the existing index is updated instead of replaced,
+    it is saved when all batches are written. Unlike the stores, the whole index is kept
+    in memory until then (like the app does when it loads it), so it is only built with `--bm25`.
+    """
+    path = os.path.join(BM25_INDEX_PATH, f"{name}.json.gz")
+    if stale_doc_ids is not None and os.path.exists(path):
+        index = BM25Index.load(path).without_documents(stale_doc_ids)
+    else:
+        index = BM25Index()
+
+    async def write(nodes):
+        for node in nodes:
+            index.add(node.node_id, node.get_content(), node.metadata, node.ref_doc_id)
 
+    yield write
+    index.save(path)
 
-async def get_qdrant_index(nodes):
-    async with get_qdrant_store() as qdrant_store:
-        VectorStoreIndex(
-            nodes=nodes,
-            storage_context=StorageContext.from_defaults(vector_store=qdrant_store),
-            vector_store_name="qdrant",
-            metadata_fields=metadata_fields,
-            id_field_key="id",
-            chunk_field_key="chunk",
-            embedding_field_key="embedding",
-            doc_id_field_key="doc_id",
-            show_progress=True,
-            use_async=True,
+
+@asynccontextmanager
+async def numpy_writer(stale_doc_ids=()):
+    """Writes the offline embeddings to the numpy index, which is only written with `--numpy`.
+
+    The index is a single matrix that is kept in memory and saved when all batches are written.
+    """
+    path = os.path.join(NUMPY_INDEX_PATH, "sk")
+    index = (
+        NumpyVectorIndex.open(path, QUANTIZATION)
+        if NumpyVectorIndex.exists(path)
+        else None
+    )
+    if index is not None and stale_doc_ids:
+        index.delete_where("ref_doc_id", set(stale_doc_ids))
+
+    async def write(nodes):
+        nonlocal index
+        if not nodes:
+            return
+        dimensions = len(nodes[0].get_embedding())
+        if index is None:
+            index = NumpyVectorIndex(path, dimensions, QUANTIZATION)
+        check_dimensions(
+            f"Numpy index {path}",
+            index.dimensions,
+            dimensions,
+            "OLLAMA_EMBEDDING_DIMENSIONS",
+        )
+        index.upsert(
+            [node.node_id for node in nodes],
+            [node.get_embedding() for node in nodes],
+            [
+                node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+                for node in nodes
+            ],
         )
 
+    yield write
+    if index is not None:
+        index.save()
+
+
+async def run_branch(
+    name, batches, pipeline, writers, manifest, files, stream_targets, targets
+):
+    """Embeds the batches of one branch and writes them to its stores as they come in.
+
+    The files of every batch are recorded for the stores that are written directly
+    (`stream_targets`), the others are recorded when all batches are written.
+    """
+    start = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        writes = [await stack.enter_async_context(writer) for writer in writers]
+        async for documents, nodes in batches:
+            embedded = await embed_nodes(pipeline, nodes, documents)
+            await asyncio.gather(*[write(embedded) for write in writes])
+            manifest.record(
+                stream_targets,
+                {
+                    document_path(document): files[document_path(document)]
+                    for document in documents
+                },
+            )
+    manifest.update(targets, files)
+    pipeline.transformations[0].report(time.perf_counter() - start)
+    logger.info(f"Branch {name} done in {time.perf_counter() - start:.1f}s")
+
+
+async def get_migration_index_name(alias_name: str) -> str:
+    """The name of the index a migration builds, the alias serves the current index meanwhile."""
+    try:
+        await get_client_registry().azure_search_index().get_index(alias_name)
+    except ResourceNotFoundError:
+        return f"{alias_name}-{time.strftime('%Y%m%d%H%M%S')}"
+    # an alias cannot take the name of an index, the first migration needs a new name
+    raise ValueError(
+        f"{alias_name} is an index, a migration needs the name of an alias: set "
+        "AZURE_AI_SEARCH_INDEX_NAME to a new name, migrate and then point the app at it"
+    )
 
-async def main(azure: bool = True, qdrant: bool = True):
-    gh_client = get_gh_client()
-    # Get the github reader
-    sk_reader = get_gh_reader_sk(
-        gh_client, ["python\\semantic_kernel", "python\\samples"]
+
+async def finish_migration(new_index: str) -> None:
+    """Points the alias at the new index, the previous one stays until --delete-old-indexes."""
+    previous = await swap_alias(
+        get_client_registry().azure_search_index(), index_name, new_index
     )
+    if previous and previous != new_index:
+        logger.info(
+            f"Kept the previous index {previous}, run with --delete-old-indexes "
+            "to delete it once the searches no longer use it"
+        )
 
-    # use the cache to only load from Github once
-    if os.path.exists(CACHE_PERSIST_PATH) and os.path.getsize(CACHE_PERSIST_PATH) > 0:
-        logger.info("Loading cache from file")
-        cache = SimpleKVStore.from_persist_path(CACHE_PERSIST_PATH)
+
+async def main(
+    azure: bool = True,
+    qdrant: bool = True,
+    numpy: bool = False,
+    bm25: bool = False,
+    incremental: bool = False,
+    batch_size: int = BATCH_SIZE,
+    local_path: str | None = None,
+    migrate: bool = False,
+    delete_old: bool = False,
+):
+    if delete_old:
+        # a separate step, the searches that started before a swap may still use the old index
+        await delete_old_indexes(get_client_registry().azure_search_index(), index_name)
+        return
+
+    # a local clone or tarball needs no GitHub token and no network
+    if local_path:
+        source = LocalSource(
+            local_path,
+            SK_DIRECTORIES,
+            SK_EXTENSIONS,
+            url=f"https://github.com/{SK_OWNER}/{SK_REPO}/blob/{SK_BRANCH}",
+        )
     else:
-        logger.info("Creating new cache")
-        cache = SimpleKVStore()
+        source = GithubSource(
+            get_gh_client(), SK_OWNER, SK_REPO, SK_BRANCH, SK_DIRECTORIES, SK_EXTENSIONS
+        )
+
+    # the splits and embeddings are cached on disk, a re-run only computes what is new
+    cache = get_ingestion_cache_store()
+
+    # the manifest records per target which version of each file it has
+    manifest = Manifest.load(MANIFEST_PATH)
+    files = await source.list_files()
 
+    branches = {}
     if azure:
-        # Load the pipelines with the right embeddings models
-        az_sk_pipeline = get_sk_pipeline(cache, openai_embedder())
-        # load the nodes from github
-        az_sk_nodes = await get_nodes(sk_reader, az_sk_pipeline)
-        # index the nodes
-        await get_azure_search_index(az_sk_nodes)
-    if qdrant:
-        # Load the pipelines with the right embeddings models
-        qd_sk_pipeline = get_sk_pipeline(cache, ollama_embedder())
-        # load the nodes from github
-        qd_sk_nodes = await get_nodes(sk_reader, qd_sk_pipeline)
-        # index the nodes
-        await get_qdrant_index(qd_sk_nodes)
+        # a migration fills a new index with all files, the embeddings come from the cache
+        azure_index = (
+            await get_migration_index_name(index_name) if migrate else index_name
+        )
+        azure_incremental = incremental and not migrate
+        targets = ["azure", "bm25_azure"] if bm25 else ["azure"]
+        paths, stale = get_changes(files, manifest, targets, azure_incremental)
+        writers = [azure_writer(stale["azure"], azure_index)]
+        if bm25:
+            writers.append(
+                keyword_writer(
+                    "azure", stale["bm25_azure"] if azure_incremental else None
+                )
+            )
+        branches["online"] = dict(
+            paths=paths,
+            pipeline=get_embed_pipeline(cache, openai_embedder()),
+            writers=writers,
+            stream_targets=["azure"],
+            targets=targets,
+        )
+    if qdrant or numpy:
+        targets = [
+            name
+            for name, on in (
+                ("qdrant", qdrant),
+                ("numpy", numpy),
+                ("bm25_qdrant", bm25),
+            )
+            if on
+        ]
+        paths, stale = get_changes(files, manifest, targets, incremental)
+        writers = []
+        if bm25:
+            writers.append(
+                keyword_writer("qdrant", stale["bm25_qdrant"] if incremental else None)
+            )
+        if qdrant:
+            writers.append(qdrant_writer(stale["qdrant"]))
+        if numpy:
+            writers.append(numpy_writer(stale["numpy"]))
+        branches["offline"] = dict(
+            paths=paths,
+            pipeline=get_embed_pipeline(cache, ollama_embedder()),
+            writers=writers,
+            stream_targets=["qdrant"] if qdrant else [],
+            targets=targets,
+        )
+
+    needed = sorted(set().union(*(branch["paths"] for branch in branches.values())))
+    logger.info(f"Ingesting {len(needed)} of {len(files)} files")
+
+    async def producer(fanout: Fanout):
+        # download and split once, in batches, each branch gets the batches it needs
+        split_pipeline = get_split_pipeline(cache)
+        for paths in batched(needed, batch_size):
+            documents = await source.fetch({path: files[path] for path in paths})
+            nodes = await get_nodes(split_pipeline, documents)
+            for name, branch in branches.items():
+                selected = [
+                    document
+                    for document in documents
+                    if document_path(document) in branch["paths"]
+                ]
+                if selected:
+                    # waits while the branch is still busy with earlier batches
+                    await fanout.put(name, (selected, nodes))
+
+    # the embedders and stores are independent, so the branches run side by side
+    fanout = Fanout(branches, maxsize=QUEUE_SIZE)
+    results = await asyncio.gather(
+        produce(fanout, producer),
+        *[
+            fanout.consume(
+                name,
+                lambda batches, name=name, branch=branch: run_branch(
+                    name,
+                    batches,
+                    branch["pipeline"],
+                    branch["writers"],
+                    manifest,
+                    files,
+                    branch["stream_targets"],
+                    branch["targets"],
+                ),
+            )
+            for name, branch in branches.items()
+        ],
+        return_exceptions=True,
+    )
+    # a failing branch does not stop the other one, it still records its manifest
+    errors = [result for result in results if isinstance(result, BaseException)]
+    failed = set()
+    for name, result in zip(["download", *branches], results):
+        if isinstance(result, BaseException):
+            logger.error(f"{name} failed: {result}")
+            failed.add(name)
+    if azure and migrate:
+        if failed & {"download", "online"}:
+            logger.warning(
+                f"The alias {index_name} still points at the previous index, "
+                f"index {azure_index} is incomplete"
+            )
+        else:
+            await finish_migration(azure_index)
+    if errors:
+        raise errors[0]
+
+
+async def run(**kwargs):
+    """Runs the ingestion and closes the shared clients, also when it fails."""
+    try:
+        await main(**kwargs)
+    finally:
+        await get_client_registry().close()
 
 
 if __name__ == "__main__":
@@ -249,6 +569,55 @@ if __name__ == "__main__":
         dest="qdrant",
         help="Disable Qdrant indexing",
     )
+    parser.add_argument(
+        "--numpy",
+        action="store_true",
+        help="Also write the offline embeddings to the local numpy index",
+    )
+    parser.add_argument(
+        "--bm25",
+        action="store_true",
+        help="Also write the BM25 keyword indexes for hybrid search",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Files per batch that flow through the pipeline, 0 for a single batch",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only ingest the files that changed since the last run",
+    )
+    parser.add_argument(
+        "--local-path",
+        default=os.getenv("INGESTION_LOCAL_PATH"),
+        help="Read the files from a local clone or a .tar.gz of the repository instead of GitHub",
+    )
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Build a new Azure AI Search index and point the AZURE_AI_SEARCH_INDEX_NAME alias at it",
+    )
+    parser.add_argument(
+        "--delete-old-indexes",
+        action="store_true",
+        dest="delete_old",
+        help="Only delete the indexes of earlier migrations the alias no longer points at",
+    )
     args = parser.parse_args()
 
-    asyncio.run(main(azure=args.azure, qdrant=args.qdrant))
+    asyncio.run(
+        run(
+            azure=args.azure,
+            qdrant=args.qdrant,
+            numpy=args.numpy,
+            bm25=args.bm25,
+            incremental=args.incremental,
+            batch_size=args.batch_size,
+            local_path=args.local_path,
+            migrate=args.migrate,
+            delete_old=args.delete_old,
+        )
+    )
@@ -0,0 +1,52 @@
+import json
+import os
+from collections.abc import Iterable
+
+
+class Manifest:
+    """File path to blob SHA of the last successful run, kept per target (store or index).
+
+    The SHA only tells whether a file changed, the records of a file are keyed (and
+    deleted) by its path, which is the document id: identical files share a SHA.
+    """
+
+    def __init__(self, path: str, targets: dict[str, dict[str, str]] | None = None):
+        self.path = path
+        self.targets = targets or {}
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path) as file:
+            return cls(path, json.load(file))
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as file:
+            json.dump(self.targets, file, indent=1, sort_keys=True)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def changed(self, target: str, files: dict[str, str]) -> set[str]:
+        """The paths in `files` that the target does not have at that SHA."""
+        known = self.targets.get(target, {})
+        return {path for path, sha in files.items() if known.get(path) != sha}
+
+    def stale(
+        self, target: str, files: dict[str, str], processed: Iterable[str] = ()
+    ) -> set[str]:
+        """The document ids (paths) in the target of removed files and of the files that are processed again."""
+        known = self.targets.get(target, {})
+        processed = set(processed)
+        return {path for path in known if path not in files or path in processed}
+
+    def record(self, targets: Iterable[str], files: dict[str, str]) -> None:
+        """Adds the files that were written to the targets, while a run is underway."""
+        for target in targets:
+            self.targets.setdefault(target, {}).update(files)
+        self.save()
+
+    def update(self, targets: Iterable[str], files: dict[str, str]) -> None:
+        for target in targets:
+            self.targets[target] = dict(files)
+        self.save()
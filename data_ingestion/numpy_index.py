@@ -0,0 +1,417 @@
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+PAYLOAD_FILE = "payload.json"
+META_FILE = "meta.json"
+CODES_FILES = {"int8": "codes.i8", "binary": "codes.u1"}
+QUANTIZATIONS = ("none", *CODES_FILES)
+# rows of int8 codes widened to float32 at a time, small enough to stay in the CPU cache
+CHUNK_ROWS = 256
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def quantize(
+    vectors: np.ndarray, quantization: str
+) -> tuple[np.ndarray, np.ndarray | None]:
+    """The int8 codes with the scale per dimension, or the packed sign bits without a scale."""
+    chunks = range(0, len(vectors), CHUNK_ROWS)
+    if quantization == "binary":
+        codes = [
+            np.packbits(vectors[start : start + CHUNK_ROWS] > 0, axis=1)
+            for start in chunks
+        ]
+        empty = np.empty((0, (vectors.shape[1] + 7) // 8), dtype=np.uint8)
+        return np.concatenate(codes or [empty]), None
+    if quantization != "int8":
+        raise ValueError(f"Unknown quantization {quantization}")
+    scale = np.zeros(vectors.shape[1], dtype=np.float32)
+    for start in chunks:
+        np.maximum(
+            scale, np.abs(vectors[start : start + CHUNK_ROWS]).max(axis=0), out=scale
+        )
+    scale = np.where(scale > 0, scale / 127, 1.0).astype(np.float32)
+    codes = [
+        np.clip(np.rint(vectors[start : start + CHUNK_ROWS] / scale), -127, 127)
+        for start in chunks
+    ]
+    return (
+        np.concatenate(codes or [np.empty((0, vectors.shape[1]))]).astype(np.int8),
+        scale,
+    )
+
+
+def truncate(vectors: Any, dimensions: int | None) -> np.ndarray:
+    """The first `dimensions` values of every vector, normalized again.
+
+    This is how Matryoshka embeddings (like OpenAI text-embedding-3) are shortened,
+    `None` keeps the vectors as they are.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions is None or vectors.shape[-1] <= dimensions:
+        return vectors
+    vectors = vectors[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class NumpyVectorIndex:
+    """An embedded vector index, without a service to run.
+
+    The vectors are stored normalized in a float32 matrix that is memory mapped when read,
+    the payload is stored per column in a JSON side file. Searching is a matrix product
+    over the rows that pass the (equality) pre-filter, followed by a partial sort for the top k.
+
+    With `quantization` set to `int8` (a scale per dimension) or `binary` (the sign bits),
+    the search first scans the compact codes for `oversampling` times the wanted results
+    and then rescores those candidates with the full precision vectors, which are only
+    read for the candidates.
+
+    Without `dimensions` the size of the vectors is taken from the first upsert. A save writes
+    all files into a new generation directory, which only becomes the index when the meta file
+    that points to it is replaced, so a crash halfway never leaves a mixed set of files.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dimensions: int | None,
+        quantization: str = "none",
+        oversampling: float = 4.0,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization}")
+        self.path = path
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self.ids: list[str] = []
+        self.columns: dict[str, list[Any]] = {}
+        self._vectors = np.empty((0, dimensions or 0), dtype=np.float32)
+        self._buffer: np.ndarray | None = None
+        self._rows: dict[str, int] = {}
+        self._masks: dict[tuple[str, str], np.ndarray] = {}
+        self._codes: np.ndarray | None = None
+        self._scale: np.ndarray | None = None
+        self._lock = threading.Lock()
+        self._codes_lock = threading.Lock()
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        quantization: str | None = None,
+        oversampling: float = 4.0,
+    ) -> "NumpyVectorIndex":
+        """Opens a saved index, with the quantization it was saved with unless one is given."""
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+        saved = meta.get("quantization", "none")
+        index = cls(path, meta["dimensions"], quantization or saved, oversampling)
+        # indexes saved before the generations keep their files next to the meta file
+        files = os.path.join(path, meta.get("generation", ""))
+        with open(os.path.join(files, PAYLOAD_FILE)) as file:
+            payload = json.load(file)
+        index.ids = payload.pop("id")
+        index.columns = payload
+        index._rows = {key: row for row, key in enumerate(index.ids)}
+        if index.ids:
+            index._vectors = np.memmap(
+                os.path.join(files, VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(index.ids), index.dimensions),
+            )
+            if index.quantization == saved and saved != "none":
+                index._codes = np.memmap(
+                    os.path.join(files, CODES_FILES[saved]),
+                    dtype=np.int8 if saved == "int8" else np.uint8,
+                    mode="r",
+                    shape=(len(index.ids), meta["code_size"]),
+                )
+                if meta.get("scale") is not None:
+                    index._scale = np.asarray(meta["scale"], dtype=np.float32)
+        return index
+
+    @classmethod
+    def open_or_create(
+        cls,
+        path: str,
+        dimensions: int | None,
+        quantization: str | None = None,
+        oversampling: float = 4.0,
+    ) -> "NumpyVectorIndex":
+        if cls.exists(path):
+            return cls.open(path, quantization, oversampling)
+        return cls(path, dimensions, quantization or "none", oversampling)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]] | np.ndarray,
+        payloads: Sequence[dict[str, Any]],
+    ) -> None:
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.dimensions is None and not self.ids:
+                self.dimensions = matrix.shape[1]
+                self._vectors = np.empty((0, self.dimensions), dtype=np.float32)
+            if matrix.shape[1] != self.dimensions:
+                raise ValueError(
+                    f"The vectors have {matrix.shape[1]} dimensions, "
+                    f"the index in {self.path} {self.dimensions}"
+                )
+            self._reserve(len(self.ids) + len(ids))
+            for key, vector, payload in zip(ids, matrix, payloads):
+                if (row := self._rows.get(key)) is None:
+                    row = len(self.ids)
+                    self.ids.append(key)
+                    self._rows[key] = row
+                    for column in self.columns.values():
+                        column.append(None)
+                self._buffer[row] = vector
+                for name, value in payload.items():
+                    column = self.columns.setdefault(name, [None] * len(self.ids))
+                    column[row] = value
+            self._vectors = self._buffer[: len(self.ids)]
+            self._masks.clear()
+            self._codes = None
+
+    def _reserve(self, size: int) -> None:
+        """Makes sure the writable buffer can hold `size` rows, growing it by doubling."""
+        if self._buffer is not None and len(self._buffer) >= size:
+            return
+        buffer = np.empty(
+            (max(size, 2 * len(self.ids), 1024), self.dimensions), dtype=np.float32
+        )
+        buffer[: len(self.ids)] = self._vectors[: len(self.ids)]
+        self._buffer = buffer
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            rows = sorted(self._rows[key] for key in ids if key in self._rows)
+            if not rows:
+                return
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[rows] = False
+            self._vectors = np.array(self._vectors)[keep]
+            self._buffer = None
+            self.ids = [key for key, kept in zip(self.ids, keep) if kept]
+            self.columns = {
+                name: [value for value, kept in zip(column, keep) if kept]
+                for name, column in self.columns.items()
+            }
+            self._rows = {key: row for row, key in enumerate(self.ids)}
+            self._masks.clear()
+            self._codes = None
+
+    def delete_where(self, name: str, values: set[str]) -> None:
+        """Deletes the rows where the payload field `name` is one of `values`."""
+        column = self.columns.get(name, [])
+        self.delete([key for key, value in zip(self.ids, column) if value in values])
+
+    def get(self, ids: Sequence[str], include_vectors: bool = False) -> list[dict]:
+        return [
+            self.record(self._rows[key], include_vectors=include_vectors)
+            for key in ids
+            if key in self._rows
+        ]
+
+    def record(self, row: int, include_vectors: bool = False) -> dict[str, Any]:
+        record = {"id": self.ids[row]}
+        record.update({name: column[row] for name, column in self.columns.items()})
+        if include_vectors:
+            record["embedding"] = self._vectors[row].tolist()
+        return record
+
+    def search(
+        self,
+        vector: Sequence[float] | np.ndarray,
+        top: int = 3,
+        skip: int = 0,
+        filters: dict[str, str] | None = None,
+    ) -> list[tuple[int, float]]:
+        """Returns (row, cosine similarity) of the best matches for a single vector."""
+        return self.search_batch(
+            np.asarray(vector, dtype=np.float32)[None, :], top, skip, filters
+        )[0]
+
+    def search_batch(
+        self,
+        vectors: np.ndarray,
+        top: int = 3,
+        skip: int = 0,
+        filters: dict[str, str] | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """Searches a batch of vectors with a single matrix product."""
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+        rows = self._filter_rows(filters)
+        count = len(self.ids) if rows is None else len(rows)
+        if count == 0:
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != self.dimensions:
+            raise ValueError(
+                f"The query has {queries.shape[1]} dimensions, "
+                f"the index in {self.path} {self.dimensions}"
+            )
+        k = min(top + skip, count)
+        shortlist = min(count, math.ceil(k * self.oversampling))
+        results = []
+        if self.quantization == "none" or shortlist >= count:
+            candidates = self._vectors if rows is None else self._vectors[rows]
+            scores = queries @ candidates.T
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for query_scores, query_best in zip(scores, best):
+                results.append(
+                    self._ranked(
+                        query_best if rows is None else rows[query_best],
+                        query_scores[query_best],
+                        skip,
+                    )
+                )
+            return results
+        coarse = self._coarse_scores(queries, rows)
+        shortlists = np.argpartition(-coarse, shortlist - 1, axis=1)[:, :shortlist]
+        for query, positions in zip(queries, shortlists):
+            # only the rows of the candidates are read from the full precision vectors
+            candidate_rows = np.sort(positions if rows is None else rows[positions])
+            scores = self._vectors[candidate_rows] @ query
+            best = np.argpartition(-scores, k - 1)[:k]
+            results.append(self._ranked(candidate_rows[best], scores[best], skip))
+        return results
+
+    @staticmethod
+    def _ranked(
+        rows: np.ndarray, scores: np.ndarray, skip: int
+    ) -> list[tuple[int, float]]:
+        order = np.argsort(-scores)[skip:]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def _coarse_scores(
+        self, queries: np.ndarray, rows: np.ndarray | None
+    ) -> np.ndarray:
+        """Scores of the queries against the codes, only good enough to pick candidates."""
+        codes = self.codes
+        if rows is not None:
+            codes = codes[rows]
+        if self.quantization == "int8":
+            weighted = (queries * self._scale).T
+            return np.concatenate(
+                [
+                    codes[start : start + CHUNK_ROWS].astype(np.float32) @ weighted
+                    for start in range(0, len(codes), CHUNK_ROWS)
+                ]
+            ).T
+        # fewer differing sign bits is closer, negated so higher is better
+        bits = np.packbits(queries > 0, axis=1)
+        return -np.stack(
+            [_POPCOUNT[codes ^ query].sum(axis=1, dtype=np.int32) for query in bits]
+        )
+
+    @property
+    def codes(self) -> np.ndarray:
+        """The quantized vectors, computed again after a change to the vectors."""
+        with self._codes_lock:
+            if self._codes is None:
+                self._codes, self._scale = quantize(self._vectors, self.quantization)
+            return self._codes
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the matrix the candidate search scans."""
+        if self.quantization == "none":
+            return len(self.ids) * self.dimensions * 4
+        return self.codes.nbytes
+
+    def save(self) -> None:
+        """Writes the index to a new generation directory and then switches the meta file to it."""
+        os.makedirs(self.path, exist_ok=True)
+        generation = f"generation-{time.time_ns()}"
+        files = os.path.join(self.path, generation)
+        os.makedirs(files)
+        meta = {
+            "dimensions": self.dimensions,
+            "quantization": self.quantization,
+            "generation": generation,
+        }
+        if self.quantization != "none" and self.ids:
+            codes = self.codes
+            self._write(os.path.join(files, CODES_FILES[self.quantization]), codes)
+            meta["code_size"] = codes.shape[1]
+            if self._scale is not None:
+                meta["scale"] = self._scale.tolist()
+        with self._lock:
+            vectors = np.ascontiguousarray(self._vectors, dtype=np.float32)
+            self._write(os.path.join(files, VECTORS_FILE), vectors)
+            self._write(
+                os.path.join(files, PAYLOAD_FILE),
+                json.dumps({"id": self.ids, **self.columns}),
+            )
+            target = os.path.join(self.path, META_FILE)
+            self._write(f"{target}.tmp", json.dumps({**meta, "count": len(self.ids)}))
+            os.replace(f"{target}.tmp", target)
+        self._remove_old_files(generation)
+        logger.info(f"Saved {len(self.ids)} vectors to {self.path}")
+
+    def _remove_old_files(self, generation: str) -> None:
+        """Removes the generations (and flat files of older versions) the meta file no longer points to."""
+        for name in os.listdir(self.path):
+            full = os.path.join(self.path, name)
+            if name.startswith("generation-") and name != generation:
+                # open readers keep their memory maps, the files go when those are closed
+                shutil.rmtree(full, ignore_errors=True)
+            elif name in (VECTORS_FILE, PAYLOAD_FILE, *CODES_FILES.values()):
+                os.remove(full)
+
+    def drop(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.ids, self.columns, self._rows = [], {}, {}
+        self._vectors = np.empty((0, self.dimensions or 0), dtype=np.float32)
+        self._buffer = None
+        self._masks.clear()
+        self._codes = None
+
+    def _filter_rows(self, filters: dict[str, str] | None) -> np.ndarray | None:
+        if not filters:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for name, value in filters.items():
+            key = (name, value)
+            if key not in self._masks:
+                column = self.columns.get(name, [None] * len(self.ids))
+                self._masks[key] = np.fromiter(
+                    (item == value for item in column), dtype=bool, count=len(column)
+                )
+            mask &= self._masks[key]
+        return np.flatnonzero(mask)
+
+    @staticmethod
+    def _write(target: str, data: np.ndarray | str) -> None:
+        with open(target, "w" if isinstance(data, str) else "wb") as file:
+            file.write(data if isinstance(data, str) else data.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
@@ -0,0 +1,215 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core import Document
+from llama_index.readers.github import GithubClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKOUT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "checkouts"
+)
+
+
+def normalize_path(path: str) -> str:
+    return path.replace("\\", "/")
+
+
+def _under(path: str, directories: list[str]) -> bool:
+    return any(
+        path == folder or path.startswith(f"{folder}/") for folder in directories
+    )
+
+
+def _leads_to(path: str, directories: list[str]) -> bool:
+    return _under(path, directories) or any(
+        folder.startswith(f"{path}/") for folder in directories
+    )
+
+
+def _document(text: str, path: str, url: str | None) -> Document:
+    # the path is the document id, identical files share a blob SHA but not a path
+    metadata = {"file_path": path, "file_name": path.split("/")[-1]}
+    if url:
+        metadata["url"] = url
+    return Document(text=text, doc_id=path, metadata=metadata)
+
+
+def git_blob_sha(content: bytes) -> str:
+    """The SHA git gives the file, so local files are compared with the same version as on GitHub."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class GithubSource:
+    """Lists the files through the git trees of the GitHub API and downloads the blobs."""
+
+    def __init__(
+        self,
+        client: GithubClient,
+        owner: str,
+        repo: str,
+        branch: str,
+        directories: list[str],
+        extensions: list[str],
+        concurrency: int = 8,
+    ):
+        self.client = client
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.directories = [normalize_path(folder).strip("/") for folder in directories]
+        self.extensions = extensions
+        self.concurrency = concurrency
+
+    async def list_files(self) -> dict[str, str]:
+        """Lists path -> blob SHA of the files in the directories, only reading the git trees."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        files: dict[str, str] = {}
+
+        async def walk(tree_sha: str, prefix: str) -> None:
+            async with semaphore:
+                tree = await self.client.get_tree(self.owner, self.repo, tree_sha)
+            subtrees = []
+            for item in tree.tree:
+                path = f"{prefix}{item.path}"
+                if item.type == "tree" and _leads_to(path, self.directories):
+                    subtrees.append(walk(item.sha, f"{path}/"))
+                elif (
+                    item.type == "blob"
+                    and _under(path, self.directories)
+                    and os.path.splitext(path)[1].lower() in self.extensions
+                ):
+                    files[path] = item.sha
+            await asyncio.gather(*subtrees)
+
+        branch_info = await self.client.get_branch(
+            self.owner, self.repo, branch=self.branch
+        )
+        await walk(branch_info.commit.commit.tree.sha, "")
+        logger.info(
+            f"Found {len(files)} files in {self.owner}/{self.repo}@{self.branch}"
+        )
+        return files
+
+    async def fetch(self, files: dict[str, str]) -> list[Document]:
+        """Downloads the given files, with the same id and metadata as the `GithubRepositoryReader`."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(path: str, sha: str) -> Document | None:
+            async with semaphore:
+                blob = await self.client.get_blob(self.owner, self.repo, sha)
+            if blob is None:
+                logger.warning(f"Could not fetch {path}")
+                return None
+            try:
+                text = base64.b64decode(blob.content).decode("utf-8")
+            except (ValueError, UnicodeDecodeError):
+                logger.warning(f"Could not decode {path}")
+                return None
+            return _document(
+                text,
+                path,
+                f"https://github.com/{self.owner}/{self.repo}/blob/{self.branch}/{path}",
+            )
+
+        documents = await asyncio.gather(
+            *[fetch(path, sha) for path, sha in sorted(files.items())]
+        )
+        return [document for document in documents if document is not None]
+
+
+class LocalSource:
+    """Reads the files from a local clone or a release tarball, without any network access.
+
+    A tarball is unpacked once into `checkout_path`, its top level folder (like
+    `semantic-kernel-main`) is skipped. The files are hashed and read on a pool of
+    `workers` threads, the git blob SHA of the file is its version in the manifest.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        directories: list[str],
+        extensions: list[str],
+        url: str | None = None,
+        workers: int = 16,
+        checkout_path: str = DEFAULT_CHECKOUT_PATH,
+    ):
+        self.path = path
+        self.directories = [normalize_path(folder).strip("/") for folder in directories]
+        self.extensions = extensions
+        self.url = url
+        self.checkout_path = checkout_path
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._root: str | None = None
+
+    @property
+    def root(self) -> str:
+        if self._root is None:
+            self._root = (
+                self.path if os.path.isdir(self.path) else self._unpack(self.path)
+            )
+        return self._root
+
+    def _unpack(self, archive: str) -> str:
+        name = os.path.basename(archive)
+        for suffix in (".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar"):
+            name = name.removesuffix(suffix)
+        target = os.path.join(self.checkout_path, name)
+        if not os.path.isdir(target):
+            logger.info(f"Unpacking {archive} to {target}")
+            with tarfile.open(archive) as tar:
+                tar.extractall(f"{target}.tmp", filter="data")
+            os.replace(f"{target}.tmp", target)
+        entries = os.listdir(target)
+        if len(entries) == 1 and os.path.isdir(os.path.join(target, entries[0])):
+            return os.path.join(target, entries[0])
+        return target
+
+    def _walk(self) -> list[str]:
+        paths = []
+        for folder in self.directories:
+            for current, dirs, names in os.walk(os.path.join(self.root, folder)):
+                dirs[:] = [name for name in dirs if name != ".git"]
+                relative = normalize_path(os.path.relpath(current, self.root))
+                paths.extend(
+                    f"{relative}/{name}"
+                    for name in names
+                    if os.path.splitext(name)[1].lower() in self.extensions
+                )
+        return sorted(paths)
+
+    def _read(self, path: str) -> bytes:
+        with open(os.path.join(self.root, *path.split("/")), "rb") as file:
+            return file.read()
+
+    async def _map(self, function, items):
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(
+            *[loop.run_in_executor(self._pool, function, item) for item in items]
+        )
+
+    async def list_files(self) -> dict[str, str]:
+        paths = await asyncio.get_running_loop().run_in_executor(None, self._walk)
+        shas = await self._map(lambda path: git_blob_sha(self._read(path)), paths)
+        logger.info(f"Found {len(paths)} files in {self.root}")
+        return dict(zip(paths, shas))
+
+    async def fetch(self, files: dict[str, str]) -> list[Document]:
+        def load(item: tuple[str, str]) -> Document | None:
+            path, sha = item
+            try:
+                text = self._read(path).decode("utf-8")
+            except (OSError, UnicodeDecodeError) as exc:
+                logger.warning(f"Could not read {path}: {exc}")
+                return None
+            url = f"{self.url.rstrip('/')}/{path}" if self.url else None
+            return _document(text, path, url)
+
+        documents = await self._map(load, sorted(files.items()))
+        return [document for document in documents if document is not None]
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION, BaseKVStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "ingestion-cache.sqlite"
+)
+
+
+class SqliteKVStore(BaseKVStore):
+    """Key-value store in a SQLite file (WAL mode), for the `IngestionCache`.
+
+    Every put is committed on its own, so all work that finished before a crash is kept.
+    When the values grow over `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 2 * 1024**3):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS kv (collection TEXT NOT NULL, key TEXT NOT NULL, "
+                "value TEXT NOT NULL, size INTEGER NOT NULL, used_at REAL NOT NULL, "
+                "PRIMARY KEY (collection, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS kv_used_at ON kv (used_at)")
+            self._size = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM kv"
+            ).fetchone()[0]
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(
+        self, key: str, val: dict, collection: str = DEFAULT_COLLECTION
+    ) -> None:
+        self.put(key, val, collection)
+
+    def put_all(
+        self,
+        kv_pairs: list[tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = 1,
+    ) -> None:
+        rows = [(collection, key, json.dumps(val)) for key, val in kv_pairs]
+        now = time.time()
+        with self._lock, self._db:
+            for collection, key, value in rows:
+                previous = self._db.execute(
+                    "SELECT size FROM kv WHERE collection = ? AND key = ?",
+                    (collection, key),
+                ).fetchone()
+                self._size += len(value) - (previous[0] if previous else 0)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO kv (collection, key, value, size, used_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (collection, key, value, len(value), now),
+                )
+            if self._size > self.max_bytes:
+                self._evict()
+
+    async def aput_all(
+        self,
+        kv_pairs: list[tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = 1,
+    ) -> None:
+        self.put_all(kv_pairs, collection, batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> dict | None:
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?",
+                (collection, key),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE kv SET used_at = ? WHERE collection = ? AND key = ?",
+                (time.time(), collection, key),
+            )
+        return json.loads(row[0])
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> dict | None:
+        return self.get(key, collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> dict[str, dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, value FROM kv WHERE collection = ?", (collection,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> dict[str, dict]:
+        return self.get_all(collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT size FROM kv WHERE collection = ? AND key = ?",
+                (collection, key),
+            ).fetchone()
+            if row is None:
+                return False
+            self._db.execute(
+                "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            )
+            self._size -= row[0]
+        return True
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    def _evict(self) -> None:
+        """Removes the least recently used entries until the store is at 90% of `max_bytes`."""
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for collection, key, size in self._db.execute(
+            "SELECT collection, key, size FROM kv ORDER BY used_at"
+        ).fetchall():
+            if self._size <= target:
+                break
+            self._db.execute(
+                "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            )
+            self._size -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} entries from the ingestion cache")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def get_ingestion_cache_store() -> SqliteKVStore:
+    return SqliteKVStore(
+        path=os.getenv("INGESTION_CACHE_PATH", DEFAULT_CACHE_PATH),
+        max_bytes=int(float(os.getenv("INGESTION_CACHE_MAX_MB", "2048")) * 1024**2),
+    )
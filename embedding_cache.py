@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from pydantic import PrivateAttr
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
+    EmbeddingGeneratorBase,
+)
+
+if TYPE_CHECKING:
+    from semantic_kernel.connectors.ai.prompt_execution_settings import (
+        PromptExecutionSettings,
+    )
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "embeddings.sqlite"
+)
+
+
+class EmbeddingCache:
+    """In-memory LRU cache of embeddings, with a time to live per entry.
+
+    Subclasses that keep the embeddings on disk set `persistent`, the async methods
+    then run the disk reads and writes in a thread, off the event loop.
+    """
+
+    persistent = False
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[list[float], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> list[float] | None:
+        if (vector := self._get_memory(key)) is not None:
+            return vector
+        return self._get_stored(key)
+
+    async def get_many(self, keys: list[str]) -> list[list[float] | None]:
+        results = [self._get_memory(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing and self.persistent:
+            stored = await asyncio.to_thread(
+                lambda: [self._get_stored(keys[index]) for index in missing]
+            )
+            for index, vector in zip(missing, stored):
+                results[index] = vector
+        elif missing:
+            self.misses += len(missing)
+        return results
+
+    def put_many(self, items: list[tuple[str, list[float]]]) -> None:
+        for key, vector in items:
+            self._remember(key, vector)
+        self._store(items)
+
+    async def aput_many(self, items: list[tuple[str, list[float]]]) -> None:
+        if not self.persistent:
+            self.put_many(items)
+            return
+        for key, vector in items:
+            self._remember(key, vector)
+        await asyncio.to_thread(self._store, items)
+
+    def put(self, key: str, vector: list[float]) -> None:
+        self.put_many([(key, vector)])
+
+    def _get_memory(self, key: str) -> list[float] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        return None
+
+    def _get_stored(self, key: str) -> list[float] | None:
+        if (loaded := self._load(key)) is not None:
+            vector, age = loaded
+            # the entry expires from memory when it does on disk
+            self._remember(key, vector, time.monotonic() - age)
+            self.hits += 1
+            return vector
+        self.misses += 1
+        return None
+
+    def _remember(
+        self, key: str, vector: list[float], stored_at: float | None = None
+    ) -> None:
+        with self._lock:
+            self._entries[key] = (
+                vector,
+                time.monotonic() if stored_at is None else stored_at,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> tuple[list[float], float] | None:
+        """The stored vector of `key` and its age in seconds."""
+        return None
+
+    def _store(self, items: list[tuple[str, list[float]]]) -> None:
+        pass
+
+
+class SqliteEmbeddingCache(EmbeddingCache):
+    """Embedding cache that also stores every embedding as a float32 blob in a SQLite file.
+
+    The in-memory part is kept in front of it, the file survives restarts,
+    entries on disk are dropped after `ttl` seconds.
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        max_entries: int = 4096,
+        ttl: float = 30 * 24 * 3600,
+    ):
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - ttl,)
+            )
+
+    def _load(self, key: str) -> tuple[list[float], float] | None:
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist(), now - row[1]
+
+    def _store(self, items: list[tuple[str, list[float]]]) -> None:
+        now = time.time()
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in items
+                ],
+            )
+
+
+class _EmbeddingBatcher:
+    """Collects the texts requested by concurrent callers and embeds them in one call.
+
+    Requests for a text that is already being embedded share the same future.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[list[str], list[str]], Awaitable[list[list[float]]]],
+        window: float,
+        max_batch: int,
+    ):
+        self.embed = embed
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: list[tuple[str, str]] = []
+        self._futures: dict[str, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        # the loop only keeps weak references to tasks, a running batch must not be collected
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, key: str, text: str) -> asyncio.Future:
+        if (future := self._futures.get(key)) is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[key] = future
+        self._queue.append((key, text))
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, str]]) -> None:
+        keys = [key for key, _ in batch]
+        try:
+            vectors = await self.embed(keys, [text for _, text in batch])
+        except Exception as exc:
+            for key in keys:
+                if not (future := self._futures.pop(key)).done():
+                    future.set_exception(exc)
+            return
+        for key, vector in zip(keys, vectors):
+            if not (future := self._futures.pop(key)).done():
+                future.set_result(vector)
+
+
+class CachedTextEmbedding(EmbeddingGeneratorBase):
+    """Embedding service that wraps another one and caches the embeddings per text.
+
+    It keeps the service_id and ai_model_id of the wrapped service, so it can be registered
+    in its place without the callers changing. The cache key is a hash of the model id,
+    the dimensions and the text. Misses of concurrent calls without settings are batched
+    into a single call to the wrapped service.
+    """
+
+    inner: EmbeddingGeneratorBase
+    cache: Any
+    dimensions: int | None = None
+    batch_window: float = 0.005
+    max_batch: int = 64
+    _batchers: Any = PrivateAttr(default_factory=weakref.WeakKeyDictionary)
+
+    def __init__(
+        self,
+        inner: EmbeddingGeneratorBase,
+        cache: EmbeddingCache,
+        dimensions: int | None = None,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            service_id=inner.service_id,
+            ai_model_id=inner.ai_model_id,
+            inner=inner,
+            cache=cache,
+            dimensions=dimensions,
+            **kwargs,
+        )
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.ai_model_id}\x00{self.dimensions}\x00{text}".encode()
+        ).hexdigest()
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return self.inner.get_prompt_execution_settings_class()
+
+    async def generate_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        return np.array(await self.generate_raw_embeddings(texts, settings, **kwargs))
+
+    async def generate_raw_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> list[list[float]]:
+        keys = [self.cache_key(text) for text in texts]
+        results: list[list[float] | None] = await self.cache.get_many(keys)
+        missing = [index for index, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        if settings is None and not kwargs:
+            batcher = self._batcher()
+            vectors = await asyncio.gather(
+                *[batcher.submit(keys[index], texts[index]) for index in missing]
+            )
+        else:
+            vectors = await self._embed(
+                [keys[index] for index in missing],
+                [texts[index] for index in missing],
+                settings,
+                **kwargs,
+            )
+        for index, vector in zip(missing, vectors):
+            results[index] = vector
+        return results
+
+    def _batcher(self) -> _EmbeddingBatcher:
+        loop = asyncio.get_running_loop()
+        if (batcher := self._batchers.get(loop)) is None:
+            batcher = _EmbeddingBatcher(self._embed, self.batch_window, self.max_batch)
+            self._batchers[loop] = batcher
+        return batcher
+
+    async def _embed(
+        self,
+        keys: list[str],
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> list[list[float]]:
+        raw = await self.inner.generate_raw_embeddings(texts, settings, **kwargs)
+        vectors = [[float(value) for value in vector] for vector in raw]
+        await self.cache.aput_many(list(zip(keys, vectors)))
+        return vectors
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Creates the cache from the environment.
+
+    EMBEDDING_CACHE can be `sqlite` (default), `memory` or `false` to disable it.
+    """
+    mode = os.getenv("EMBEDDING_CACHE", "sqlite").lower()
+    if mode == "false":
+        return None
+    max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+    if mode == "memory":
+        return EmbeddingCache(
+            max_entries=max_entries,
+            ttl=float(os.getenv("EMBEDDING_CACHE_TTL", str(24 * 3600))),
+        )
+    return SqliteEmbeddingCache(
+        path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_DB_PATH),
+        max_entries=max_entries,
+        ttl=float(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600))),
+    )
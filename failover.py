@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from semantic_kernel import Kernel
+from semantic_kernel.contents import StreamingChatMessageContent
+from semantic_kernel.functions import KernelArguments
+
+from history_reducer import ChatHistoryReducer
+from online_state_service_selector import (
+    OFFLINE_SERVICE_ID,
+    ONLINE_SERVICE_ID,
+    SERVICE_ID_OVERRIDE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Failover:
+    """Marker yielded by `StreamFailover.invoke_stream` when the turn is re-issued offline."""
+
+    def __repr__(self) -> str:
+        return "FAILOVER"
+
+
+FAILOVER = _Failover()
+
+
+class StreamFailover:
+    """Streams the chat function and fails over from the online to the offline service.
+
+    The online stream is abandoned when the first text token does not arrive within
+    `first_token_timeout` seconds, when no chunk arrives for `stall_timeout` seconds
+    after that, or when it raises. The turn is then re-issued against the offline service
+    with the same arguments, after yielding `FAILOVER` so the caller can drop or keep the partial output.
+    When a reducer is set, the chat history is fitted to the budget of the service used for each attempt.
+    """
+
+    def __init__(
+        self,
+        kernel: Kernel,
+        first_token_timeout: float = 15.0,
+        stall_timeout: float = 10.0,
+        plugin_name: str = "chat",
+        function_name: str = "chat",
+        reducer: ChatHistoryReducer | None = None,
+    ):
+        self.kernel = kernel
+        self.reducer = reducer
+        self.first_token_timeout = first_token_timeout
+        self.stall_timeout = stall_timeout
+        self.plugin_name = plugin_name
+        self.function_name = function_name
+
+    @property
+    def selector(self):
+        return self.kernel.ai_service_selector
+
+    async def invoke_stream(
+        self, **kwargs: Any
+    ) -> AsyncGenerator[list[StreamingChatMessageContent] | _Failover, Any]:
+        service_id = self.selector.preferred_service_id()
+        if service_id != ONLINE_SERVICE_ID:
+            async for response in self._stream(service_id, kwargs):
+                yield response
+            return
+        try:
+            async for response in self._stream(
+                ONLINE_SERVICE_ID, kwargs, with_deadlines=True
+            ):
+                yield response
+        except Exception as exc:
+            self.selector.breaker.record_failure()
+            logger.warning(
+                f"Online service failed ({type(exc).__name__}: {exc}), failing over to the offline service"
+            )
+        else:
+            self.selector.breaker.record_success()
+            return
+        yield FAILOVER
+        async for response in self._stream(OFFLINE_SERVICE_ID, kwargs):
+            yield response
+
+    async def _stream(
+        self, service_id: str, kwargs: dict[str, Any], with_deadlines: bool = False
+    ) -> AsyncGenerator[list[StreamingChatMessageContent], Any]:
+        arguments = KernelArguments(**kwargs)
+        arguments[SERVICE_ID_OVERRIDE] = service_id
+        # the history is reduced within the first token deadline, a slow summary counts too
+        deadline = time.monotonic() + self.first_token_timeout
+        if self.reducer and arguments.get("chat_history") is not None:
+            reduce = self.reducer.reduce(arguments["chat_history"], service_id)
+            arguments["chat_history"] = await (
+                asyncio.wait_for(reduce, self.first_token_timeout)
+                if with_deadlines
+                else reduce
+            )
+        stream = self.kernel.invoke_stream(
+            function_name=self.function_name,
+            plugin_name=self.plugin_name,
+            arguments=arguments,
+        ).__aiter__()
+        first_token = False
+        try:
+            while True:
+                timeout = None
+                if with_deadlines:
+                    timeout = (
+                        self.stall_timeout
+                        if first_token
+                        else max(deadline - time.monotonic(), 0)
+                    )
+                try:
+                    response = await asyncio.wait_for(anext(stream), timeout)
+                except StopAsyncIteration:
+                    return
+                if response and response[0].content:
+                    first_token = True
+                yield response
+        finally:
+            await stream.aclose()
+
+
+def get_stream_failover(
+    kernel: Kernel, reducer: ChatHistoryReducer | None = None
+) -> StreamFailover | None:
+    """Creates the failover from the environment, returns None when FAILOVER is set to false."""
+    if os.getenv("FAILOVER", "true").lower() == "false":
+        return None
+    return StreamFailover(
+        kernel,
+        first_token_timeout=float(os.getenv("FAILOVER_FIRST_TOKEN_TIMEOUT", "15.0")),
+        stall_timeout=float(os.getenv("FAILOVER_STALL_TIMEOUT", "10.0")),
+        reducer=reducer,
+    )
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+from semantic_kernel import Kernel
+from semantic_kernel.contents import AuthorRole, ChatHistory, ChatMessageContent
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and an assistant that helps with Semantic Kernel in Python. "
+    "Keep it to a few sentences and keep the names of classes, functions and packages that were discussed. "
+    "If there is an existing summary, extend it with the new messages."
+)
+
+
+def estimate_tokens(message: ChatMessageContent) -> int:
+    """Rough token count, about four characters per token plus some overhead per message."""
+    return len(message.content or "") // 4 + 4
+
+
+class ChatHistoryReducer:
+    """Fits the chat history into a token budget per service before it goes into the prompt.
+
+    The most recent messages are kept verbatim, older ones are folded into a running summary
+    that is added as a system message. Summaries are cached by a rolling hash of the messages
+    they cover, so a new turn only summarizes the messages that just fell out of the window.
+
+    A summary that takes longer than `summary_timeout` seconds does not hold up the turn: the
+    older messages are dropped instead and the summary is cached when it is done, for the next turn.
+    """
+
+    def __init__(
+        self,
+        kernel: Kernel,
+        budgets: dict[str, int],
+        summary_share: float = 0.25,
+        cache_size: int = 256,
+        summary_timeout: float = 5.0,
+    ):
+        self.kernel = kernel
+        self.budgets = budgets
+        self.summary_share = summary_share
+        self.cache_size = cache_size
+        self.summary_timeout = summary_timeout
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._pending: set[asyncio.Task] = set()
+
+    async def reduce(self, chat_history: ChatHistory, service_id: str) -> ChatHistory:
+        budget = self.budgets.get(service_id)
+        messages = chat_history.messages
+        if not budget or sum(estimate_tokens(m) for m in messages) <= budget:
+            return chat_history
+
+        split = self._split_index(messages, int(budget * (1 - self.summary_share)))
+        if split == 0:
+            return chat_history
+        hashes = self._prefix_hashes(messages[:split])
+        start, summary = 0, ""
+        for index in range(split, 0, -1):
+            if (cached := self._get(hashes[index], service_id)) is not None:
+                start, summary = index, cached
+                break
+        if start < split:
+            task = asyncio.ensure_future(
+                self._summarize(summary, messages[start:split], service_id)
+            )
+            try:
+                # shielded, a summary that is too slow for this turn is kept for the next one
+                summary = await asyncio.wait_for(
+                    asyncio.shield(task), self.summary_timeout
+                )
+            except Exception as exc:
+                logger.warning(
+                    "Could not summarize the chat history in time, dropping older "
+                    f"messages instead: {type(exc).__name__} {exc}"
+                )
+                summary = summary or ""
+                if not task.done():
+                    self._pending.add(task)
+                    task.add_done_callback(
+                        lambda task, key=hashes[split]: self._finish(
+                            task, key, service_id
+                        )
+                    )
+            else:
+                self._put(hashes[split], service_id, summary)
+
+        reduced = ChatHistory()
+        if summary:
+            reduced.add_system_message(
+                f"Summary of the earlier conversation: {summary}"
+            )
+        for message in messages[split:]:
+            reduced.add_message(message)
+        return reduced
+
+    @staticmethod
+    def _split_index(messages: list[ChatMessageContent], budget: int) -> int:
+        """Index of the first message to keep, the kept part always starts at a user message."""
+        used = 0
+        split = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            used += estimate_tokens(messages[index])
+            if used > budget:
+                break
+            if messages[index].role == AuthorRole.USER:
+                split = index
+        if split == len(messages):
+            # even the last turn does not fit, keep it anyway so the model has the context of the question.
+            for index in range(len(messages) - 1, -1, -1):
+                if messages[index].role == AuthorRole.USER:
+                    return index
+        return split
+
+    @staticmethod
+    def _prefix_hashes(messages: list[ChatMessageContent]) -> list[str]:
+        hashes = [""]
+        digest = hashlib.sha256()
+        for message in messages:
+            digest.update(f"{message.role}\x00{message.content}\x00".encode())
+            hashes.append(digest.copy().hexdigest())
+        return hashes
+
+    async def _summarize(
+        self, summary: str, messages: list[ChatMessageContent], service_id: str
+    ) -> str:
+        service = self.kernel.get_service(service_id)
+        settings = service.get_prompt_execution_settings_class()(service_id=service_id)
+        history = ChatHistory(system_message=SUMMARY_PROMPT)
+        conversation = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        if summary:
+            conversation = (
+                f"Existing summary: {summary}\n\nNew messages:\n{conversation}"
+            )
+        history.add_user_message(conversation)
+        result = await service.get_chat_message_content(history, settings)
+        return result.content if result else summary
+
+    def _finish(self, task: asyncio.Task, key: str, service_id: str) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            self._put(key, service_id, task.result())
+
+    def _get(self, key: str, service_id: str) -> str | None:
+        cache_key = f"{service_id}:{key}"
+        if cache_key in self._summaries:
+            self._summaries.move_to_end(cache_key)
+            return self._summaries[cache_key]
+        return None
+
+    def _put(self, key: str, service_id: str, summary: str) -> None:
+        self._summaries[f"{service_id}:{key}"] = summary
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+
+
+def get_history_reducer(kernel: Kernel) -> ChatHistoryReducer:
+    """Creates the reducer with the token budgets from the environment, a budget of 0 disables it."""
+    return ChatHistoryReducer(
+        kernel,
+        budgets={
+            "online": int(os.getenv("HISTORY_TOKEN_BUDGET_ONLINE", "8000")),
+            "offline": int(os.getenv("HISTORY_TOKEN_BUDGET_OFFLINE", "2000")),
+        },
+        summary_timeout=float(os.getenv("HISTORY_SUMMARY_TIMEOUT", "5.0")),
+    )
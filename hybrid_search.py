@@ -0,0 +1,94 @@
+import logging
+import os
+from collections.abc import AsyncIterable, Sequence
+from typing import TYPE_CHECKING, Any
+
+from semantic_kernel.data import VectorStoreTextSearch
+from semantic_kernel.data.filter_clauses.equal_to_filter_clause import EqualTo
+from semantic_kernel.data.kernel_search_results import KernelSearchResults
+
+from data_ingestion.bm25_index import LazyBM25Index
+
+if TYPE_CHECKING:
+    from semantic_kernel.data.search_options import SearchOptions
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> list[str]:
+    """Fuses ranked lists of ids, each id scores 1 / (k + rank) per list it is in."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+async def _as_async(items: list[str]) -> AsyncIterable[str]:
+    for item in items:
+        yield item
+
+
+class HybridTextSearch(VectorStoreTextSearch):
+    """Text search that fuses the vector search with a local BM25 keyword index.
+
+    Both searches fetch `candidates` results with the same equality filters, the ranked ids
+    are combined with reciprocal rank fusion. Chunks that only the keyword index found
+    are returned with the text stored in that index. Without a keyword index it is a plain
+    vector search.
+    """
+
+    keyword_index: Any = None
+    key_field_name: str = "id"
+    candidates: int = 20
+    rrf_k: int = 60
+
+    async def search(
+        self, query: str, options: "SearchOptions | None" = None, **kwargs: Any
+    ) -> "KernelSearchResults[str]":
+        index = await self.keyword_index.get() if self.keyword_index else None
+        if index is None:
+            return await super().search(query, options, **kwargs)
+        options = options or self.options_class()
+        wide_options = options.model_copy(
+            update={"top": max(self.candidates, options.top + options.skip), "skip": 0}
+        )
+        vector_results = await self._execute_search(query, wide_options, **kwargs)
+        texts: dict[str, str] = {}
+        vector_ids: list[str] = []
+        async for result in vector_results.results:
+            if result.record is None:
+                continue
+            id = str(getattr(result.record, self.key_field_name))
+            vector_ids.append(id)
+            texts[id] = (
+                self.string_mapper(result.record)
+                if self.string_mapper
+                else self._default_map_to_string(result.record)
+            )
+        filters = {}
+        if options.filter:
+            filters = {
+                clause.field_name: clause.value
+                for clause in options.filter.filters
+                if isinstance(clause, EqualTo)
+            }
+        keyword_hits = index.search(query, top=wide_options.top, filters=filters)
+        for hit in keyword_hits:
+            texts.setdefault(hit.id, hit.text)
+        fused = reciprocal_rank_fusion(
+            [vector_ids, [hit.id for hit in keyword_hits]], k=self.rrf_k
+        )
+        results = [texts[id] for id in fused[options.skip : options.skip + options.top]]
+        return KernelSearchResults(
+            results=_as_async(results),
+            total_count=len(fused) if options.include_total_count else None,
+        )
+
+
+def load_keyword_index(path: str) -> LazyBM25Index | None:
+    """Starts loading the keyword index in the background, returns None when it was never built."""
+    if not os.path.exists(path):
+        logger.warning(f"No keyword index at {path}, using vector search only")
+        return None
+    return LazyBM25Index(path)
@@ -1,16 +1,28 @@
-from dataclasses import field
-from backend import get_kernel
-from utils import internet
-import mesop as me
-from semantic_kernel.contents import (
-    ChatHistory,
-    StreamingChatMessageContent,
-    TextContent,
-)
+import atexit
+import logging
+import os
 from dotenv import load_dotenv
 
+# before the app modules, the data models read their settings on import
 load_dotenv()
 
+from app_loop import get_app_loop
+from backend import get_kernel
+from clients import get_client_registry
+from connectivity import get_connectivity_monitor
+from failover import FAILOVER, get_stream_failover
+from history_reducer import get_history_reducer
+from online_state_service_selector import OFFLINE_SERVICE_ID
+from render_cache import RenderCache, message_key
+from response_cache import get_response_cache, replay
+from session_store import get_session_store
+from startup import get_startup_timings, start_warm_up
+from streaming import StreamingMessageAggregator, coalesce, coalesce_settings
+from telemetry import get_telemetry
+import mesop as me
+
+logger = logging.getLogger(__name__)
+
 # import debugpy
 
 # debugpy.listen(5678)
@@ -31,7 +43,27 @@ EXAMPLES = [
     "Does semantic kernel support ollama and if so how do I do that?",
 ]
 
+startup_timings = get_startup_timings()
+# every handler streams on this loop, the services get the clients of this loop
+app_loop = get_app_loop()
 kernel = get_kernel()
+with startup_timings.measure("connectivity"):
+    connectivity = get_connectivity_monitor()
+    connectivity.start()
+history_reducer = get_history_reducer(kernel)
+failover = get_stream_failover(kernel, reducer=history_reducer)
+with startup_timings.measure("session store"):
+    session_store = get_session_store()
+render_cache = RenderCache()
+telemetry = get_telemetry()
+response_cache = get_response_cache(kernel, telemetry.metrics)
+KEEP_PARTIAL_ON_FAILOVER = os.getenv("FAILOVER_KEEP_PARTIAL", "false").lower() == "true"
+if metrics_port := int(os.getenv("METRICS_PORT", "9464")):
+    telemetry.serve_metrics(metrics_port, os.getenv("METRICS_HOST", "127.0.0.1"))
+# the services of the other mode are created when the selector first switches to them
+start_warm_up(kernel)
+atexit.register(get_client_registry().shutdown)
+logger.info(startup_timings.report())
 
 
 @me.stateclass
@@ -40,7 +72,7 @@ class State:
     temp_input: str
     output: str
     in_progress: bool
-    chat_history: dict = field(default_factory=dict)
+    session_id: str
     online: bool = True
 
 
@@ -195,16 +227,28 @@ def textarea_on_blur(e: me.InputBlurEvent):
 
 async def click_send(e: me.ClickEvent):
     state = me.state(State)
-    state.online = internet()
+    state.online = await connectivity.is_online()
     if not state.input:
         return
     state.in_progress = True
     state.temp_input = input = state.input
     state.input = ""
+    if not state.session_id:
+        state.session_id = session_store.new_session_id()
     yield
 
-    async for chunk in call_api(input):
-        state.output += chunk
+    # the state is only available here, on the thread of the handler
+    async for chunk in app_loop.stream(
+        coalesce(call_api(input, state.session_id), **coalesce_settings())
+    ):
+        if chunk is FAILOVER:
+            state.output = (
+                f"{state.output}\n\n*Switched to the offline model.*\n\n"
+                if KEEP_PARTIAL_ON_FAILOVER and state.output
+                else ""
+            )
+        else:
+            state.output += chunk
         yield
     state.in_progress = False
     state.output = ""
@@ -212,31 +256,66 @@ async def click_send(e: me.ClickEvent):
     yield
 
 
-async def call_api(input):
-    state = me.state(State)
-    if state.chat_history:
-        chat_history = ChatHistory.model_validate(state.chat_history)
+async def call_api(input, session_id):
+    # one span per turn, the model, search and embedding calls are its children
+    with telemetry.span("chat.turn") as turn:
+        async for chunk in _call_api(input, session_id, turn):
+            yield chunk
+
+
+async def _call_api(input, session_id, turn):
+    chat_history = await session_store.aget(session_id)
+    # answers are only cached for the first question, later ones depend on the history
+    cache_vector = None
+    cache_service_id = kernel.ai_service_selector.preferred_service_id()
+    turn.set(
+        service_id=cache_service_id, history_messages=len(chat_history.messages)
+    )
+    if response_cache and not chat_history.messages:
+        try:
+            cache_vector = await response_cache.embed(input, cache_service_id)
+        except Exception as exc:
+            logger.warning(f"Skipping the response cache: {exc}")
+        else:
+            if cached := response_cache.lookup(cache_vector, cache_service_id):
+                turn.set(cached=True, ttft=turn.elapsed)
+                async for piece in replay(cached):
+                    yield piece
+                chat_history.add_user_message(input)
+                chat_history.add_assistant_message(cached)
+                await session_store.asave(session_id, chat_history)
+                return
+    aggregator = StreamingMessageAggregator()
+    if failover:
+        stream = failover.invoke_stream(chat_history=chat_history, user_input=input)
     else:
-        chat_history = ChatHistory()
-    chunks: list[StreamingChatMessageContent] = []
-    async for response in kernel.invoke_stream(
-        function_name="chat",
-        plugin_name="chat",
-        chat_history=chat_history,
-        user_input=input,
-    ):
-        chunks.append(response[0])
+        stream = kernel.invoke_stream(
+            function_name="chat",
+            plugin_name="chat",
+            chat_history=await history_reducer.reduce(
+                chat_history, kernel.ai_service_selector.preferred_service_id()
+            ),
+            user_input=input,
+        )
+    async for response in stream:
+        if response is FAILOVER:
+            aggregator.clear()
+            cache_vector = None
+            turn.set(failover=True, service_id=OFFLINE_SERVICE_ID)
+            turn.attributes.pop("ttft", None)
+            yield FAILOVER
+            continue
+        aggregator.add(response[0])
         if response[0].content:
+            if "ttft" not in turn.attributes:
+                turn.set(ttft=turn.elapsed)
             yield response[0].content
+    answer = aggregator.build()
     chat_history.add_user_message(input)
-    full_msg: StreamingChatMessageContent = sum(chunks[1:], chunks[0])
-    new_items = []
-    for item in full_msg.items:
-        if isinstance(item, TextContent):
-            new_items.append(item)
-    full_msg.items = new_items
-    chat_history.add_message(full_msg)
-    state.chat_history = chat_history.model_dump()
+    chat_history.add_message(answer)
+    await session_store.asave(session_id, chat_history)
+    if cache_vector is not None:
+        response_cache.store(input, cache_vector, answer.content, cache_service_id)
 
 
 @me.component
@@ -298,13 +377,19 @@ def assistant_message(message: str):
 
 def chat_history():
     state = me.state(State)
-    if state.chat_history:
-        chat_history = ChatHistory.model_validate(state.chat_history)
-        for message in chat_history.messages:
+    if state.session_id:
+        chat_history = session_store.get(state.session_id)
+        # finished messages never change, so they are rendered once and reused from the cache
+        for index, message in enumerate(chat_history.messages):
             if message.role == "user":
-                user_message(message.content)
+                render_cache.render(
+                    message_key(index, message), lambda: user_message(message.content)
+                )
             else:
-                assistant_message(message.content)
+                render_cache.render(
+                    message_key(index, message),
+                    lambda: assistant_message(message.content),
+                )
 
 
 def output():
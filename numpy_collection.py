@@ -0,0 +1,180 @@
+import sys
+from collections.abc import Sequence
+from typing import Any, ClassVar, TypeVar
+
+from pydantic import PrivateAttr
+from semantic_kernel.data import VectorSearchOptions
+from semantic_kernel.data.filter_clauses.equal_to_filter_clause import EqualTo
+from semantic_kernel.data.kernel_search_results import KernelSearchResults
+from semantic_kernel.data.record_definition.vector_store_model_definition import (
+    VectorStoreRecordDefinition,
+)
+from semantic_kernel.data.vector_search.vector_search import VectorSearchBase
+from semantic_kernel.data.vector_search.vector_search_result import VectorSearchResult
+from semantic_kernel.data.vector_search.vectorized_search import VectorizedSearchMixin
+from semantic_kernel.exceptions import VectorSearchExecutionException
+
+from data_ingestion.numpy_index import NumpyVectorIndex
+
+if sys.version_info >= (3, 12):
+    from typing import override  # pragma: no cover
+else:
+    from typing_extensions import override  # pragma: no cover
+
+TModel = TypeVar("TModel")
+
+NUMPY_SCORE_KEY = "numpy_search_score"
+
+
+class NumpyVectorCollection(
+    VectorSearchBase[str, TModel], VectorizedSearchMixin[TModel]
+):
+    """Vector collection on top of the embedded `NumpyVectorIndex`, stored in `path`/`collection_name`.
+
+    It supports the same vectorized search as the Qdrant collection, including equality filters
+    on the payload (like topic, subtopic and connector), without a service to run.
+    A quantized index (see `NumpyVectorIndex`) rescores `oversampling` times `top` candidates.
+    Upserts and deletes are kept in memory until `flush` or the end of an `async with` block,
+    which write the index once instead of after every batch.
+    """
+
+    path: str
+    oversampling: float = 4.0
+    supported_key_types: ClassVar[list[str] | None] = ["str"]
+    _index: NumpyVectorIndex | None = PrivateAttr(default=None)
+    _dirty: bool = PrivateAttr(default=False)
+
+    def __init__(
+        self,
+        data_model_type: type[TModel],
+        path: str,
+        collection_name: str = "sk",
+        data_model_definition: VectorStoreRecordDefinition | None = None,
+        oversampling: float = 4.0,
+    ):
+        super().__init__(
+            data_model_type=data_model_type,
+            data_model_definition=data_model_definition,
+            collection_name=collection_name,
+            path=path,
+            oversampling=oversampling,
+        )
+
+    @property
+    def index(self) -> NumpyVectorIndex:
+        """The index is opened on first use, so the vectors are only mapped when they are needed."""
+        if self._index is None:
+            vector_field = self.data_model_definition.vector_fields[0]
+            index = NumpyVectorIndex.open_or_create(
+                f"{self.path}/{self.collection_name}",
+                vector_field.dimensions,
+                oversampling=self.oversampling,
+            )
+            if vector_field.dimensions and index.dimensions != vector_field.dimensions:
+                raise VectorSearchExecutionException(
+                    f"The index in {index.path} has {index.dimensions} dimensions and the "
+                    f"data model {vector_field.dimensions}, ingest the data again."
+                )
+            self._index = index
+        return self._index
+
+    @override
+    async def _inner_upsert(
+        self, records: Sequence[Any], **kwargs: Any
+    ) -> Sequence[str]:
+        vector_field = self.data_model_definition.vector_field_names[0]
+        keys = [record[self._key_field_name] for record in records]
+        self.index.upsert(
+            keys,
+            [record[vector_field] for record in records],
+            [
+                {
+                    name: value
+                    for name, value in record.items()
+                    if name not in (self._key_field_name, vector_field)
+                }
+                for record in records
+            ],
+        )
+        self._dirty = True
+        return keys
+
+    @override
+    async def _inner_get(self, keys: Sequence[str], **kwargs: Any) -> Any:
+        return self.index.get(keys, include_vectors=kwargs.get("include_vectors", True))
+
+    @override
+    async def _inner_delete(self, keys: Sequence[str], **kwargs: Any) -> None:
+        self.index.delete(keys)
+        self._dirty = True
+
+    async def flush(self) -> None:
+        """Writes the upserts and deletes to disk."""
+        if self._dirty:
+            self.index.save()
+            self._dirty = False
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.flush()
+
+    def _serialize_dicts_to_store_models(
+        self, records: Sequence[dict[str, Any]], **kwargs: Any
+    ) -> Sequence[Any]:
+        return records
+
+    def _deserialize_store_models_to_dicts(
+        self, records: Sequence[Any], **kwargs: Any
+    ) -> Sequence[dict[str, Any]]:
+        return records
+
+    @override
+    async def create_collection(self, **kwargs: Any) -> None:
+        self.index.save()
+        self._dirty = False
+
+    @override
+    async def does_collection_exist(self, **kwargs: Any) -> bool:
+        return NumpyVectorIndex.exists(f"{self.path}/{self.collection_name}")
+
+    @override
+    async def delete_collection(self, **kwargs: Any) -> None:
+        self.index.drop()
+        self._dirty = False
+
+    @override
+    async def _inner_search(
+        self,
+        options: VectorSearchOptions,
+        search_text: str | None = None,
+        vectorizable_text: str | None = None,
+        vector: list[float | int] | None = None,
+        **kwargs: Any,
+    ) -> KernelSearchResults[VectorSearchResult[TModel]]:
+        if vector is None:
+            raise VectorSearchExecutionException("Search requires a vector.")
+        filters = {}
+        if options.filter:
+            for clause in options.filter.filters:
+                if not isinstance(clause, EqualTo):
+                    raise VectorSearchExecutionException(
+                        f"Unsupported filter: {type(clause).__name__}"
+                    )
+                filters[clause.field_name] = clause.value
+        matches = self.index.search(
+            vector, top=options.top, skip=options.skip, filters=filters
+        )
+        records = []
+        for row, score in matches:
+            record = self.index.record(row, include_vectors=options.include_vectors)
+            record[NUMPY_SCORE_KEY] = score
+            records.append(record)
+        return KernelSearchResults(
+            results=self._get_vector_search_results_from_results(records, options),
+            total_count=len(records) if options.include_total_count else None,
+        )
+
+    def _get_record_from_result(self, result: Any) -> Any:
+        return result
+
+    def _get_score_from_result(self, result: Any) -> float | None:
+        return result.get(NUMPY_SCORE_KEY)
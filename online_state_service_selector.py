@@ -1,7 +1,8 @@
 from typing import TYPE_CHECKING
 from semantic_kernel.services.ai_service_selector import AIServiceSelector
 import logging
-from utils import internet
+from circuit_breaker import CircuitBreaker
+from connectivity import get_connectivity_monitor
 
 if TYPE_CHECKING:
     from semantic_kernel.functions.kernel_arguments import KernelArguments
@@ -18,8 +19,23 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+ONLINE_SERVICE_ID = "online"
+OFFLINE_SERVICE_ID = "offline"
+# Kernel argument that pins a single invocation to a service, used when failing over.
+SERVICE_ID_OVERRIDE = "service_id_override"
+
 
 class OnlineStateServiceSelector(AIServiceSelector):
+    def __init__(self, connectivity=None, breaker: CircuitBreaker | None = None):
+        self.connectivity = connectivity or get_connectivity_monitor()
+        self.breaker = breaker or CircuitBreaker()
+
+    def preferred_service_id(self) -> str:
+        """The service to use for the next call, based on connectivity and the circuit breaker."""
+        if self.connectivity.online and self.breaker.allow():
+            return ONLINE_SERVICE_ID
+        return OFFLINE_SERVICE_ID
+
     def select_ai_service(
         self,
         kernel: "KernelServicesExtension",
@@ -29,12 +45,13 @@ class OnlineStateServiceSelector(AIServiceSelector):
         | tuple[type["AI_SERVICE_CLIENT_TYPE"], ...]
         | None = None,
     ) -> tuple["AIServiceClientBase", "PromptExecutionSettings"]:
-        func_exec_settings = getattr(function, "prompt_execution_settings", None)
+        func_exec_settings = getattr(function, "prompt_execution_settings", None) or {}
         logger.info(
             f"Function: {function.name}, prompt_execution_settings: {func_exec_settings}"
         )
-        if internet() and "online" in func_exec_settings:
-            return kernel.get_service("online"), func_exec_settings["online"]
-        elif not internet() and "offline" in func_exec_settings:
-            return kernel.get_service("offline"), func_exec_settings["offline"]
+        service_id = (
+            arguments.get(SERVICE_ID_OVERRIDE) if arguments is not None else None
+        ) or self.preferred_service_id()
+        if service_id in func_exec_settings:
+            return kernel.get_service(service_id), func_exec_settings[service_id]
         return super().select_ai_service(kernel, function, arguments, type_)
@@ -0,0 +1,49 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+
+import mesop.protos.ui_pb2 as pb
+from mesop.runtime import runtime
+from semantic_kernel.contents import ChatMessageContent
+
+
+def message_key(index: int, message: ChatMessageContent) -> tuple[int, str, str]:
+    """Cache key of a finished message, its index in the history and a hash of role and content."""
+    digest = hashlib.sha1(f"{message.role}\x00{message.content}".encode()).hexdigest()
+    return index, str(message.role), digest
+
+
+class RenderCache:
+    """Caches the component trees of finished chat messages.
+
+    Mesop rebuilds the whole component tree on every render, but a finished message never changes.
+    The first time a message is rendered the nodes it adds are copied, after that the copies are
+    appended to the current node, so rendering the history does not redo the work per message.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, list[pb.Component]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, key: tuple, render_fn: Callable[[], None]) -> None:
+        parent = runtime().context().current_node()
+        with self._lock:
+            nodes = self._entries.get(key)
+            if nodes is not None:
+                self._entries.move_to_end(key)
+        if nodes is not None:
+            parent.children.extend(nodes)
+            return
+        start = len(parent.children)
+        render_fn()
+        nodes = []
+        for child in parent.children[start:]:
+            node = pb.Component()
+            node.CopyFrom(child)
+            nodes.append(node)
+        with self._lock:
+            self._entries[key] = nodes
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,156 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from semantic_kernel import Kernel
+
+from telemetry import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    query: str
+    vector: np.ndarray
+    response: str
+    created_at: float
+
+
+class SemanticResponseCache:
+    """Caches answers to first questions, keyed on the embedding of the question.
+
+    A question matches a cached one when the cosine similarity of their embeddings is at least
+    `threshold`. The embeddings come from the embedder of the active service (`<service_id>-embedding`),
+    so the online and offline caches are kept apart. Entries are evicted least recently used first
+    and after `ttl` seconds. The hits and misses are counted in `metrics`, when given.
+    """
+
+    def __init__(
+        self,
+        kernel: Kernel,
+        threshold: float = 0.95,
+        max_entries: int = 512,
+        ttl: float = 24 * 3600,
+        metrics: Metrics | None = None,
+    ):
+        self.kernel = kernel
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe(
+                "chat_response_cache_lookups_total",
+                "counter",
+                "Response cache lookups by result",
+            )
+        self._entries: dict[str, OrderedDict[str, CachedResponse]] = {}
+        self._matrices: dict[str, tuple[list[str], np.ndarray] | None] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def embed(self, query: str, service_id: str) -> np.ndarray:
+        embedder = self.kernel.get_service(f"{service_id}-embedding")
+        vector = np.asarray(
+            (await embedder.generate_embeddings([query]))[0], dtype=np.float32
+        )
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, vector: np.ndarray, service_id: str) -> str | None:
+        with self._lock:
+            self._expire(service_id)
+            keys, matrix = self._matrix(service_id)
+            response = None
+            if keys and matrix.shape[1] == vector.shape[0]:
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entries = self._entries[service_id]
+                    entries.move_to_end(keys[best])
+                    response = entries[keys[best]].response
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.metrics is not None:
+            self.metrics.inc(
+                "chat_response_cache_lookups_total",
+                result="hit" if response else "miss",
+                service_id=service_id,
+            )
+        logger.info(
+            f"Response cache {'hit' if response else 'miss'}, hit rate: {self.hit_rate:.1%}"
+        )
+        return response
+
+    def store(
+        self, query: str, vector: np.ndarray, response: str, service_id: str
+    ) -> None:
+        if not response:
+            return
+        with self._lock:
+            entries = self._entries.setdefault(service_id, OrderedDict())
+            entries[query] = CachedResponse(query, vector, response, time.monotonic())
+            entries.move_to_end(query)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._matrices[service_id] = None
+
+    def _expire(self, service_id: str) -> None:
+        entries = self._entries.get(service_id)
+        if not entries:
+            return
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, entry in entries.items() if entry.created_at < cutoff]
+        for key in expired:
+            del entries[key]
+        if expired:
+            self._matrices[service_id] = None
+
+    def _matrix(self, service_id: str) -> tuple[list[str], np.ndarray]:
+        if (cached := self._matrices.get(service_id)) is not None:
+            return cached
+        entries = self._entries.get(service_id) or {}
+        keys = list(entries)
+        matrix = (
+            np.stack([entries[key].vector for key in keys])
+            if keys
+            else np.empty((0, 0), dtype=np.float32)
+        )
+        self._matrices[service_id] = (keys, matrix)
+        return keys, matrix
+
+
+async def replay(response: str) -> AsyncGenerator[str, Any]:
+    """Streams a cached response in word sized pieces, like the model would."""
+    for piece in re.findall(r"\S+\s*|\s+", response):
+        yield piece
+
+
+def get_response_cache(
+    kernel: Kernel, metrics: Metrics | None = None
+) -> SemanticResponseCache | None:
+    """Creates the cache from the environment, returns None when RESPONSE_CACHE is set to false."""
+    if os.getenv("RESPONSE_CACHE", "true").lower() == "false":
+        return None
+    return SemanticResponseCache(
+        kernel,
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600))),
+        metrics=metrics,
+    )
@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from semantic_kernel import Kernel
+from semantic_kernel.filters.filter_types import FilterTypes
+from semantic_kernel.filters.functions.function_invocation_context import (
+    FunctionInvocationContext,
+)
+from semantic_kernel.functions import FunctionResult
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Lower case, collapse whitespace and strip surrounding punctuation, so trivial rewordings match."""
+    return re.sub(r"\s+", " ", str(query)).strip().strip("?!.,;:\"'").strip().lower()
+
+
+class SearchResultCache:
+    """Caches the results of the search functions, as a function invocation filter.
+
+    The key is made up of the plugin (which decides the service), the function, its topic filter,
+    top, skip and the normalized query. At most `max_entries` results are kept, for `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        plugin_names: tuple[str, ...] = ("online_search", "offline_search"),
+        max_entries: int = 1024,
+        ttl: float = 3600,
+    ):
+        self.plugin_names = plugin_names
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._topics: dict[tuple[str, str], str | None] = {}
+        self._entries: OrderedDict[tuple, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register_topic(self, plugin_name: str, function_name: str, topic: str | None):
+        """Sets the topic a search function filters on, it is part of the cache key."""
+        self._topics[(plugin_name, function_name)] = topic
+
+    def key(self, plugin_name: str, function_name: str, arguments) -> tuple:
+        return (
+            plugin_name,
+            function_name,
+            arguments.get("topic") or self._topics.get((plugin_name, function_name)),
+            arguments.get("top"),
+            arguments.get("skip"),
+            normalize_query(arguments.get("query", "")),
+        )
+
+    def get(self, key: tuple) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def filter(self, context: FunctionInvocationContext, next):
+        function = context.function
+        if function.plugin_name not in self.plugin_names:
+            await next(context)
+            return
+        key = self.key(function.plugin_name, function.name, context.arguments)
+        if (value := self.get(key)) is not None:
+            logger.info(f"Search cache hit for {function.fully_qualified_name}")
+            context.result = FunctionResult(function=function.metadata, value=value)
+            return
+        await next(context)
+        if context.result is not None and context.result.value is not None:
+            self.put(key, context.result.value)
+
+    def register(self, kernel: Kernel) -> None:
+        kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, self.filter)
+
+
+def get_search_cache() -> SearchResultCache | None:
+    """Creates the cache from the environment, returns None when SEARCH_CACHE is set to false."""
+    if os.getenv("SEARCH_CACHE", "true").lower() == "false":
+        return None
+    return SearchResultCache(
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+        ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+    )
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from semantic_kernel.contents import ChatHistory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "sessions.sqlite"
+)
+
+
+class InMemorySessionStore:
+    """Keeps live ChatHistory objects on the server, keyed by a short session id.
+
+    Only the session id has to live in the mesop State, so the payload per event
+    no longer grows with the conversation. Sessions are evicted least recently used first
+    when there are more than `max_sessions`, and when they were not used for `ttl` seconds.
+    The async methods are for the event handlers, they run the reads and writes of a
+    `persistent` store in a thread, off the event loop.
+    """
+
+    persistent = False
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 6 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, tuple[ChatHistory, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id() -> str:
+        return secrets.token_urlsafe(12)
+
+    def get(self, session_id: str) -> ChatHistory:
+        """Returns the chat history of the session, a new one when it does not exist (anymore)."""
+        if (chat_history := self._get_memory(session_id)) is not None:
+            return chat_history
+        return self._get_stored(session_id)
+
+    async def aget(self, session_id: str) -> ChatHistory:
+        if (chat_history := self._get_memory(session_id)) is not None:
+            return chat_history
+        if self.persistent:
+            return await asyncio.to_thread(self._get_stored, session_id)
+        return self._get_stored(session_id)
+
+    def save(self, session_id: str, chat_history: ChatHistory) -> None:
+        with self._lock:
+            self._touch(session_id, chat_history)
+        self._store(session_id, chat_history)
+
+    async def asave(self, session_id: str, chat_history: ChatHistory) -> None:
+        with self._lock:
+            self._touch(session_id, chat_history)
+        if self.persistent:
+            # serialized here, the history is not changed while the thread writes it
+            await asyncio.to_thread(
+                self._store_json, session_id, chat_history.model_dump_json()
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _get_memory(self, session_id: str) -> ChatHistory | None:
+        with self._lock:
+            if (entry := self._sessions.get(session_id)) is not None:
+                if time.monotonic() - entry[1] <= self.ttl:
+                    self._touch(session_id, entry[0])
+                    return entry[0]
+                del self._sessions[session_id]
+        return None
+
+    def _get_stored(self, session_id: str) -> ChatHistory:
+        chat_history = self._load(session_id) or ChatHistory()
+        with self._lock:
+            self._touch(session_id, chat_history)
+        return chat_history
+
+    def _touch(self, session_id: str, chat_history: ChatHistory) -> None:
+        self._sessions[session_id] = (chat_history, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _load(self, session_id: str) -> ChatHistory | None:
+        return None
+
+    def _store(self, session_id: str, chat_history: ChatHistory) -> None:
+        if self.persistent:
+            self._store_json(session_id, chat_history.model_dump_json())
+
+    def _store_json(self, session_id: str, chat_history: str) -> None:
+        pass
+
+
+class SqliteSessionStore(InMemorySessionStore):
+    """Session store that also writes every session to a SQLite file.
+
+    The in-memory part is used as a cache, so a session is only validated from disk
+    after it was evicted or the app restarted.
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        max_sessions: int = 1000,
+        ttl: float = 6 * 3600,
+    ):
+        super().__init__(max_sessions=max_sessions, ttl=ttl)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, chat_history TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl,)
+            )
+
+    def _store_json(self, session_id: str, chat_history: str) -> None:
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, chat_history, updated_at) VALUES (?, ?, ?)",
+                (session_id, chat_history, time.time()),
+            )
+
+    def delete(self, session_id: str) -> None:
+        super().delete(session_id)
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _load(self, session_id: str) -> ChatHistory | None:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT chat_history FROM sessions WHERE id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return ChatHistory.model_validate_json(row[0])
+
+
+def get_session_store() -> InMemorySessionStore:
+    """Creates the session store from the environment, SESSION_STORE can be `memory` (default) or `sqlite`."""
+    max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    ttl = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+    if os.getenv("SESSION_STORE", "memory").lower() == "sqlite":
+        return SqliteSessionStore(
+            path=os.getenv("SESSION_DB_PATH", DEFAULT_DB_PATH),
+            max_sessions=max_sessions,
+            ttl=ttl,
+        )
+    return InMemorySessionStore(max_sessions=max_sessions, ttl=ttl)
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import weakref
+from collections.abc import AsyncGenerator, Callable, Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, ClassVar, Generic, TypeVar
+from urllib.parse import urlsplit
+
+import numpy as np
+from semantic_kernel.connectors.ai.chat_completion_client_base import (
+    ChatCompletionClientBase,
+)
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
+    EmbeddingGeneratorBase,
+)
+from semantic_kernel.contents import (
+    ChatHistory,
+    ChatMessageContent,
+    StreamingChatMessageContent,
+)
+from semantic_kernel.data.vector_search.vectorized_search import VectorizedSearchMixin
+from semantic_kernel.functions import KernelArguments
+
+if TYPE_CHECKING:
+    from semantic_kernel import Kernel
+    from semantic_kernel.connectors.ai.prompt_execution_settings import (
+        PromptExecutionSettings,
+    )
+    from semantic_kernel.data.kernel_search_results import KernelSearchResults
+    from semantic_kernel.data.search_options import SearchOptions
+    from semantic_kernel.data.vector_search.vector_search_result import (
+        VectorSearchResult,
+    )
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StartupTimings:
+    """Durations of the startup steps by component, in the order they finished.
+
+    The components that are created lazily are added when they are first used or warmed up,
+    so `report` shows what the app spent before serving and what it spent afterwards.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._timings: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, component: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._timings[component] = (
+                    self._timings.get(component, 0.0) + time.perf_counter() - start
+                )
+
+    def items(self) -> list[tuple[str, float]]:
+        with self._lock:
+            return list(self._timings.items())
+
+    def report(self, title: str = "Startup") -> str:
+        elapsed = time.perf_counter() - self.started
+        parts = ", ".join(
+            f"{component} {duration * 1000:.0f}ms"
+            for component, duration in self.items()
+        )
+        return f"{title} after {elapsed * 1000:.0f}ms: {parts or 'nothing measured'}"
+
+
+_timings = StartupTimings()
+
+
+def get_startup_timings() -> StartupTimings:
+    return _timings
+
+
+def preconnect(url: str | None, timeout: float = 2.0) -> None:
+    """Resolves the host of `url` and opens (and closes) a TCP connection to it.
+
+    The DNS lookup and a cold network path are then out of the way of the first request.
+    """
+    if not url:
+        return
+    parts = urlsplit(url if "://" in url else f"http://{url}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    with socket.create_connection((parts.hostname, port), timeout=timeout):
+        pass
+
+
+class LazyFactory(Generic[T]):
+    """Creates an object the first time it is needed, once, also when threads race for it.
+
+    The factories of a mode (`online` or `offline`) are kept per `group`, so the warm-up
+    can create the ones of the active mode and connect to their `endpoint` ahead of time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], T],
+        group: str | None = None,
+        endpoint: str | None = None,
+    ):
+        self.name = name
+        self.factory = factory
+        self.endpoint = endpoint
+        self._value: T | None = None
+        self._lock = threading.Lock()
+        if group:
+            _groups.setdefault(group, weakref.WeakSet()).add(self)
+
+    def get(self) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    with get_startup_timings().measure(self.name):
+                        self._value = self.factory()
+                    logger.info(f"Created {self.name}")
+        return self._value
+
+
+_groups: dict[str, "weakref.WeakSet[LazyFactory]"] = {}
+
+
+class LazyChatCompletion(ChatCompletionClientBase):
+    """Chat service that creates the wrapped service on its first call."""
+
+    SUPPORTS_FUNCTION_CALLING: ClassVar[bool] = True
+
+    lazy: LazyFactory
+
+    def __init__(self, service_id: str, ai_model_id: str, lazy: LazyFactory):
+        super().__init__(service_id=service_id, ai_model_id=ai_model_id, lazy=lazy)
+
+    @property
+    def inner(self) -> ChatCompletionClientBase:
+        return self.lazy.get()
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return self.inner.get_prompt_execution_settings_class()
+
+    def _verify_function_choice_settings(
+        self, settings: "PromptExecutionSettings"
+    ) -> None:
+        self.inner._verify_function_choice_settings(settings)
+
+    def _update_function_choice_settings_callback(self):
+        return self.inner._update_function_choice_settings_callback()
+
+    def _reset_function_choice_settings(
+        self, settings: "PromptExecutionSettings"
+    ) -> None:
+        self.inner._reset_function_choice_settings(settings)
+
+    async def _inner_get_chat_message_contents(
+        self, chat_history: ChatHistory, settings: "PromptExecutionSettings"
+    ) -> list[ChatMessageContent]:
+        return await self.inner._inner_get_chat_message_contents(chat_history, settings)
+
+    async def _inner_get_streaming_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: "PromptExecutionSettings",
+        function_invoke_attempt: int = 0,
+    ) -> AsyncGenerator[list[StreamingChatMessageContent], Any]:
+        async for messages in self.inner._inner_get_streaming_chat_message_contents(
+            chat_history, settings, function_invoke_attempt
+        ):
+            yield messages
+
+
+class LazyTextEmbedding(EmbeddingGeneratorBase):
+    """Embedding service that creates the wrapped service on its first call.
+
+    The ai_model_id has to be known up front, the embedding cache keys on it.
+    """
+
+    lazy: LazyFactory
+
+    def __init__(self, service_id: str, ai_model_id: str, lazy: LazyFactory):
+        super().__init__(service_id=service_id, ai_model_id=ai_model_id, lazy=lazy)
+
+    @property
+    def inner(self) -> EmbeddingGeneratorBase:
+        return self.lazy.get()
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return self.inner.get_prompt_execution_settings_class()
+
+    async def generate_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        return await self.inner.generate_embeddings(texts, settings, **kwargs)
+
+    async def generate_raw_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> Any:
+        return await self.inner.generate_raw_embeddings(texts, settings, **kwargs)
+
+
+class LazyVectorizedSearch(VectorizedSearchMixin):
+    """Vector search that creates the wrapped collection on the first search."""
+
+    def __init__(self, lazy: LazyFactory):
+        self.lazy = lazy
+
+    @property
+    def inner(self) -> VectorizedSearchMixin:
+        return self.lazy.get()
+
+    async def vectorized_search(
+        self,
+        vector: list[float | int],
+        options: "SearchOptions | None" = None,
+        **kwargs: Any,
+    ) -> "KernelSearchResults[VectorSearchResult]":
+        return await self.inner.vectorized_search(
+            vector=vector, options=options, **kwargs
+        )
+
+
+async def _warm_up(kernel: "Kernel", service_id: str) -> None:
+    timings = get_startup_timings()
+    connected: set[str] = set()
+    for lazy in list(_groups.get(service_id, ())):
+        try:
+            await asyncio.to_thread(lazy.get)
+            if lazy.endpoint and lazy.endpoint not in connected:
+                connected.add(lazy.endpoint)
+                with timings.measure(f"connect {lazy.endpoint}"):
+                    await asyncio.to_thread(preconnect, lazy.endpoint)
+        except Exception as exc:
+            logger.warning(f"Could not warm up {lazy.name}: {exc}")
+    # renders the chat prompt once and builds the function metadata the first turn needs
+    with timings.measure("prompt template"):
+        function = kernel.get_function("chat", "chat")
+        await function.prompt_template.render(
+            kernel, KernelArguments(chat_history=ChatHistory(), user_input="")
+        )
+        kernel.get_full_list_of_function_metadata()
+
+
+def start_warm_up(kernel: "Kernel") -> threading.Thread | None:
+    """Creates the services of the mode that is active now and connects to them, in the background.
+
+    Set KERNEL_WARMUP to `false` to create everything on first use instead.
+    """
+    if os.getenv("KERNEL_WARMUP", "true").lower() != "true":
+        return None
+    selector = kernel.ai_service_selector
+
+    def run() -> None:
+        # the mode is only known after the first connectivity probe
+        if connectivity := getattr(selector, "connectivity", None):
+            connectivity.wait_for_first_probe(timeout=connectivity.timeout + 1)
+        service_id = selector.preferred_service_id()
+        asyncio.run(_warm_up(kernel, service_id))
+        logger.info(get_startup_timings().report(f"Warm-up of {service_id}"))
+
+    thread = threading.Thread(target=run, name="kernel-warm-up", daemon=True)
+    thread.start()
+    return thread
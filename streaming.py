@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections.abc import AsyncGenerator, AsyncIterable
+from typing import Any
+
+from semantic_kernel.contents import (
+    AuthorRole,
+    ChatMessageContent,
+    StreamingChatMessageContent,
+    TextContent,
+)
+
+
+class StreamingMessageAggregator:
+    """Builds the final assistant message from the streamed chunks in linear time.
+
+    Only the text is kept, like the message that goes into the chat history,
+    so function call chunks are dropped as they come in.
+    """
+
+    def __init__(self):
+        self._parts: list[str] = []
+        self._last: StreamingChatMessageContent | None = None
+
+    def add(self, chunk: StreamingChatMessageContent) -> None:
+        self._last = chunk
+        for item in chunk.items:
+            if isinstance(item, TextContent) and item.text:
+                self._parts.append(item.text)
+
+    def clear(self) -> None:
+        self._parts.clear()
+        self._last = None
+
+    def build(self) -> ChatMessageContent:
+        return ChatMessageContent(
+            role=AuthorRole.ASSISTANT,
+            items=[TextContent(text="".join(self._parts))],
+            ai_model_id=self._last.ai_model_id if self._last else None,
+            metadata=self._last.metadata if self._last else {},
+        )
+
+
+async def coalesce(
+    stream: AsyncIterable[Any],
+    interval: float = 0.05,
+    max_bytes: int | None = None,
+) -> AsyncGenerator[Any, Any]:
+    """Batches the strings of a stream, so the UI is updated at most once every `interval` seconds.
+
+    A batch is also released when it reaches `max_bytes`. The first chunk is released straight away
+    and anything that is not a string is passed on as is, after releasing the pending text.
+    """
+    iterator = stream.__aiter__()
+    # every step of the stream runs in the same context, so a context variable
+    # the stream sets (like the current span) is still there in the next step
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    buffer: list[str] = []
+    size = 0
+    last_flush = 0.0
+    pending: asyncio.Task | None = None
+    try:
+        while True:
+            if pending is None:
+                pending = loop.create_task(anext(iterator), context=context)
+            timeout = None
+            if buffer:
+                timeout = max(interval - (time.monotonic() - last_flush), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                last_flush = time.monotonic()
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+            if not isinstance(item, str):
+                if buffer:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    size = 0
+                yield item
+                continue
+            buffer.append(item)
+            size += len(item.encode())
+            if time.monotonic() - last_flush >= interval or (
+                max_bytes and size >= max_bytes
+            ):
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                last_flush = time.monotonic()
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def coalesce_settings() -> dict[str, Any]:
+    """The `coalesce` arguments from STREAM_FLUSH_INTERVAL_MS and STREAM_FLUSH_BYTES."""
+    max_bytes = int(os.getenv("STREAM_FLUSH_BYTES", "0"))
+    return {
+        "interval": float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50")) / 1000,
+        "max_bytes": max_bytes or None,
+    }
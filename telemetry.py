@@ -0,0 +1,528 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from collections.abc import AsyncGenerator, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, ClassVar
+
+import numpy as np
+from semantic_kernel import Kernel
+from semantic_kernel.connectors.ai.chat_completion_client_base import (
+    ChatCompletionClientBase,
+)
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
+    EmbeddingGeneratorBase,
+)
+from semantic_kernel.contents import (
+    ChatHistory,
+    ChatMessageContent,
+    FunctionCallContent,
+    StreamingChatMessageContent,
+)
+from semantic_kernel.filters.auto_function_invocation.auto_function_invocation_context import (
+    AutoFunctionInvocationContext,
+)
+from semantic_kernel.filters.filter_types import FilterTypes
+
+if TYPE_CHECKING:
+    from semantic_kernel.connectors.ai.prompt_execution_settings import (
+        PromptExecutionSettings,
+    )
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# attributes of a span that become labels of its metrics, the others only go in the trace
+METRIC_LABELS = ("service_id", "function", "status")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent: "Span | None"
+    sampled: bool
+    start: float
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration: float | None = None
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+    # attributes that are totals of the child spans, their metrics were counted there
+    _totals: set[str] = field(default_factory=set, repr=False)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, name: str, value: float) -> None:
+        """Adds to a numeric attribute, like the tokens of all model calls of a turn."""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+        self._totals.add(name)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._help: dict[str, tuple[str, str]] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help: str) -> None:
+        self._help[name] = (kind, help)
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # one count per bucket, then the sum and the total count
+            values = self._histograms.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+        lines = []
+        for name in sorted({name for name, _ in [*counters, *histograms]}):
+            if name in self._help:
+                kind, help = self._help[name]
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._labels(labels)} {value:g}")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(
+                    [*self.buckets, "+Inf"], values[:-2] + [values[-1]]
+                ):
+                    le = bound if bound == "+Inf" else f"{bound:g}"
+                    lines.append(
+                        f"{name}_bucket{self._labels(labels + (('le', le),))} {count:g}"
+                    )
+                lines.append(f"{name}_sum{self._labels(labels)} {values[-2]:g}")
+                lines.append(f"{name}_count{self._labels(labels)} {values[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{_label(value)}"' for key, value in labels) + "}"
+
+
+class JsonlExporter:
+    """Appends the finished spans to a JSON lines file from a background thread.
+
+    The request path only puts the span on a bounded queue, when the writer falls
+    behind spans are dropped instead of slowing down the chat.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue[dict | None] = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name="trace-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            while (item := self._queue.get()) is not None:
+                file.write(json.dumps(item, default=str) + "\n")
+                if self._queue.empty():
+                    file.flush()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class Telemetry:
+    """Spans for the chat turns, model calls, search functions and embedding calls.
+
+    Every finished span is counted in the metrics (its duration per name, service id and
+    function, plus the tokens), which are served on `/metrics`. A `sample_rate` share of
+    the turns is also written as a trace to the exporter, the spans of a turn are all
+    kept or all dropped.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, exporter: JsonlExporter | None = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.metrics = Metrics()
+        self.metrics.describe(
+            "chat_span_duration_seconds", "histogram", "Duration of the spans"
+        )
+        self.metrics.describe(
+            "chat_time_to_first_token_seconds",
+            "histogram",
+            "Time until the first chunk of a model call",
+        )
+        self.metrics.describe("chat_tokens_total", "counter", "Tokens per service")
+        self.metrics.describe(
+            "chat_span_errors_total", "counter", "Spans that ended with an error"
+        )
+        self._server: ThreadingHTTPServer | None = None
+
+    def start_span(
+        self, name: str, parent: Span | None = None, **attributes: Any
+    ) -> Span:
+        parent = parent or _current.get()
+        if parent is None:
+            trace_id, sampled = (
+                secrets.token_hex(16),
+                random.random() < self.sample_rate,
+            )
+        else:
+            trace_id, sampled = parent.trace_id, parent.sampled
+        return Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=secrets.token_hex(8),
+            parent=parent,
+            sampled=sampled,
+            start=time.time(),
+            attributes=attributes,
+        )
+
+    def end_span(self, span: Span, error: BaseException | None = None) -> None:
+        if span.duration is not None:
+            return
+        span.duration = span.elapsed
+        if error is not None:
+            span.set(status="error", error=f"{type(error).__name__}: {error}")
+            self.metrics.inc("chat_span_errors_total", span=span.name)
+        labels = {
+            name: span.attributes[name]
+            for name in METRIC_LABELS
+            if span.attributes.get(name) is not None
+        }
+        self.metrics.observe(
+            "chat_span_duration_seconds", span.duration, span=span.name, **labels
+        )
+        if (ttft := span.attributes.get("ttft")) is not None:
+            self.metrics.observe(
+                "chat_time_to_first_token_seconds", ttft, span=span.name, **labels
+            )
+        for kind in ("prompt_tokens", "completion_tokens", "embedding_tokens"):
+            if kind in span._totals:
+                continue
+            if tokens := span.attributes.get(kind):
+                self.metrics.inc(
+                    "chat_tokens_total",
+                    tokens,
+                    kind=kind.removesuffix("_tokens"),
+                    service_id=span.attributes.get("service_id", ""),
+                )
+        if span.sampled and self.exporter is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Starts a span that is the parent of the spans started inside of it."""
+        span = self.start_span(name, **attributes)
+        previous = _current.get()
+        _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            self.end_span(span, exc)
+            raise
+        finally:
+            # set instead of reset, an async generator may end in another context
+            _current.set(previous)
+            self.end_span(span)
+
+    async def auto_function_invocation_filter(
+        self, context: AutoFunctionInvocationContext, next
+    ):
+        with self.span(
+            "chat.function",
+            function=context.function.fully_qualified_name,
+            request_index=context.request_sequence_index,
+        ) as span:
+            await next(context)
+            result = context.function_result
+            span.set(result_chars=len(str(result.value)) if result else 0)
+
+    def register(self, kernel: Kernel) -> None:
+        kernel.add_filter(
+            FilterTypes.AUTO_FUNCTION_INVOCATION, self.auto_function_invocation_filter
+        )
+
+    def serve_metrics(self, port: int, host: str = "127.0.0.1") -> None:
+        """Serves the metrics on http://host:port/metrics from a background thread."""
+        if self._server is not None:
+            return
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as exc:
+            logger.warning(f"Could not serve the metrics on {host}:{port}: {exc}")
+            return
+        threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        ).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+def _usage(message: StreamingChatMessageContent | ChatMessageContent):
+    return (message.metadata or {}).get("usage")
+
+
+class TracedChatCompletion(ChatCompletionClientBase):
+    """Chat service that wraps another one and records a span per model call.
+
+    The auto function invocation loop runs in this wrapper, so every round trip to
+    the model is a span of its own, with the service id, the time to first token and
+    the token counts. It keeps the service_id and ai_model_id of the wrapped service.
+    """
+
+    SUPPORTS_FUNCTION_CALLING: ClassVar[bool] = True
+
+    inner: ChatCompletionClientBase
+    telemetry: Any
+
+    def __init__(self, inner: ChatCompletionClientBase, telemetry: Telemetry):
+        super().__init__(
+            service_id=inner.service_id,
+            ai_model_id=inner.ai_model_id,
+            inner=inner,
+            telemetry=telemetry,
+        )
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return self.inner.get_prompt_execution_settings_class()
+
+    def _verify_function_choice_settings(
+        self, settings: "PromptExecutionSettings"
+    ) -> None:
+        self.inner._verify_function_choice_settings(settings)
+
+    def _update_function_choice_settings_callback(self):
+        return self.inner._update_function_choice_settings_callback()
+
+    def _reset_function_choice_settings(
+        self, settings: "PromptExecutionSettings"
+    ) -> None:
+        self.inner._reset_function_choice_settings(settings)
+
+    def _start(self, streaming: bool) -> Span:
+        return self.telemetry.start_span(
+            "chat.model",
+            service_id=self.service_id,
+            model=self.ai_model_id,
+            streaming=streaming,
+        )
+
+    def _finish(self, span: Span, usage, estimated: int, tool_calls: int) -> None:
+        prompt = getattr(usage, "prompt_tokens", None)
+        completion = getattr(usage, "completion_tokens", None)
+        span.set(
+            completion_tokens=completion if completion is not None else estimated,
+            tool_calls=tool_calls,
+        )
+        if prompt is not None:
+            span.set(prompt_tokens=prompt)
+        if span.parent is not None:
+            span.parent.add("prompt_tokens", prompt or 0)
+            span.parent.add("completion_tokens", span.attributes["completion_tokens"])
+
+    async def _inner_get_chat_message_contents(
+        self, chat_history: ChatHistory, settings: "PromptExecutionSettings"
+    ) -> list[ChatMessageContent]:
+        span = self._start(streaming=False)
+        try:
+            messages = await self.inner._inner_get_chat_message_contents(
+                chat_history, settings
+            )
+        except BaseException as exc:
+            self.telemetry.end_span(span, exc)
+            raise
+        self._finish(
+            span,
+            next((usage for m in messages if (usage := _usage(m))), None),
+            sum(len(m.content or "") // 4 for m in messages),
+            sum(
+                isinstance(item, FunctionCallContent)
+                for m in messages
+                for item in m.items
+            ),
+        )
+        self.telemetry.end_span(span)
+        return messages
+
+    async def _inner_get_streaming_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: "PromptExecutionSettings",
+        function_invoke_attempt: int = 0,
+    ) -> AsyncGenerator[list[StreamingChatMessageContent], Any]:
+        span = self._start(streaming=True)
+        usage, chunks, tool_calls, error = None, 0, 0, None
+        try:
+            async for messages in self.inner._inner_get_streaming_chat_message_contents(
+                chat_history, settings, function_invoke_attempt
+            ):
+                if "ttft" not in span.attributes:
+                    span.set(ttft=span.elapsed)
+                for message in messages:
+                    if message is None:
+                        continue
+                    usage = _usage(message) or usage
+                    chunks += bool(message.content)
+                    tool_calls += sum(
+                        isinstance(item, FunctionCallContent) for item in message.items
+                    )
+                yield messages
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            # without usage the streamed chunks are the best guess of the tokens
+            self._finish(span, usage, chunks, tool_calls)
+            # an abandoned stream (like a failover) ends with GeneratorExit, that is no error
+            self.telemetry.end_span(
+                span, error if not isinstance(error, GeneratorExit) else None
+            )
+
+
+class TracedTextEmbedding(EmbeddingGeneratorBase):
+    """Embedding service that wraps another one and records a span per call."""
+
+    inner: EmbeddingGeneratorBase
+    telemetry: Any
+
+    def __init__(self, inner: EmbeddingGeneratorBase, telemetry: Telemetry):
+        super().__init__(
+            service_id=inner.service_id,
+            ai_model_id=inner.ai_model_id,
+            inner=inner,
+            telemetry=telemetry,
+        )
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return self.inner.get_prompt_execution_settings_class()
+
+    async def generate_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        return np.array(await self.generate_raw_embeddings(texts, settings, **kwargs))
+
+    async def generate_raw_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> Any:
+        span = self.telemetry.start_span(
+            "embedding",
+            service_id=self.service_id,
+            model=self.ai_model_id,
+            texts=len(texts),
+        )
+        try:
+            embeddings = await self.inner.generate_raw_embeddings(
+                texts, settings, **kwargs
+            )
+        except BaseException as exc:
+            self.telemetry.end_span(span, exc)
+            raise
+        # estimated, the embedding APIs do not return the usage to the callers
+        span.set(embedding_tokens=sum(len(text) // 4 + 1 for text in texts))
+        if span.parent is not None:
+            span.parent.add("embedding_tokens", span.attributes["embedding_tokens"])
+        self.telemetry.end_span(span)
+        return embeddings
+
+
+_telemetry: Telemetry | None = None
+
+
+def get_telemetry() -> Telemetry:
+    """Returns the process wide telemetry, configured from the environment.
+
+    TRACE_SAMPLE_RATE is the share of the turns written to the TRACE_PATH JSON lines file.
+    """
+    global _telemetry
+    if _telemetry is None:
+        trace_path = os.getenv("TRACE_PATH")
+        _telemetry = Telemetry(
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+            exporter=JsonlExporter(trace_path) if trace_path else None,
+        )
+    return _telemetry
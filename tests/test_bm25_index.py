@@ -0,0 +1,64 @@
+from data_ingestion.bm25_index import BM25Index, tokenize
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("OllamaChatCompletion") == [
+        "ollamachatcompletion",
+        "ollama",
+        "chat",
+        "completion",
+    ]
+    assert tokenize("get_chat_message_content") == [
+        "get_chat_message_content",
+        "get",
+        "chat",
+        "message",
+        "content",
+    ]
+
+
+def test_acronyms_and_numbers():
+    assert tokenize("HTTPClient v2") == ["httpclient", "http", "client", "v2"]
+
+
+def test_single_characters_are_dropped():
+    assert tokenize("a = b + c_d") == ["c_d"]
+
+
+def test_search_ranks_the_exact_identifier_first():
+    index = BM25Index.build(
+        [
+            ("1", "class OllamaChatCompletion(ChatCompletionClientBase):", {}),
+            ("2", "class OpenAIChatCompletion(ChatCompletionClientBase):", {}),
+            ("3", "def add_numbers(a, b): return a + b", {}),
+        ]
+    )
+
+    hits = index.search("OllamaChatCompletion", top=2)
+
+    assert [hit.id for hit in hits][0] == "1"
+    assert "3" not in [hit.id for hit in hits]
+
+
+def test_search_filters_on_the_metadata():
+    index = BM25Index.build(
+        [
+            ("1", "kernel function", {"topic": "python"}),
+            ("2", "kernel function", {"topic": "dotnet"}),
+        ]
+    )
+
+    hits = index.search("kernel", filters={"topic": "dotnet"})
+
+    assert [hit.id for hit in hits] == ["2"]
+
+
+def test_save_and_load(tmp_path):
+    index = BM25Index.build([("1", "vector store", {"topic": "python"}, "a.py")])
+    path = str(tmp_path / "index.json.gz")
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+
+    assert [hit.id for hit in loaded.search("store")] == ["1"]
+    assert list(loaded.chunks()) == list(index.chunks())
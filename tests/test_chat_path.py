@@ -0,0 +1,71 @@
+import asyncio
+
+from semantic_kernel.contents import ChatHistory
+from semantic_kernel.filters.filter_types import FilterTypes
+
+from benchmarks.chat_latency import build_collections
+from benchmarks.fakes import FakeChatCompletion, FakeTextEmbedding
+
+CHUNKS = [
+    ("samples/agents.py:0", "chat completion agent with a kernel plugin", "samples"),
+    ("samples/ollama.py:0", "add the ollama chat completion service", "samples"),
+    ("python/kernel.py:0", "class Kernel adds services and plugins", "semantic_kernel"),
+]
+
+
+def test_a_turn_streams_through_the_kernel_with_a_search(tmp_path, monkeypatch):
+    # the fakes stand in for every remote service, the caches stay out of the way
+    monkeypatch.setenv("MODE", "online")
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    monkeypatch.setenv("SEARCH_CACHE", "false")
+    from backend import get_kernel
+    from data_ingestion.datamodel import (
+        EMBEDDING_DIMENSIONS,
+        OLLAMA_EMBEDDING_DIMENSIONS,
+    )
+
+    chat = FakeChatCompletion(
+        "online", first_token_latency=0, tokens_per_second=1000, answer_tokens=5
+    )
+    embedders = {
+        service_id: FakeTextEmbedding(service_id, dimensions=dimensions, latency=0)
+        for service_id, dimensions in (
+            ("online", EMBEDDING_DIMENSIONS),
+            ("offline", OLLAMA_EMBEDDING_DIMENSIONS or EMBEDDING_DIMENSIONS),
+        )
+    }
+
+    async def turn() -> tuple[str, list[str]]:
+        collections, keyword_indexes = await build_collections(
+            CHUNKS, embedders, str(tmp_path), hybrid=True
+        )
+        kernel = get_kernel(
+            chat_services={
+                "online": chat,
+                "offline": FakeChatCompletion("offline", first_token_latency=0),
+            },
+            embedders=embedders,
+            collections=collections,
+            keyword_indexes=keyword_indexes,
+        )
+        functions = []
+
+        @kernel.filter(FilterTypes.FUNCTION_INVOCATION)
+        async def record(context, next):
+            functions.append(f"{context.function.plugin_name}.{context.function.name}")
+            await next(context)
+
+        answer = ""
+        async for response in kernel.invoke_stream(
+            function_name="chat",
+            plugin_name="chat",
+            chat_history=ChatHistory(),
+            user_input="How do I add the ollama service?",
+        ):
+            answer += response[0].content or ""
+        return answer, functions
+
+    answer, functions = asyncio.run(turn())
+
+    assert answer == "".join(chat._answer())
+    assert "online_search.code_sample_search" in functions
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from app_loop import AppLoop
+from clients import ClientRegistry
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+async def get(registry: ClientRegistry) -> FakeClient:
+    return registry._get("fake", FakeClient)
+
+
+def test_clients_are_shared_within_a_loop_and_separate_between_loops():
+    registry = ClientRegistry()
+
+    async def twice():
+        return await get(registry), await get(registry)
+
+    first, again = asyncio.run(twice())
+    other = asyncio.run(get(registry))
+
+    assert first is again
+    assert first is not other
+
+
+def test_clients_outside_a_loop_are_those_of_the_app_loop():
+    app_loop = AppLoop()
+    registry = ClientRegistry(loop=app_loop.loop)
+
+    created = registry._get("fake", FakeClient)
+    used = asyncio.run_coroutine_threadsafe(get(registry), app_loop.loop).result()
+    registry.shutdown()
+
+    assert created is used
+    assert created.closed
+
+
+def test_stream_runs_on_the_app_loop():
+    app_loop = AppLoop()
+
+    async def numbers():
+        for number in range(3):
+            await asyncio.sleep(0)
+            yield number, asyncio.get_running_loop()
+
+    async def collect():
+        return [item async for item in app_loop.stream(numbers())]
+
+    items = asyncio.run(collect())
+
+    assert [number for number, _ in items] == [0, 1, 2]
+    assert all(loop is app_loop.loop for _, loop in items)
+
+
+def test_stream_raises_the_error_of_the_iterable():
+    app_loop = AppLoop()
+
+    async def failing():
+        yield 1
+        raise ValueError("boom")
+
+    async def collect():
+        return [item async for item in app_loop.stream(failing())]
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(collect())
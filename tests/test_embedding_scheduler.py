@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from data_ingestion.embedding_scheduler import AdaptiveLimiter, TokenBucket
+
+
+def test_bucket_allows_a_burst_of_one_minute():
+    async def run():
+        bucket = TokenBucket(6000)
+        start = time.monotonic()
+        await bucket.acquire(6000)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_bucket_waits_for_the_tokens_to_refill():
+    async def run():
+        # 6000 per minute is 100 per second
+        bucket = TokenBucket(6000)
+        await bucket.acquire(6000)
+        start = time.monotonic()
+        await bucket.acquire(20)
+        return time.monotonic() - start
+
+    assert 0.15 < asyncio.run(run()) < 0.5
+
+
+def test_bucket_charges_a_request_larger_than_the_rate_in_full():
+    async def run():
+        bucket = TokenBucket(6000)
+        await bucket.acquire(6010)
+        return bucket._tokens
+
+    assert asyncio.run(run()) < -9
+
+
+def test_bucket_without_rate_does_not_wait():
+    async def run():
+        await TokenBucket(0).acquire(10**9)
+
+    asyncio.run(run())
+
+
+def test_limiter_halves_once_per_cooldown_and_grows_back():
+    async def run():
+        limiter = AdaptiveLimiter(8, maximum=16, cooldown=60)
+        await limiter.throttled()
+        await limiter.throttled()
+        halved = limiter.limit
+        for _ in range(8):
+            limiter.success()
+        return halved, limiter.limit
+
+    halved, grown = asyncio.run(run())
+    assert halved == 4
+    assert 5 < grown < 6
+
+
+def test_limiter_keeps_to_the_limit():
+    async def run():
+        limiter = AdaptiveLimiter(2)
+        running = peak = 0
+
+        async def work():
+            nonlocal running, peak
+            async with limiter:
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[work() for _ in range(10)])
+        return peak
+
+    assert asyncio.run(run()) == 2
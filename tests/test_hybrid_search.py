@@ -0,0 +1,20 @@
+from hybrid_search import reciprocal_rank_fusion
+
+
+def test_ids_in_both_lists_rank_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]])
+
+    assert fused[:2] == ["a", "c"]
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_scores_are_one_over_k_plus_rank():
+    # a: 1 / 2 + 1 / 5, b: 1 / 3 + 1 / 3, c: 1 / 2, d: 1 / 4
+    fused = reciprocal_rank_fusion([["a", "b"], ["c", "b", "d", "a"]], k=1)
+
+    assert fused == ["a", "b", "c", "d"]
+
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], ["a"]]) == ["a"]
@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+
+from data_ingestion.bm25_index import BM25Index
+from data_ingestion.manifest import Manifest
+from data_ingestion.numpy_index import NumpyVectorIndex
+from data_ingestion.sources import LocalSource
+
+LICENSE = "# Copyright (c) Microsoft. All rights reserved.\n"
+
+
+def write_checkout(root, files: dict[str, str]) -> None:
+    for path, text in files.items():
+        target = root.joinpath(*path.split("/"))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text)
+
+
+def test_identical_files_are_separate_documents(tmp_path):
+    write_checkout(
+        tmp_path,
+        {"python/a/__init__.py": LICENSE, "python/b/__init__.py": LICENSE},
+    )
+    source = LocalSource(str(tmp_path), ["python"], [".py"])
+    files = asyncio.run(source.list_files())
+    documents = asyncio.run(source.fetch(files))
+
+    assert files["python/a/__init__.py"] == files["python/b/__init__.py"]
+    assert [document.doc_id for document in documents] == [
+        "python/a/__init__.py",
+        "python/b/__init__.py",
+    ]
+
+
+def test_deleting_one_of_two_identical_files_keeps_the_other(tmp_path):
+    write_checkout(
+        tmp_path,
+        {"python/a/__init__.py": LICENSE, "python/b/__init__.py": LICENSE},
+    )
+    source = LocalSource(str(tmp_path), ["python"], [".py"])
+    files = asyncio.run(source.list_files())
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.update(["numpy", "bm25"], files)
+
+    (tmp_path / "python" / "a" / "__init__.py").unlink()
+    files = asyncio.run(LocalSource(str(tmp_path), ["python"], [".py"]).list_files())
+
+    assert manifest.changed("numpy", files) == set()
+    stale = manifest.stale("numpy", files)
+    assert stale == {"python/a/__init__.py"}
+
+    index = NumpyVectorIndex(str(tmp_path / "index"), 4)
+    index.upsert(
+        ["a-0", "b-0"],
+        np.eye(4)[:2],
+        [
+            {"ref_doc_id": "python/a/__init__.py"},
+            {"ref_doc_id": "python/b/__init__.py"},
+        ],
+    )
+    index.delete_where("ref_doc_id", stale)
+    assert index.ids == ["b-0"]
+
+    keywords = BM25Index.build(
+        [
+            ("a-0", LICENSE, {}, "python/a/__init__.py"),
+            ("b-0", LICENSE, {}, "python/b/__init__.py"),
+        ]
+    ).without_documents(stale)
+    assert keywords.ids == ["b-0"]
@@ -0,0 +1,38 @@
+from data_ingestion.manifest import Manifest
+
+
+def test_changed_files(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.update(["azure"], {"a.py": "1", "b.py": "2"})
+
+    files = {"a.py": "1", "b.py": "3", "c.py": "4"}
+
+    assert manifest.changed("azure", files) == {"b.py", "c.py"}
+    # a target that was never written needs every file
+    assert manifest.changed("qdrant", files) == set(files)
+
+
+def test_stale_documents(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.update(["azure"], {"a.py": "1", "b.py": "2", "gone.py": "3"})
+    files = {"a.py": "1", "b.py": "5"}
+
+    # a full run only removes the files that are gone
+    assert manifest.stale("azure", files) == {"gone.py"}
+    # an incremental run also removes the old version of what it processes again
+    assert manifest.stale("azure", files, processed={"b.py"}) == {"b.py", "gone.py"}
+
+
+def test_record_and_reload(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = Manifest(path)
+    manifest.record(["azure", "bm25_azure"], {"a.py": "1"})
+    manifest.record(["azure"], {"b.py": "2"})
+
+    loaded = Manifest.load(path)
+
+    assert loaded.targets == {
+        "azure": {"a.py": "1", "b.py": "2"},
+        "bm25_azure": {"a.py": "1"},
+    }
+    assert Manifest.load(str(tmp_path / "missing.json")).targets == {}
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from data_ingestion.numpy_index import NumpyVectorIndex, quantize, truncate
+
+
+def clustered(count: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(16, dimensions))
+    return (
+        centers[rng.integers(0, 16, count)] + 0.5 * rng.normal(size=(count, dimensions))
+    ).astype(np.float32)
+
+
+def recall(index: NumpyVectorIndex, exact: NumpyVectorIndex, queries, top=10):
+    found = index.search_batch(queries, top=top)
+    truth = exact.search_batch(queries, top=top)
+    return np.mean(
+        [
+            len({row for row, _ in a} & {row for row, _ in b}) / top
+            for a, b in zip(found, truth)
+        ]
+    )
+
+
+@pytest.fixture(scope="module")
+def data():
+    vectors = clustered(2000, 64)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), 50, replace=False)]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+    return vectors, queries
+
+
+def build(tmp_path, vectors, quantization="none", oversampling=4.0):
+    index = NumpyVectorIndex(
+        str(tmp_path), vectors.shape[1], quantization, oversampling
+    )
+    ids = [str(row) for row in range(len(vectors))]
+    index.upsert(ids, vectors, [{"group": str(row % 2)} for row in range(len(ids))])
+    return index
+
+
+def test_int8_codes_round_trip():
+    vectors = clustered(100, 8)
+    codes, scale = quantize(vectors, "int8")
+
+    assert codes.dtype == np.int8
+    assert np.abs(codes.astype(np.float32) * scale - vectors).max() <= scale.max()
+
+
+def test_binary_codes_are_the_packed_signs():
+    vectors = np.array([[1, -1, 0.5, -2, 0, 3, -1, 1, 2]], dtype=np.float32)
+    codes, scale = quantize(vectors, "binary")
+
+    assert scale is None
+    assert codes.tolist() == [[0b10100101, 0b10000000]]
+
+
+@pytest.mark.parametrize(
+    "quantization,oversampling,minimum",
+    # the sign bits alone are coarse, they need a longer shortlist
+    [("int8", 4.0, 0.95), ("binary", 10.0, 0.9)],
+)
+def test_rescoring_keeps_the_recall(
+    tmp_path, data, quantization, oversampling, minimum
+):
+    vectors, queries = data
+    exact = build(tmp_path / "exact", vectors)
+    quantized = build(tmp_path / quantization, vectors, quantization, oversampling)
+
+    assert recall(quantized, exact, queries) >= minimum
+    # the rescored similarities are the exact ones
+    row, score = quantized.search(queries[0], top=1)[0]
+    assert score == pytest.approx(exact.search(queries[0], top=1)[0][1], abs=1e-5)
+
+
+def test_quantized_index_survives_a_save(tmp_path, data):
+    vectors, queries = data
+    index = build(tmp_path / "index", vectors, "int8")
+    index.save()
+
+    loaded = NumpyVectorIndex.open(str(tmp_path / "index"))
+
+    assert loaded.quantization == "int8"
+    assert loaded.search_batch(queries, top=5) == index.search_batch(queries, top=5)
+
+
+def test_filters(tmp_path, data):
+    vectors, queries = data
+    index = build(tmp_path, vectors)
+
+    results = index.search(queries[0], top=5, filters={"group": "1"})
+
+    assert all(index.columns["group"][row] == "1" for row, _ in results)
+
+
+def test_truncation_normalizes_again(data):
+    vectors, _ = data
+
+    short = truncate(vectors[:3], 16)
+
+    assert short.shape == (3, 16)
+    assert np.allclose(np.linalg.norm(short, axis=1), 1)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from response_cache import SemanticResponseCache
+from telemetry import Metrics
+
+
+def unit(*values: float) -> np.ndarray:
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_hits_and_misses_are_counted_per_service():
+    metrics = Metrics()
+    cache = SemanticResponseCache(kernel=None, threshold=0.95, metrics=metrics)
+
+    assert cache.lookup(unit(1, 0), "online") is None
+    cache.store("question", unit(1, 0), "answer", "online")
+    assert cache.lookup(unit(1, 0.01), "online") == "answer"
+    assert cache.lookup(unit(0, 1), "online") is None
+    # the offline entries are kept apart
+    assert cache.lookup(unit(1, 0), "offline") is None
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE chat_response_cache_lookups_total counter" in lines
+    assert (
+        'chat_response_cache_lookups_total{result="hit",service_id="online"} 1' in lines
+    )
+    assert (
+        'chat_response_cache_lookups_total{result="miss",service_id="online"} 2'
+        in lines
+    )
+    assert (
+        'chat_response_cache_lookups_total{result="miss",service_id="offline"} 1'
+        in lines
+    )
+    assert cache.hit_rate == 0.25
@@ -0,0 +1,50 @@
+from telemetry import Metrics, Telemetry
+
+
+def test_counters_with_labels():
+    metrics = Metrics()
+    metrics.describe("chat_turns_total", "counter", "Chat turns")
+    metrics.inc("chat_turns_total", service_id="online")
+    metrics.inc("chat_turns_total", 2, service_id="online")
+    metrics.inc("chat_turns_total", service_id='off"line')
+
+    assert metrics.render().splitlines() == [
+        "# HELP chat_turns_total Chat turns",
+        "# TYPE chat_turns_total counter",
+        'chat_turns_total{service_id="off\\"line"} 1',
+        'chat_turns_total{service_id="online"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics(buckets=(0.1, 1))
+    metrics.observe("latency_seconds", 0.05)
+    metrics.observe("latency_seconds", 0.5)
+    metrics.observe("latency_seconds", 5)
+
+    assert metrics.render().splitlines() == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+
+def test_empty_metrics():
+    assert Metrics().render() == "\n"
+
+
+def test_tokens_of_a_child_are_counted_once():
+    telemetry = Telemetry()
+    with telemetry.span("chat.turn", service_id="online") as turn:
+        span = telemetry.start_span("embedding", service_id="online")
+        span.set(embedding_tokens=10)
+        span.parent.add("embedding_tokens", 10)
+        telemetry.end_span(span)
+
+    assert turn.attributes["embedding_tokens"] == 10
+    assert (
+        'chat_tokens_total{kind="embedding",service_id="online"} 10'
+        in telemetry.metrics.render().splitlines()
+    )
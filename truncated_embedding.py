@@ -0,0 +1,59 @@
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from semantic_kernel.connectors.ai.embeddings.embedding_generator_base import (
+    EmbeddingGeneratorBase,
+)
+
+from data_ingestion.numpy_index import truncate
+
+if TYPE_CHECKING:
+    from semantic_kernel.connectors.ai.prompt_execution_settings import (
+        PromptExecutionSettings,
+    )
+
+
+class TruncatedTextEmbedding(EmbeddingGeneratorBase):
+    """Embedding service that returns vectors of `dimensions`, the size the index was built with.
+
+    With `native` the wrapped service is asked for the shorter vectors (the `dimensions`
+    setting of OpenAI text-embedding-3), otherwise the vectors are cut to size and
+    normalized again, which works for any Matryoshka embedding model.
+    """
+
+    inner: EmbeddingGeneratorBase
+    dimensions: int
+    native: bool = False
+
+    def __init__(
+        self, inner: EmbeddingGeneratorBase, dimensions: int, native: bool = False
+    ):
+        super().__init__(
+            service_id=inner.service_id,
+            ai_model_id=inner.ai_model_id,
+            inner=inner,
+            dimensions=dimensions,
+            native=native,
+        )
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return self.inner.get_prompt_execution_settings_class()
+
+    async def generate_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> np.ndarray:
+        return np.array(await self.generate_raw_embeddings(texts, settings, **kwargs))
+
+    async def generate_raw_embeddings(
+        self,
+        texts: list[str],
+        settings: "PromptExecutionSettings | None" = None,
+        **kwargs: Any,
+    ) -> list[list[float]]:
+        if self.native:
+            kwargs.setdefault("dimensions", self.dimensions)
+        raw = await self.inner.generate_raw_embeddings(texts, settings, **kwargs)
+        return truncate(raw, self.dimensions).tolist()
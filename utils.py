@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import socket
 import logging
 import os
@@ -5,21 +7,38 @@ import os
 logger = logging.getLogger(__name__)
 
 
+def forced_online_state() -> bool | None:
+    """Returns the online state set through the MODE environment variable, or None when it should be probed."""
+    if mode := os.getenv("MODE", None):
+        if mode in ("offline", "online"):
+            return not (mode == "offline")
+    return None
+
+
 def internet(host="1.1.1.1", port=53, timeout=3):
     """
     Host: 1.1.1.1
     OpenPort: 53/tcp
     Service: domain (DNS/TCP)
     """
-    if mode := os.getenv("MODE", None):
-        if mode in ("offline", "online"):
-            return not (mode == "offline")
+    if (forced := forced_online_state()) is not None:
+        return forced
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            logger.debug("I'm online!")
+            return True
+    except OSError:
+        logger.debug("I'm offline!")
+        return False
+
+
+async def internet_async(host="1.1.1.1", port=53, timeout=3):
+    """Async version of `internet`, without the MODE override, the connection is closed straight away."""
     try:
-        socket.setdefaulttimeout(timeout)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-        print("I'm online!")
-        return True
-    except socket.error:
-        print("I'm offline!")
-        # print(ex)
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
         return False
+    writer.close()
+    with contextlib.suppress(OSError):
+        await writer.wait_closed()
+    return True